@@ -11,10 +11,16 @@
 # MIT open-source license.
 # (See https://github.com/ron-rivest/split-value-voting.git)
 
+import time
+import_start_time = time.perf_counter()
+
 import base64
 import hmac
 import hashlib
+import json
+import os
 import sys
+import threading
 
 ##############################################################################
 # Security parameters (key lengths)
@@ -36,15 +42,113 @@ assert SECPARAM_HASH_OUTPUT % 8 == 0
 assert SECPARAM_RAND_SEED == SECPARAM_HASH_OUTPUT
 
 ##############################################################################
-# HASH FUNCTION (SHA256)
+# COUNTS OF BASIC OPERATIONS
 ##############################################################################
 
+# When enabled (see sv_stats.py), calls of some basic operations are
+# counted in op_counts: "secure_hash", "random" (draws from randomness
+# sources), "com" (commitments), "share" (secrets shared) and "lagrange"
+# (secrets reconstructed).  When disabled, the cost is one dict lookup.
+# Counts may be made from several threads at once; op_counts_lock
+# serializes updates (read the counts with get_op_counts).
+count_parameters = {'enabled': False}
+op_counts = dict()
+op_counts_lock = threading.Lock()
+
+def set_op_counting(new_value):
+    """ Enable (True) or disable (False) counting; reset the counts. """
+    with op_counts_lock:
+        count_parameters['enabled'] = bool(new_value)
+        op_counts.clear()
+
+def count_op(name, n=1):
+    """ Count n calls of operation name. """
+    with op_counts_lock:
+        op_counts[name] = op_counts.get(name, 0) + n
+
+def get_op_counts():
+    """ Return copy of the counts so far (a dict). """
+    with op_counts_lock:
+        return dict(op_counts)
+
+##############################################################################
+# HASH FUNCTION (SHA256, or BLAKE2)
+##############################################################################
+
+# Hash suites.  A hash suite gives the hash function used by secure_hash
+# (and so for pseudo-random generation), how a hash is tweaked, the keyed
+# hash used for commitments (see com_raw), and the hash (a hashlib name)
+# used by hashlib.pbkdf2_hmac; the hash and the tweak are also used for
+# hashing the SBB and stretching that hash (see stretched_hash).
+#   "sha256":  (the original, and default, suite)
+#              SHA256; tweak by hashing tweak + hex of hash;
+#              commitments are HMAC-SHA256
+#   "blake2b": BLAKE2b (SECPARAM_HASH_OUTPUT bits of output);
+#              tweak by keying BLAKE2b with the tweak (see blake2_tweak);
+#              commitments are BLAKE2b keyed with the randomness
+#   "blake2s": as for "blake2b", but with BLAKE2s
+# BLAKE2 is noticeably faster than SHA256 in CPython on short inputs.
+# The suite used is posted on the SBB (in setup:start).
+HASH_OUTPUT_BYTES = SECPARAM_HASH_OUTPUT // 8
+
+def blake2_tweak(blake2, tweak, x):
+    """ Return hash of x with blake2 (hashlib.blake2b or hashlib.blake2s)
+    keyed with tweak (a string).
+
+    A tweak longer (in utf-8) than the maximum key length of blake2 is
+    first hashed (with personalization "tweak") to give the key.
+    """
+    key = tweak.encode()
+    if len(key) > blake2.MAX_KEY_SIZE:
+        key = blake2(key, digest_size=blake2.MAX_KEY_SIZE,
+                     person=b"tweak").digest()
+    return blake2(x, digest_size=HASH_OUTPUT_BYTES, key=key).digest()
+
+HASH_SUITES = \
+    {"sha256":
+         {"hash": lambda x: hashlib.sha256(x).digest(),
+          "tweak": lambda tweak, x: \
+              hashlib.sha256((tweak + x.hex()).encode()).digest(),
+          "commit": lambda r, v: hmac.digest(r, v, 'sha256'),
+          "pbkdf2_hash": "sha256"},
+     "blake2b":
+         {"hash": lambda x: \
+              hashlib.blake2b(x, digest_size=HASH_OUTPUT_BYTES).digest(),
+          "tweak": lambda tweak, x: blake2_tweak(hashlib.blake2b, tweak, x),
+          "commit": lambda r, v: \
+              hashlib.blake2b(v, digest_size=HASH_OUTPUT_BYTES,
+                              key=r).digest(),
+          "pbkdf2_hash": "blake2b"},
+     "blake2s":
+         {"hash": lambda x: \
+              hashlib.blake2s(x, digest_size=HASH_OUTPUT_BYTES).digest(),
+          "tweak": lambda tweak, x: blake2_tweak(hashlib.blake2s, tweak, x),
+          "commit": lambda r, v: \
+              hashlib.blake2s(v, digest_size=HASH_OUTPUT_BYTES,
+                              key=r).digest(),
+          "pbkdf2_hash": "blake2s"}
+    }
+# sha256 output must match security parameters
+assert SECPARAM_HASH_OUTPUT == 256
+
+hash_suite = dict()             # the hash suite in use (and its 'name')
+
+def set_hash_suite(name):
+    """ Use the hash suite with given name (a key of HASH_SUITES). """
+    assert name in HASH_SUITES
+    hash_suite.clear()
+    hash_suite.update(HASH_SUITES[name])
+    hash_suite['name'] = name
+
+set_hash_suite("sha256")
+
 HASH_ITERATE_COUNT = 1000000   # number of extra iterations when requested
                                # takes an extra second or two...
 
 def secure_hash(x, tweak="", iterate=False):
-    """ Return SHA256 hash of (tweaked) x, as bytes value of length 32.
+    """ Return hash of (tweaked) x, as bytes value of length 32.
     Input x to be hashed may be of type string or of type bytes.
+    The hash function is that of the hash suite in use (SHA256 by default).
 
     (Note that python already has a "hash" function, which is not
     cryptographic, but used for dictionaries. This is different.)
@@ -56,10 +160,10 @@ def secure_hash(x, tweak="", iterate=False):
     If the input "iterate" is True, then the hash function will
     iterate on the output an extra HASH_ITERATE_COUNT number of times.
     This gives a slowerversion of the hash function, to slow down an
-    adversarial attack.  See sv_verifier.py (hash_sbb) for an example use.
+    adversarial attack.  (See also stretched_hash.)
 
     Note: this is not the only place where dependency on choice
-    of hash function is evidenced; also see commitment use of hmac.
+    of hash function is evidenced; also see commitments (com_raw).
     Our hash function is consistent with the above security parameters.
     """
     if isinstance(x, str):
@@ -67,15 +171,113 @@ def secure_hash(x, tweak="", iterate=False):
     assert isinstance(x, (bytes, bytearray))
     assert isinstance(tweak, str)
     assert HASH_ITERATE_COUNT > 0
+    if count_parameters['enabled']:
+        count_op("secure_hash")
     extra_iterations = 0
     if iterate:
         extra_iterations = HASH_ITERATE_COUNT
+    h = hash_suite['hash']
     for _ in range(1+extra_iterations):
-        x = hashlib.sha256(x).digest()
+        x = h(x)
     if tweak:
-        x = hashlib.sha256((tweak + bytes2hex(x)).encode()).digest()
+        x = hash_suite['tweak'](tweak, x)
     return x
 
+def test_hash_suites():
+    """ Test secure_hash and com_raw with each hash suite. """
+    r = bytes(range(32))
+    for name in HASH_SUITES:
+        set_hash_suite(name)
+        for x in [b"", b"abc", bytes(100)]:
+            assert len(secure_hash(x)) == HASH_OUTPUT_BYTES
+            assert secure_hash(x) != secure_hash(x, "tweak")
+            assert len(com_raw(x, r)) == HASH_OUTPUT_BYTES
+    set_hash_suite("blake2b")
+    assert secure_hash(b"abc", "t") == \
+        hashlib.blake2b(hashlib.blake2b(b"abc", digest_size=32).digest(),
+                        digest_size=32, key=b"t").digest()
+    for name in ("blake2b", "blake2s"):
+        # tweaks longer than a BLAKE2 key are hashed to give the key
+        set_hash_suite(name)
+        assert secure_hash(b"abc", "t" * 100) != secure_hash(b"abc", "t" * 99)
+    set_hash_suite("sha256")
+    assert secure_hash(b"abc") == hashlib.sha256(b"abc").digest()
+    assert com_raw(b"abc", r) == hmac.new(r, b"abc", hashlib.sha256).digest()
+
+# Versioned algorithms for "stretched" (deliberately slow) hashing, as used
+# to derive the verifier challenges from the SBB (Fiat-Shamir style).
+# Each is named by an algorithm id, and has a work factor (iteration
+# count); both are posted on the SBB along with the challenges.
+# There are two methods, each usable with the hash of any hash suite;
+# the algorithm id names the method and the hash (see stretch_algorithm):
+#   "iterate": legacy; as secure_hash(x, tweak, iterate=True): the hash
+#              iterated (1+work) times in a python loop.  With the
+#              default suite, this is "sha256-iterate".
+#   "pbkdf2":  the hash of x, then work iterations of HMAC with the
+#              hash, done inside hashlib.pbkdf2_hmac (at C speed), so
+#              honest parties don't pay interpreter overhead that an
+#              adversary with native code wouldn't pay.  With the
+#              default suite, this is "pbkdf2-sha256".
+STRETCH_METHODS = ("iterate", "pbkdf2")
+
+def stretch_algorithm(method, suite_name):
+    """ Return algorithm id for stretching with method (one of
+    STRETCH_METHODS) and the hash of hash suite suite_name.
+    """
+    assert method in STRETCH_METHODS
+    assert suite_name in HASH_SUITES
+    if method == "iterate":
+        return suite_name + "-iterate"
+    return "pbkdf2-" + suite_name
+
+# maps algorithm id to (method, name of hash suite)
+STRETCH_ALGORITHMS = dict([(stretch_algorithm(method, suite_name),
+                            (method, suite_name))
+                           for suite_name in HASH_SUITES
+                           for method in STRETCH_METHODS])
+
+def stretch_method(name):
+    """ Return stretch method named by name: a method, or (as in older
+    election parameter files) an algorithm id, of which only the method
+    is used.
+    """
+    if name in STRETCH_ALGORITHMS:
+        return STRETCH_ALGORITHMS[name][0]
+    assert name in STRETCH_METHODS, "unknown stretch: " + str(name)
+    return name
+LEGACY_STRETCH = {"algorithm": "sha256-iterate", "work": HASH_ITERATE_COUNT}
+
+def stretched_hash(x, tweak, stretch):
+    """ Return stretched hash of (tweaked) x, as bytes value of length 32.
+
+    Here stretch is a dict {"algorithm": ..., "work": ...}, where the
+    algorithm is one of STRETCH_ALGORITHMS, for the hash suite in use,
+    and work is its iteration count.
+    """
+    if isinstance(x, str):
+        x = x.encode()
+    assert isinstance(x, (bytes, bytearray))
+    assert isinstance(tweak, str)
+    algorithm = stretch["algorithm"]
+    work = stretch["work"]
+    assert algorithm in STRETCH_ALGORITHMS
+    (method, suite_name) = STRETCH_ALGORITHMS[algorithm]
+    assert suite_name == hash_suite['name'], \
+        "stretch algorithm " + algorithm + " is not for hash suite " + \
+        hash_suite['name']
+    assert isinstance(work, int) and work > 0
+    h = hash_suite['hash']
+    if method == "iterate":
+        for _ in range(1+work):
+            x = h(x)
+        if tweak:
+            x = hash_suite['tweak'](tweak, x)
+        return x
+    x = h(x)
+    return hashlib.pbkdf2_hmac(hash_suite['pbkdf2_hash'], x,
+                               ("stretch:" + tweak).encode(), work,
+                               HASH_OUTPUT_BYTES)
+
 
 ##############################################################################
 # UTILITY FUNCTIONS
@@ -87,12 +289,7 @@ def bytes2hex(x):
     Could also use binascii.hexlify(x)
     """
     assert isinstance(x, (bytes, bytearray))
-    ans = []
-    hexdigits = "0123456789abcdef"
-    for c in x:
-        ans.append(hexdigits[c >> 4])
-        ans.append(hexdigits[c & 0xf])
-    return "".join(ans)
+    return x.hex()
 
 def hex2bytes(s):
     """ Return bytes representation of hex string s. """
@@ -106,10 +303,7 @@ def bytes2int(x):
     First byte in sequence is least-significant byte.
     """
     assert isinstance(x, (bytes, bytearray))
-    ans = 0
-    for i in range(len(x)-1, -1, -1):
-        ans = 256*ans + x[i]
-    return ans
+    return int.from_bytes(x, 'little')
 
 def int2bytes(x, desired_length=None):
     """ Return bytes representation of integer x >= 0 of desired length.
@@ -121,19 +315,11 @@ def int2bytes(x, desired_length=None):
     assert not desired_length or \
         (isinstance(desired_length, int) and desired_length > 0)
 
-    byte_list = []
     if not desired_length:
-        if x == 0:
-            return b"\x00"
-        while x > 0:
-            byte_list.append(x % 256)
-            x = x // 256
-    else:
-        while len(byte_list) < desired_length:
-            byte_list.append(x % 256)
-            x = x // 256
-    assert not desired_length or len(byte_list) == desired_length
-    return bytes(byte_list)
+        desired_length = max(1, (x.bit_length() + 7) // 8)
+    # (high-order bytes that don't fit in desired_length are dropped)
+    x = x % (256 ** desired_length)
+    return x.to_bytes(desired_length, 'little')
 
 def bytes2base64(x):
     """ Convert bytes value x to base64 representation as a string. """
@@ -143,16 +329,45 @@ def base64_2_bytes(x):
     """ Convert string base64 value x to bytes. """
     return base64.b64decode(x)
 
+def test_stretched_hash():
+    """ Test stretched_hash against secure_hash and hashlib. """
+    assert stretched_hash("abc", "t", LEGACY_STRETCH) == \
+        secure_hash("abc", "t", iterate=True)
+    stretch = {"algorithm": "pbkdf2-sha256", "work": 1000}
+    assert stretched_hash("abc", "t", stretch) == \
+        hashlib.pbkdf2_hmac('sha256', hashlib.sha256(b"abc").digest(),
+                            b"stretch:t", 1000)
+    # other hash suites stretch with their own hash, named in the id
+    set_hash_suite("blake2s")
+    x = b"abc"
+    for _ in range(11):
+        x = hashlib.blake2s(x).digest()
+    assert stretched_hash("abc", "t", {"algorithm": "blake2s-iterate",
+                                       "work": 10}) == \
+        hashlib.blake2s(x, key=b"t").digest()
+    assert stretched_hash("abc", "t", {"algorithm": "pbkdf2-blake2s",
+                                       "work": 1000}) == \
+        hashlib.pbkdf2_hmac('blake2s', secure_hash(b"abc"),
+                            b"stretch:t", 1000)
+    # an id for another hash suite is refused
+    try:
+        stretched_hash("abc", "t", stretch)
+        assert False, "pbkdf2-sha256 accepted with blake2s"
+    except AssertionError as error:
+        assert "not for hash suite" in str(error)
+    set_hash_suite("sha256")
+
 def test_conversions():
     """ Test the above data-type conversion routines. """
     assert bytes2hex(b"abc") == '616263'
     assert bytes2int(bytes([1, 2])) == 513
     assert bytes2int(int2bytes(134827781332)) == 134827781332
+    assert int2bytes(0) == b"\x00"
+    assert int2bytes(513, 3) == bytes([1, 2, 0])
+    assert int2bytes(513, 1) == bytes([1])
     x = b"012345abcde"
     assert base64_2_bytes(bytes2base64(x)) == x
 
-test_conversions()
-
 ##############################################################################
 # RANDOMNESS
 ##############################################################################
@@ -192,6 +407,8 @@ def get_random_from_source(rand_name, modulus=None):
     """
     assert rand_name in randomness_sources
     assert not modulus or (isinstance(modulus, int) and modulus > 0)
+    if count_parameters['enabled']:
+        count_op("random")
     new_seed = secure_hash(randomness_sources[rand_name])
     randomness_sources[rand_name] = new_seed
     # use tweaked hash in the following line, so that
@@ -219,8 +436,6 @@ def test_random():
     # print(ans)
     assert ans == 74
 
-test_random()
-
 ##############################################################################
 # GENERATE A RANDOM PERMUTATION
 ##############################################################################
@@ -285,7 +500,23 @@ def test_random_permutation():
     perm2 = random_permutation(list(range(100)), "test_random_permutation")
     assert perm1 != perm2     # could happen, but with negligible probability
 
-test_random_permutation()
+def restrict_permutation(pi, n):
+    """ Return permutation of range(n) induced by permutation pi of range(N).
+
+    Here pi is a list giving a permutation of range(N), where N >= n.
+    The result (also a list) has the elements of pi less than n, in the
+    same order as in pi; if pi is uniformly random, then so is the result.
+    (This allows permutations to be made before the number of items to be
+    permuted is known, given an upper bound N on that number.)
+    """
+    assert 0 <= n <= len(pi)
+    return [x for x in pi if x < n]
+
+def test_restrict_permutation():
+    """ Test restrict_permutation. """
+    assert restrict_permutation([3, 0, 4, 2, 1], 5) == [3, 0, 4, 2, 1]
+    assert restrict_permutation([3, 0, 4, 2, 1], 3) == [0, 2, 1]
+    assert restrict_permutation([3, 0, 4, 2, 1], 0) == []
 
 ##############################################################################
 # PRIMALITY TESTING
@@ -294,6 +525,11 @@ test_random_permutation()
 small_primes = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47, 53, \
                 59, 61, 67, 71, 73, 79, 83, 89, 97, 101]
 
+# Miller-Rabin with these bases is deterministic (never wrong)
+# for n < DETERMINISTIC_MR_LIMIT (which exceeds 2**64)
+DETERMINISTIC_MR_BASES = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37]
+DETERMINISTIC_MR_LIMIT = 318665857834031151167461
+
 def is_prime(n):
     """ Return True if n is prime (probabilistic for large n) """
     assert isinstance(n, int)
@@ -304,6 +540,11 @@ def is_prime(n):
     for p in small_primes:
         if n % p == 0:
             return False
+    if n < DETERMINISTIC_MR_LIMIT:
+        for a in DETERMINISTIC_MR_BASES:
+            if witness(a, n):
+                return False
+        return True
     return miller_rabin(n, 20)
 
 def miller_rabin(n, s):
@@ -344,19 +585,49 @@ def test_is_prime():
             prime_count += 1
     assert 1229 == prime_count
 
-test_is_prime()
+SIEVE_LIMIT = 2000              # sieve out candidates with factors < this
+SIEVE_WINDOW = 1024             # number of candidates sieved at a time
+
+def primes_below(limit):
+    """ Return list of all primes less than limit (sieve of Eratosthenes). """
+    sieve = bytearray([1]) * limit
+    sieve[:2] = bytes(min(2, limit))
+    for p in range(2, int(limit**0.5) + 1):
+        if sieve[p]:
+            sieve[p*p::p] = bytes(len(range(p*p, limit, p)))
+    return [p for p in range(limit) if sieve[p]]
+
+sieve_primes = primes_below(SIEVE_LIMIT)
+
+def sieve_candidates(start, count):
+    """ Return list of the integers in range(start, start+count) that
+    have no factor in sieve_primes (other than themselves), in increasing
+    order.  These are the only values in that range that may be prime.
+    """
+    assert isinstance(start, int) and isinstance(count, int) and count > 0
+    flags = bytearray([1]) * count
+    for p in sieve_primes:
+        # first multiple of p in range (but not p itself)
+        first = max(p*p, ((start + p - 1) // p) * p)
+        if first < start + count:
+            flags[first-start::p] = bytes(len(range(first-start, count, p)))
+    return [start+i for i in range(count) if flags[i] and start+i >= 2]
 
 def next_prime(n):
-    """ Return the smallest integer greater than n that is prime. """
+    """ Return the smallest integer greater than n that is prime.
+
+    Candidates are sieved SIEVE_WINDOW at a time, so is_prime is only
+    called on candidates without small factors.
+    """
     assert isinstance(n, int)
     n = n + 1
     if n <= 2:
         return 2
-    if n % 2 == 0:
-        n = n + 1
-    while not is_prime(n):
-        n = n + 2
-    return n
+    while True:
+        for candidate in sieve_candidates(n, SIEVE_WINDOW):
+            if is_prime(candidate):
+                return candidate
+        n = n + SIEVE_WINDOW
 
 def test_next_prime():
     """ Test next_prime routine on a few examples. """
@@ -370,8 +641,6 @@ def test_next_prime():
     assert 10**6 + 3 == next_prime(10**6)
     assert 2**256 + 297 == next_prime(2**256)
 
-test_next_prime()
-
 def prev_prime(n):
     """ Return the largest integer less than n that is prime.
 
@@ -400,14 +669,143 @@ def test_prev_prime():
     assert 2**256 - 189 == prev_prime(2**256)
     assert 256**48 - 317 == prev_prime(256**48)
 
-test_prev_prime()
+# Race moduli are make_prime(256**L), for L = maximum length of a choice
+# (in bytes).  These are precomputed here: for L in PRIME_TABLE,
+#     make_prime(256**L) == 256**L + PRIME_TABLE[L]
+PRIME_TABLE = {1: 1, 2: 1, 3: 43, 4: 15, 5: 15, 6: 21, 7: 81, 8: 13, 9: 15,
+               10: 13, 11: 7, 12: 61, 13: 111, 14: 25, 15: 451, 16: 51,
+               17: 85, 18: 175, 19: 253, 20: 7, 21: 87, 22: 427, 23: 27,
+               24: 133, 25: 235, 26: 375, 27: 423, 28: 735, 29: 357, 30: 115,
+               31: 81, 32: 297, 33: 175, 34: 57, 35: 45, 36: 127, 37: 61,
+               38: 37, 39: 91, 40: 27, 41: 15, 42: 241, 43: 231, 44: 55,
+               45: 105, 46: 127, 47: 115, 48: 231, 49: 207, 50: 181, 51: 37,
+               52: 235, 53: 163, 54: 1093, 55: 187, 56: 211, 57: 21, 58: 841,
+               59: 445, 60: 165, 61: 777, 62: 583, 63: 133, 64: 75}
+
+# Other large primes found by make_prime are kept in prime_cache, which is
+# also saved on disk (in the file prime_cache_parameters['filename'], if
+# that is not None) for use by later runs and by other processes.
+# Only values n >= PRIME_CACHE_MIN are saved on disk.
+prime_cache = dict()            # maps n to make_prime(n)
+PRIME_CACHE_MIN = 2**64
+prime_cache_parameters = \
+    {'filename': os.environ.get("SV_PRIME_CACHE",
+                                os.path.join(os.path.expanduser("~"),
+                                             ".cache",
+                                             "sv_prime_cache.json")),
+     'loaded': False}
+
+def set_prime_cache_filename(filename):
+    """ Set file used to save prime cache on disk (None for no file). """
+    assert filename is None or isinstance(filename, str)
+    prime_cache_parameters['filename'] = filename
+    prime_cache_parameters['loaded'] = False
+
+def read_prime_cache_file():
+    """ Return dict read from prime cache file (empty dict if none). """
+    filename = prime_cache_parameters['filename']
+    if filename is None:
+        return dict()
+    try:
+        with open(filename, "r") as fp:
+            offsets = json.load(fp)
+    except (OSError, ValueError):
+        return dict()
+    if not isinstance(offsets, dict):
+        return dict()
+    # file maps str(n) to make_prime(n) - n; the file is not trusted, so
+    # entries not giving a prime p >= n are dropped
+    cache = dict()
+    for n_str in offsets:
+        try:
+            n = int(n_str)
+            p = n + offsets[n_str]
+        except (TypeError, KeyError, ValueError):
+            continue
+        if isinstance(p, int) and p >= n and is_prime(p):
+            cache[n] = p
+    return cache
+
+def write_prime_cache_file():
+    """ Save (large values in) prime_cache to prime cache file, if any.
+
+    The file is merged with (not overwritten by) our cache, and replaced
+    atomically, since other processes may be using it too.
+    """
+    filename = prime_cache_parameters['filename']
+    if filename is None:
+        return
+    cache = read_prime_cache_file()
+    cache.update(prime_cache)
+    offsets = dict([(str(n), cache[n] - n) for n in cache
+                    if n >= PRIME_CACHE_MIN])
+    temp_filename = filename + ".%d.tmp" % os.getpid()
+    try:
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        with open(temp_filename, "w") as fp:
+            json.dump(offsets, fp, sort_keys=True)
+        os.replace(temp_filename, filename)
+    except OSError:
+        pass                    # a cache is only a cache
 
 def make_prime(n):
-    """ Return next prime greater than or equal to n. """
+    """ Return next prime greater than or equal to n.
+
+    Look in PRIME_TABLE, then in prime_cache (and the prime cache file),
+    before searching.
+    """
+    assert isinstance(n, int)
+    L = (n.bit_length() - 1) // 8
+    if L in PRIME_TABLE and n == 256**L:
+        return n + PRIME_TABLE[L]
+    if n not in prime_cache and n >= PRIME_CACHE_MIN and \
+       not prime_cache_parameters['loaded']:
+        prime_cache.update(read_prime_cache_file())
+        prime_cache_parameters['loaded'] = True
+    if n in prime_cache:
+        return prime_cache[n]
     if is_prime(n):
-        return n
+        p = n
     else:
-        return next_prime(n)
+        p = next_prime(n)
+    prime_cache[n] = p
+    if n >= PRIME_CACHE_MIN:
+        write_prime_cache_file()
+    return p
+
+def test_make_prime():
+    """ Test PRIME_TABLE, sieving, and deterministic Miller-Rabin. """
+    for L in range(1, 11):
+        assert 256**L + PRIME_TABLE[L] == next_prime(256**L - 1)
+    assert primes_below(100) == small_primes[:-1]
+    assert [c for c in sieve_candidates(2, 100) if is_prime(c)] == \
+        small_primes
+    assert not is_prime(3215031751)   # strong pseudoprime to bases 2,3,5,7
+    assert is_prime(2**61 - 1)
+    assert not is_prime(2**61 + 1)
+    assert make_prime(256) == 257
+    assert make_prime(1000) == 1009
+
+def test_prime_cache_file():
+    """ Test that bad entries of the prime cache file are dropped. """
+    import tempfile             # (only needed here; slow to import)
+    filename_before = prime_cache_parameters['filename']
+    n = 2**64
+    p = next_prime(n)
+    with tempfile.TemporaryDirectory() as dirname:
+        set_prime_cache_filename(os.path.join(dirname, "primes.json"))
+        with open(prime_cache_parameters['filename'], "w") as fp:
+            json.dump({str(n): p - n,              # good
+                       str(n + 1): p - n,          # p+1: not prime
+                       str(n + 2): -2,             # below n
+                       str(n + 3): "junk",
+                       str(n + 4): 1.5,
+                       "junk": 1}, fp)
+        assert read_prime_cache_file() == {n: p}
+        with open(prime_cache_parameters['filename'], "w") as fp:
+            json.dump([1, 2], fp)
+        assert read_prime_cache_file() == dict()
+    set_prime_cache_filename(filename_before)
 
 ##############################################################################
 # SPLIT-VALUE REPRESENTATIONS (modulo M)
@@ -437,8 +835,6 @@ def test_sv_pair():
         [[0, (75, 26)], [1, (13, 89)], [5, (53, 53)], [23, (34, 90)], 
          [79, (51, 28)], [88, (89, 100)]]
 
-test_sv_pair()
-
 ##############################################################################
 # POLYNOMIAL SECRET SHARING (modulo M)
 ##############################################################################
@@ -451,12 +847,14 @@ def share(secret, n, t, rand_name, M):
 
     Note that shares are random function (with secret as constant coef)
     evaluated at points x=1, 2, ..., n.  (This fact is used elsewhere,
-    e.g. in sv_voter.cast_votes.)
+    e.g. in sv_voter.cast_choice.)
     """
     assert isinstance(M, int) and M > 1
     assert isinstance(secret, int) and 0 <= secret < M, str(secret)
     assert isinstance(n, int) and 1 < n <= M - 1
     assert isinstance(t, int) and 1 <= t <= n
+    if count_parameters['enabled']:
+        count_op("share")
     coefs = [get_random_from_source(rand_name, M) for i in range(t)]
     coefs[0] = secret
     # print(coefs)
@@ -486,6 +884,8 @@ def lagrange(share_list, n, t, M):
     assert 1 <= t <= n
     assert n <= M - 1
     assert len(share_list) >= t
+    if count_parameters['enabled']:
+        count_op("lagrange")
     if len(share_list) > t:
         share_list = share_list[:t]
     x = [xy[0] for xy in share_list]
@@ -512,8 +912,6 @@ def test_share():
     assert share(3, 5, 3, "test_share", M) == \
         [(1, 4), (2, 10), (3, 10), (4, 4), (5, 3)]
 
-test_share()
-
 def test_lagrange():
     """ Test lagrange on a simple example. """
     n = 5
@@ -527,7 +925,182 @@ def test_lagrange():
     share_list.reverse()
     assert secret == lagrange(share_list, n, t, M)
 
-test_lagrange()
+##############################################################################
+# VECTOR ARITHMETIC (modulo M), WITH A SMALL-MODULUS FAST PATH
+##############################################################################
+# Most races are short referendums, whose race_modulus is small (for
+# example ("yes", "no") gives a prime just above 256**3).  For moduli
+# below SMALL_MODULUS_LIMIT the product of two residues fits in a signed
+# 64-bit word, so the routines below then work on int64 numpy arrays
+# (if numpy is available).  Results are always returned as lists of
+# python ints, and are identical to those of the big-int path.  Inputs
+# that are not all ints in [0, M) (which could overflow, or be reduced
+# differently) are handed to the big-int path (see residue_array).
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+SMALL_MODULUS_LIMIT = 2**31
+
+small_modulus_parameters = {'enabled': True}
+
+def set_small_modulus_fast_path(new_value):
+    """ Enable (True) or disable (False) the small-modulus fast path. """
+    assert isinstance(new_value, bool)
+    small_modulus_parameters['enabled'] = new_value
+
+def is_small_modulus(M):
+    """ Return True if arithmetic modulo M should use the fast path. """
+    return numpy is not None and \
+        small_modulus_parameters['enabled'] and \
+        M < SMALL_MODULUS_LIMIT
+
+def residue_array(xs, M):
+    """ Return list xs (of ints) as an int64 numpy array, if its values
+    are all in [0, M); otherwise return None.
+    """
+    try:
+        xa = numpy.fromiter(xs, dtype=numpy.int64, count=len(xs))
+    except (OverflowError, TypeError, ValueError):
+        return None
+    if len(xs) > 0 and (xa.min() < 0 or xa.max() >= M):
+        return None
+    return xa
+
+def add_mod(xs, ys, M):
+    """ Return list of (xs[i] + ys[i]) % M, for lists xs and ys. """
+    assert len(xs) == len(ys)
+    if is_small_modulus(M):
+        xa = residue_array(xs, M)
+        ya = residue_array(ys, M)
+        if xa is not None and ya is not None:
+            return ((xa + ya) % M).tolist()
+    return [(x + y) % M for x, y in zip(xs, ys)]
+
+def sub_mod(xs, ys, M):
+    """ Return list of (xs[i] - ys[i]) % M, for lists xs and ys. """
+    assert len(xs) == len(ys)
+    if is_small_modulus(M):
+        xa = residue_array(xs, M)
+        ya = residue_array(ys, M)
+        if xa is not None and ya is not None:
+            return ((xa - ya) % M).tolist()
+    return [(x - y) % M for x, y in zip(xs, ys)]
+
+def share_many(secrets, n, t, rand_name, M):
+    """
+    Share each secret in list secrets, as share() would, but all at once.
+
+    Return list of n lists; list r gives the shares at x = r+1 (i.e. the
+    shares for row r), one per secret.  Random values are drawn from
+    rand_name in the same order as successive calls to share() would
+    draw them, so the results are identical to those of share().
+    """
+    assert isinstance(M, int) and M > 1
+    assert isinstance(n, int) and 1 < n <= M - 1
+    assert isinstance(t, int) and 1 <= t <= n
+    coef_lists = []
+    if count_parameters['enabled']:
+        count_op("share", len(secrets))
+    for secret in secrets:
+        assert isinstance(secret, int) and 0 <= secret < M, str(secret)
+        coefs = [get_random_from_source(rand_name, M) for i in range(t)]
+        coefs[0] = secret
+        coef_lists.append(coefs)
+    if is_small_modulus(M) and len(secrets) > 0:
+        coef_array = numpy.array(coef_lists, dtype=numpy.int64)
+        rows = []
+        for x in range(1, n+1):
+            y = numpy.zeros(len(secrets), dtype=numpy.int64)
+            for j in range(t-1, -1, -1):
+                y = (y * x + coef_array[:, j]) % M
+            rows.append(y.tolist())
+    else:
+        rows = []
+        for x in range(1, n+1):
+            row = []
+            for coefs in coef_lists:
+                y = 0
+                for j in range(t-1, -1, -1):
+                    y = ((y * x) + coefs[j]) % M
+                row.append(y)
+            rows.append(row)
+    # test output for reconstructibility
+    assert list(secrets) == lagrange_many(rows, n, t, M)
+    return rows
+
+def lagrange_coefficients(x_list, M):
+    """ Return list of LaGrange coefficients for points x_list, modulo M.
+
+    The secret is sum(c[i] * y[i]) % M, where c is the returned list,
+    and y[i] is the share at point x_list[i].
+    """
+    coefs = []
+    for i, xi in enumerate(x_list):
+        numerator = 1
+        denominator = 1
+        for j, xj in enumerate(x_list):
+            if j != i:
+                numerator = (numerator * (-xj)) % M
+                denominator = (denominator * (xi - xj)) % M
+        assert denominator != 0
+        coefs.append((numerator * pow(denominator, M-2, M)) % M)
+    return coefs
+
+def lagrange_many(y_lists, n, t, M):
+    """ Return list of secrets, given enough rows of shares.
+
+    Here y_lists[r] is a list of shares at point x = r+1 (one share per
+    secret), as produced by share_many.  Only the first t rows are used.
+    """
+    assert isinstance(n, int)
+    assert isinstance(t, int)
+    assert isinstance(M, int)
+    assert 1 <= t <= n
+    assert n <= M - 1
+    assert len(y_lists) >= t
+    coefs = lagrange_coefficients(list(range(1, t+1)), M)
+    if count_parameters['enabled']:
+        count_op("lagrange", len(y_lists[0]))
+    if is_small_modulus(M):
+        y_arrays = [residue_array(ys, M) for ys in y_lists[:t]]
+        if all([ya is not None for ya in y_arrays]):
+            secrets = numpy.zeros(len(y_lists[0]), dtype=numpy.int64)
+            for c, ya in zip(coefs, y_arrays):
+                secrets = (secrets + c * ya) % M
+            return secrets.tolist()
+    secrets = [0] * len(y_lists[0])
+    for c, ys in zip(coefs, y_lists[:t]):
+        secrets = [(s + c * y) % M for s, y in zip(secrets, ys)]
+    return secrets
+
+def test_share_many():
+    """ Test share_many and lagrange_many against share and lagrange. """
+    enabled_before = small_modulus_parameters['enabled']
+    for M in [11, 2**31 - 1, 2**61 - 1]:
+        for enabled in [True, False]:
+            set_small_modulus_fast_path(enabled)
+            init_randomness_source("test_share_many")
+            secrets = [0, 1, 5, 7, 3]
+            rows = share_many(secrets, 5, 3, "test_share_many", M)
+            init_randomness_source("test_share_many")
+            for s, secret in enumerate(secrets):
+                share_list = share(secret, 5, 3, "test_share_many", M)
+                assert [y for (x, y) in share_list] == \
+                    [rows[r][s] for r in range(5)]
+            assert add_mod(rows[0], rows[1], M) == \
+                [(a + b) % M for a, b in zip(rows[0], rows[1])]
+            assert sub_mod(rows[0], rows[1], M) == \
+                [(a - b) % M for a, b in zip(rows[0], rows[1])]
+            # values outside [0, M) give the same results on both paths
+            ys = [-1, M, 2**45 + 5, 2**70]
+            assert lagrange_many([[3] * 4, ys], 3, 2, M) == \
+                [(2 * 3 - y) % M for y in ys]
+            assert add_mod(ys, ys, M) == [(2 * y) % M for y in ys]
+            assert sub_mod(ys, [1] * 4, M) == [(y - 1) % M for y in ys]
+    set_small_modulus_fast_path(enabled_before)
 
 ##############################################################################
 # SYMMETRIC ENCRYPTION
@@ -587,8 +1160,6 @@ def test_sym_enc():
     msg2 = sym_dec(sym_key, ct)
     assert msg == msg2
 
-test_sym_enc()
-
 ##############################################################################
 # PUBLIC-KEY ENCRYPTION
 ##############################################################################
@@ -625,12 +1196,50 @@ def test_pk_enc():
     msg2 = pk_dec(pk, sk, ct)
     assert msg == msg2
 
-test_pk_enc()
-
 ##############################################################################
 # BASIC COMMITMENT FUNCTION com
 ##############################################################################
 
+def com_value2bytes(v):
+    """ Return value v to be committed to (str, int, or bytes) as bytes. """
+    # make sure v has type bytes (by converting from string to bytes if nec.)
+    if isinstance(v, int):
+        # (as int2bytes(v), without its checks)
+        return v.to_bytes(max(1, (v.bit_length() + 7) // 8), 'little')
+    if isinstance(v, str):
+        return v.encode()
+    assert isinstance(v, (bytes, bytearray)),\
+        "com error: value v must be of type str, int, bytes, or bytearray."
+    return v
+
+def com_raw(v_bytes, r_bytes):
+    """ Produce a commitment to v_bytes using randomness r_bytes.
+
+    Here v_bytes = the value being committed to (of type bytes)
+         r_bytes = a randomness parameter (or key) of type bytes,
+                   of length SECPARAM_SYMMETRIC // 8
+    The output produced is the commitment, of type bytes, of length
+    SECPARAM_HASH_OUTPUT // 8.  (com gives it in base64 instead.)
+    """
+    # keyed hash of hash suite in use (HMAC-SHA256 by default)
+    if count_parameters['enabled']:
+        count_op("com")
+    return hash_suite['commit'](r_bytes, v_bytes)
+
+def com_batch(values, r_list):
+    """ Return list of commitments (of type bytes) to given values.
+
+    Here values is a list of values (each str, int, or bytes) and
+    r_list is an equally long list of randomness parameters (each bytes);
+    value values[i] is committed to using r_list[i], as com_raw would do.
+    """
+    assert len(values) == len(r_list)
+    commit = hash_suite['commit']
+    if count_parameters['enabled']:
+        count_op("com", len(values))
+    return [commit(r, com_value2bytes(v))
+            for v, r in zip(values, r_list)]
+
 def com(v, r_b64):
     """ Produce a commitment to v using randomness r.
 
@@ -643,35 +1252,67 @@ def com(v, r_b64):
     The output produced is of type string giving the commitment in
     base64 (for ease of output) of length
     SECPARAM_HASH_OUTPUT // 6 + 2 (bytes) (approximately).
+
+    (In loops over many values, use com_raw or com_batch, which work on
+    bytes, and convert to base64 only when posting results.)
     """
-    # make sure v has type bytes (by converting from string to bytes if nec.)
-    if isinstance(v, str):
-        v = v.encode()
-    if isinstance(v, int):
-        v = int2bytes(v)
-    assert isinstance(v, (bytes, bytearray)),\
-        "com error: value v must be of type str, int, bytes, or bytearray."
+    v = com_value2bytes(v)
     # check that r_b64 is of right type (str) and length
     assert isinstance(r_b64, str)
     assert len(r_b64) == (SECPARAM_SYMMETRIC // 6) + 2,\
        "com error: value r_b64 must be SECPARAM_SYMMETRIC//6+2 b64 digits."
     # return commitment (of length SECPARAM_HASH_OUTPUT bits)
-    # note that if you change SECPARAM_HASH_OUTPUT to something other
-    # than 256, then the choice of hash function has to be changed here.
-    # (We can't just use "hash" here, as it isn't compatible with hmac.)
-    assert SECPARAM_HASH_OUTPUT == 256
-    h = hashlib.sha256
     r_bytes = base64_2_bytes(r_b64)
-    return bytes2base64(hmac.HMAC(r_bytes, v, h).digest())
+    return bytes2base64(com_raw(v, r_bytes))
 
 def test_com():
-    """ Test commitment function com. """
+    """ Test commitment functions com, com_raw, and com_batch. """
     r = 'aaaabbbbccccddddeeeeffffgggghhhhiiiijjjjkkkk'
     # print(com("abc",r))
     assert com("abc", r) == \
         "jolywuOC0afkCY/rmY3YITd08E+79sB+ZFXFpRUYuFU="
+    r_bytes = base64_2_bytes(r)
+    assert bytes2base64(com_raw(b"abc", r_bytes)) == com("abc", r)
+    values = [0, 1, 513, 2**128 + 5, "abc", b"abc"]
+    coms = com_batch(values, [r_bytes] * len(values))
+    assert [bytes2base64(c) for c in coms] == [com(v, r) for v in values]
+
+##############################################################################
+# RANDOMIZERS FOR COMMITMENTS, DERIVED FROM A SECRET SEED
+##############################################################################
+
+# Rather than store a randomizer (ru or rv) for every commitment it makes,
+# a server keeps one secret seed (per race, row, and copy) and derives
+# each randomizer from the seed, the position (p0, p1, ...) and the field
+# ("ru" or "rv") when needed; only randomizers of commitments that are
+# opened ever appear on the SBB.  A voter likewise derives the randomizers
+# for the commitments to a share of her vote from a fresh seed, which
+# she sends (instead of the two randomizers) with the share.
 
-test_com()
+def derive_randomizer(seed, p, field):
+    """ Return randomizer (bytes) for commitment to field of position p.
+
+    Here seed is a secret (bytes), p is a position identifier such as
+    'p0' and field is "ru" or "rv".  The keyed hash of the hash suite
+    in use is used as a pseudo-random function.
+    """
+    assert isinstance(seed, bytes)
+    assert isinstance(p, str) and field in ("ru", "rv")
+    msg = ("randomizer:" + p + ":" + field).encode()
+    return hash_suite['commit'](seed, msg)[:SECPARAM_SYMMETRIC // 8]
+
+def test_derive_randomizer():
+    """ Test derive_randomizer. """
+    seed = bytes(32)
+    ru = derive_randomizer(seed, "p0", "ru")
+    assert len(ru) == SECPARAM_SYMMETRIC // 8
+    assert ru == derive_randomizer(seed, "p0", "ru")
+    assert ru != derive_randomizer(seed, "p0", "rv")
+    assert ru != derive_randomizer(seed, "p1", "ru")
+    assert ru != derive_randomizer(bytes(31) + b"\x01", "p0", "ru")
+    # derived randomizers work with com
+    c = com("abc", bytes2base64(ru))
+    assert c == bytes2base64(com_raw(b"abc", ru))
 
 ##############################################################################
 # COMMITMENT TO A SPLIT-VALUE PAIR -- comsv
@@ -788,3 +1429,97 @@ def load(filename):
     else:
         print("sv.py: no serializer!")
 
+##############################################################################
+# SELF-TESTS
+##############################################################################
+# The test_* routines above are not run when this module is imported
+# (that made every import, and every worker process, slow).
+# Run them with
+#        python3 -m sv --selftest
+# or by calling selftest() (e.g. from a benchmark harness).
+
+# time (in seconds) this module took to import
+import_seconds = time.perf_counter() - import_start_time
+IMPORT_TIME_BUDGET = 0.5       # seconds
+
+def test_op_counts():
+    """ Test counting of basic operations. """
+    saved_enabled = count_parameters['enabled']
+    saved_counts = dict(op_counts)
+    set_op_counting(True)
+    secure_hash(b"abc")
+    com_raw(b"abc", b"\x00" * 16)
+    assert op_counts["secure_hash"] == 1
+    assert op_counts["com"] == 1
+    # counts made from several threads at once are not lost
+    threads = [threading.Thread(target=lambda: [count_op("random")
+                                                for _ in range(10000)])
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert get_op_counts()["random"] == 40000
+    set_op_counting(False)
+    secure_hash(b"abc")
+    assert op_counts == dict()
+    count_parameters['enabled'] = saved_enabled
+    op_counts.update(saved_counts)
+
+def test_import_time():
+    """ Test that importing this module stayed within IMPORT_TIME_BUDGET. """
+    assert import_seconds <= IMPORT_TIME_BUDGET, \
+        "import of sv took %.3f seconds" % import_seconds
+
+SELFTESTS = [test_import_time,
+             test_stretched_hash,
+             test_conversions,
+             test_random,
+             test_random_permutation,
+             test_restrict_permutation,
+             test_is_prime,
+             test_next_prime,
+             test_prev_prime,
+             test_make_prime,
+             test_prime_cache_file,
+             test_sv_pair,
+             test_share,
+             test_lagrange,
+             test_share_many,
+             test_sym_enc,
+             test_pk_enc,
+             test_com,
+             test_derive_randomizer,
+             test_hash_suites,
+             test_op_counts]
+
+def selftest(verbose=False):
+    """ Run all self-tests; return dict mapping test names to seconds taken.
+
+    Tests are run with the default ("sha256") hash suite.
+    Randomness sources used by the tests are removed afterwards.
+    """
+    saved_sources = dict(randomness_sources)
+    saved_hash_suite_name = hash_suite['name']
+    set_hash_suite("sha256")
+    times = dict()
+    for test in SELFTESTS:
+        start_time = time.perf_counter()
+        test()
+        times[test.__name__] = time.perf_counter() - start_time
+        if verbose:
+            print("%-28s passed (%.3f seconds)" % \
+                  (test.__name__, times[test.__name__]))
+    randomness_sources.clear()
+    randomness_sources.update(saved_sources)
+    set_hash_suite(saved_hash_suite_name)
+    return times
+
+if __name__ == "__main__":
+    if "--selftest" in sys.argv[1:]:
+        print("import of sv took %.3f seconds (budget %.3f)" % \
+              (import_seconds, IMPORT_TIME_BUDGET))
+        selftest(verbose=True)
+        print("all self-tests passed.")
+    else:
+        print("usage: python3 -m sv --selftest")
@@ -0,0 +1,307 @@
+# sv_bench.py
+# python3
+
+""" Benchmark harness for simulated split-value elections.
+
+    Runs an election (Election.run_election) and its verification
+    (sv_verifier.verify) for each point of a grid of election shapes,
+    recording for each point the time of each phase (see sv_stats.py),
+    the size of the SBB, and the peak memory, and writes the results to
+    a json file.  Results may be compared against those of an earlier
+    run (a baseline), flagging regressions.
+
+    Usage:
+        python3 sv_bench.py [--grid NAME] [--output FILE]
+                            [--baseline FILE] [--tolerance T]
+                            [--repeat N] [--memory]
+
+    --grid NAME      grid to run (see BENCH_GRIDS; default "quick")
+    --output FILE    results file (default bench_results.json)
+    --baseline FILE  compare results against those in FILE (an earlier
+                     results file); exit status is 1 if any regression
+    --tolerance T    a time, memory or SBB size is a regression if more
+                     than (1+T) times the baseline (default 0.25); times
+                     must also be more than MIN_REGRESSION_SECONDS more
+    --repeat N       run each point N times, keeping the least time of
+                     each phase (default 1)
+    --memory         also record peak memory of each phase (slow; see
+                     sv_stats.py)
+
+    A grid is a base point together with some axes; each axis is varied
+    in turn (the others keeping their base values), rather than taking
+    all combinations.  The axes are
+        n_voters    number of voters
+        n_races     number of races (each with N_CHOICES choices)
+        choice_len  length of each choice
+        write_ins   whether each race has a write-in choice
+        n_reps, n_fail, n_leak   (as in election parameters)
+
+    Each point is run in a fresh process, so that points do not affect
+    one another, and the peak memory (maximum resident set size) of the
+    process is that of the point.
+"""
+
+# MIT open-source license.
+# (See https://github.com/ron-rivest/split-value-voting.git)
+
+import argparse
+import contextlib
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:                # (not available on all platforms)
+    resource = None
+
+import sv
+import sv_election
+import sv_main
+import sv_stats
+import sv_verifier
+
+N_CHOICES = 3                   # choices per race (not counting write-in)
+MIN_REGRESSION_SECONDS = 0.05   # smaller slowdowns are taken as noise
+
+BASE_POINT = {"n_voters": 10,
+              "n_races": 2,
+              "choice_len": 8,
+              "write_ins": True,
+              "n_reps": 4,
+              "n_fail": 1,
+              "n_leak": 1}
+
+BENCH_GRIDS = {
+    "quick": (BASE_POINT,
+              {"n_voters": [10, 100, 1000],
+               "n_races": [1, 4],
+               "choice_len": [4, 32],
+               "write_ins": [False, True],
+               "n_reps": [2, 8],
+               "n_fail": [1, 2],
+               "n_leak": [1, 2]}),
+    "full": (BASE_POINT,
+             {"n_voters": [10, 100, 1000, 10000, 100000, 1000000],
+              "n_races": [1, 2, 4, 8],
+              "choice_len": [2, 8, 32, 128],
+              "write_ins": [False, True],
+              "n_reps": [2, 4, 8, 16],
+              "n_fail": [0, 1, 2, 3],
+              "n_leak": [0, 1, 2, 3]})}
+
+##############################################################################
+# grid points
+##############################################################################
+
+def grid_points(grid_name):
+    """ Return list of (name, point) for grid with given name.
+
+    The base point comes first (named "base"); then, for each axis and
+    each value other than the base value, the base point with that axis
+    changed (named e.g. "n_voters=1000").
+    """
+    (base, axes) = BENCH_GRIDS[grid_name]
+    points = [("base", dict(base))]
+    for axis in sorted(axes.keys()):
+        for value in axes[axis]:
+            if value != base[axis]:
+                point = dict(base)
+                point[axis] = value
+                points.append((axis + "=" + str(value), point))
+    return points
+
+def point_parameters(point):
+    """ Return election parameters for grid point. """
+    assert point["choice_len"] >= len(str(N_CHOICES)) + 1
+    ballot_style = []
+    for r in range(point["n_races"]):
+        choices = [("c" + str(c)).ljust(point["choice_len"], "-")
+                   for c in range(N_CHOICES)]
+        if point["write_ins"]:
+            choices.append("*" * point["choice_len"])
+        ballot_style.append(("race" + str(r), tuple(choices)))
+    election_parameters = dict(sv_main.default_election_parameters)
+    election_parameters.update({"election_id": "bench",
+                                "ballot_style": ballot_style,
+                                "n_voters": point["n_voters"],
+                                "n_reps": point["n_reps"],
+                                "n_fail": point["n_fail"],
+                                "n_leak": point["n_leak"]})
+    return election_parameters
+
+##############################################################################
+# running points
+##############################################################################
+
+def run_point(point, memory=False):
+    """ Run election and verification for grid point; return results.
+
+    (Called in a fresh process; see run_grid.)  Output of the election
+    and verifier is discarded.
+    """
+    election_parameters = point_parameters(point)
+    sv_stats.set_stats(True, memory)
+    with tempfile.TemporaryDirectory() as directory:
+        sbb_filename = os.path.join(directory, "bench.sbb.txt")
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull:
+            with contextlib.redirect_stdout(devnull):
+                election = sv_election.Election(election_parameters)
+                election.run_election()
+                election.sbb.print_sbb(public=True,
+                                       sbb_filename=sbb_filename)
+                sv_verifier.verify(sbb_filename)
+        total_seconds = time.perf_counter() - start
+        sbb_bytes = os.path.getsize(sbb_filename)
+    phases = dict()
+    for record in sv_stats.phase_log:
+        phases[record["phase"]] = dict(
+            [(key, record[key]) for key in ("wall_seconds", "cpu_seconds",
+                                            "peak_bytes")
+             if key in record])
+    maxrss_kb = None
+    if resource is not None:
+        maxrss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"phases": phases,
+            "total_seconds": total_seconds,
+            "counts": sv.get_op_counts(),
+            "sbb_bytes": sbb_bytes,
+            "maxrss_kb": maxrss_kb}
+
+def run_point_in_process(point, memory=False):
+    """ Run grid point (see run_point) in a fresh process. """
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1) as pool:
+        return pool.apply(run_point, (point, memory))
+
+def run_grid(grid_name, repeat=1, memory=False, f_out=None):
+    """ Run each point of grid repeat times; return results (a dict).
+
+    For each point, the least time of each phase (over the repeats) is
+    kept (and the least total time), and the largest memory.
+    """
+    assert isinstance(repeat, int) and repeat > 0
+    results = {"grid": grid_name,
+               "python": sys.version.split()[0],
+               "platform": platform.platform(),
+               "points": []}
+    for (name, point) in grid_points(grid_name):
+        print("running", name, "...", file=f_out, flush=True)
+        best = None
+        for _ in range(repeat):
+            run = run_point_in_process(point, memory)
+            if best is None:
+                best = run
+                continue
+            for phase_name, phase in run["phases"].items():
+                best_phase = best["phases"][phase_name]
+                for key in ("wall_seconds", "cpu_seconds"):
+                    best_phase[key] = min(best_phase[key], phase[key])
+                if "peak_bytes" in phase:
+                    best_phase["peak_bytes"] = max(best_phase["peak_bytes"],
+                                                   phase["peak_bytes"])
+            best["total_seconds"] = min(best["total_seconds"],
+                                        run["total_seconds"])
+            if run["maxrss_kb"] is not None:
+                best["maxrss_kb"] = max(best["maxrss_kb"], run["maxrss_kb"])
+        best["name"] = name
+        best["point"] = point
+        results["points"].append(best)
+    return results
+
+##############################################################################
+# comparing against a baseline
+##############################################################################
+
+def compare_results(results, baseline, tolerance=0.25):
+    """ Return list of regressions of results against baseline.
+
+    Each regression is a string describing it.  Points are matched by
+    name; points only in one of the two are ignored.
+    """
+    assert tolerance >= 0
+    regressions = []
+    baseline_points = dict([(point["name"], point)
+                            for point in baseline["points"]])
+    for point in results["points"]:
+        name = point["name"]
+        base = baseline_points.get(name)
+        if base is None:
+            continue
+        for phase_name in sorted(point["phases"].keys()):
+            phase = point["phases"][phase_name]
+            base_phase = base["phases"].get(phase_name)
+            if base_phase is None:
+                continue
+            new = phase["wall_seconds"]
+            old = base_phase["wall_seconds"]
+            if new > old * (1 + tolerance) and \
+               new - old > MIN_REGRESSION_SECONDS:
+                regressions.append("%s: %s took %.3fs (baseline %.3fs)" %
+                                   (name, phase_name, new, old))
+            if "peak_bytes" in phase and "peak_bytes" in base_phase and \
+               phase["peak_bytes"] > base_phase["peak_bytes"] * \
+               (1 + tolerance):
+                regressions.append("%s: %s peak %d bytes (baseline %d)" %
+                                   (name, phase_name, phase["peak_bytes"],
+                                    base_phase["peak_bytes"]))
+        new = point["total_seconds"]
+        old = base["total_seconds"]
+        if new > old * (1 + tolerance) and new - old > MIN_REGRESSION_SECONDS:
+            regressions.append("%s: total took %.3fs (baseline %.3fs)" %
+                               (name, new, old))
+        for key in ("sbb_bytes", "maxrss_kb"):
+            if point.get(key) is not None and base.get(key) is not None and \
+               point[key] > base[key] * (1 + tolerance):
+                regressions.append("%s: %s %d (baseline %d)" %
+                                   (name, key, point[key], base[key]))
+    return regressions
+
+def print_results(results, f_out=None):
+    """ Print summary (one line per point) of results. """
+    print("%-20s %10s %12s %12s" %
+          ("point", "seconds", "sbb_bytes", "maxrss_kb"), file=f_out)
+    for point in results["points"]:
+        print("%-20s %10.3f %12d %12s" %
+              (point["name"], point["total_seconds"], point["sbb_bytes"],
+               point["maxrss_kb"]), file=f_out)
+
+def main():
+    """ Run benchmark grid, save results, and compare to baseline. """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--grid", default="quick",
+                        choices=sorted(BENCH_GRIDS.keys()),
+                        help="grid to run (default quick)")
+    parser.add_argument("--output", metavar="FILE",
+                        default="bench_results.json",
+                        help="results file (default bench_results.json)")
+    parser.add_argument("--baseline", metavar="FILE", default=None,
+                        help="compare against results in FILE")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed fraction of increase (default 0.25)")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="runs per point, keeping least times")
+    parser.add_argument("--memory", action="store_true",
+                        help="also record peak memory of each phase")
+    args = parser.parse_args()
+
+    results = run_grid(args.grid, args.repeat, args.memory)
+    print_results(results)
+    sv.dump(results, args.output)
+    print("benchmark results saved on file:", args.output)
+    if args.baseline is not None:
+        regressions = compare_results(results, sv.load(args.baseline),
+                                      args.tolerance)
+        for regression in regressions:
+            print("REGRESSION:", regression)
+        if regressions:
+            sys.exit(1)
+        print("no regressions against baseline", args.baseline)
+
+if __name__ == "__main__":
+    assert sys.version_info[0] == 3
+    main()
@@ -0,0 +1,123 @@
+# sv_checkpoint.py
+# python3
+
+""" Checkpoint and resume for simulated split-value elections.
+
+    When enabled (set_checkpoint(filename)), the state of the election
+    is saved on a file as each phase of Election.run_election completes
+    (see CHECKPOINT_PHASES).  An election that fails, or is stopped,
+    later on can then be resumed from the last phase completed
+    (resume_election), rather than started over; it gives the same SBB
+    as an uninterrupted run (except for time stamps of messages posted
+    after resuming, unless time stamps are frozen; see
+    sv_sbb.set_frozen_time).
+
+    Usage:
+        python3 sv_main.py [election_id] --checkpoint
+            (saves checkpoints on election_id.checkpoint.gz)
+        python3 sv_main.py [election_id] --resume
+            (resumes election from election_id.checkpoint.gz)
+
+    A checkpoint holds the whole Election object -- the server data
+    structure (sdb) and precomputed material, the cast vote commitments
+    and receipts, the voters, and the SBB so far -- together with the
+    state of sv.py that the rest of the election depends on: the states
+    of all randomness sources, and the json settings.  (The hash suite
+    is that of the election.)  It is pickled and compressed with gzip;
+    it is written to a temporary file first, and then renamed, so that
+    a failure while writing leaves the previous checkpoint intact.
+
+    Statistics, traces and communication accounting (sv_stats.py,
+    sv_trace.py, sv_comm.py) are not saved; after resuming, they cover
+    the phases that are run after resuming.
+
+    In "distributed" server mode, the server processes keep their own
+    material from precompute until the mix is done; no checkpoint is
+    saved while they run (that is, for the precompute and cast phases).
+
+    Checkpoints are pickles, and loading a pickle can run arbitrary
+    code: only resume from checkpoint files you made yourself.
+"""
+
+# MIT open-source license.
+# (See https://github.com/ron-rivest/split-value-voting.git)
+
+import gzip
+import os
+import pickle
+
+import sv
+
+CHECKPOINT_PHASES = ("precompute", "cast", "mix", "tally", "prove")
+COMPRESS_LEVEL = 6              # gzip level (1 fastest ... 9 smallest)
+
+checkpoint_parameters = {'filename': None,
+                         'stop_after': None}
+
+class ElectionStopped(Exception):
+    """ Raised when election stops after a checkpoint (see set_checkpoint).
+    """
+
+def set_checkpoint(filename, stop_after=None):
+    """ Save checkpoints on file filename (None: don't save checkpoints).
+
+    If stop_after is the name of a phase (one of CHECKPOINT_PHASES), the
+    election is stopped, raising ElectionStopped, once the checkpoint of
+    that phase is saved (to test resuming).
+    """
+    assert filename is None or isinstance(filename, str)
+    assert stop_after is None or stop_after in CHECKPOINT_PHASES
+    checkpoint_parameters['filename'] = filename
+    checkpoint_parameters['stop_after'] = stop_after
+
+def checkpoint_filename(election_id):
+    """ Return name of checkpoint file used by sv_main.py for election. """
+    return election_id + ".checkpoint.gz"
+
+def save_checkpoint(election, phase_name):
+    """ Save checkpoint of election, which has just completed phase_name.
+
+    (Does nothing if checkpoints are not enabled, or if server processes
+    are running; see above.)
+    """
+    filename = checkpoint_parameters['filename']
+    if filename is None:
+        return
+    if election.server.array is None:
+        state = {"phase": phase_name,
+                 "election": election,
+                 "randomness_sources": sv.randomness_sources,
+                 "json_parameters": sv.json_parameters}
+        temp_filename = filename + ".tmp"
+        with gzip.open(temp_filename, "wb",
+                       compresslevel=COMPRESS_LEVEL) as file:
+            pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_filename, filename)
+    if checkpoint_parameters['stop_after'] == phase_name:
+        raise ElectionStopped(phase_name)
+
+def load_checkpoint(filename):
+    """ Load checkpoint from file; return (election, phase_name).
+
+    The state of sv.py saved with the election is restored too.
+    """
+    with gzip.open(filename, "rb") as file:
+        state = pickle.load(file)
+    election = state["election"]
+    sv.set_hash_suite(election.hash_suite)
+    sv.randomness_sources.clear()
+    sv.randomness_sources.update(state["randomness_sources"])
+    sv.json_parameters.update(state["json_parameters"])
+    return (election, state["phase"])
+
+def resume_election(filename):
+    """ Resume election from checkpoint on file; return the election.
+
+    The phases after the one completed are run (saving checkpoints on
+    the same file, if checkpoints are enabled).
+    """
+    (election, phase_name) = load_checkpoint(filename)
+    print("resuming election", election.election_id,
+          "after phase", phase_name)
+    election.run_election()
+    return election
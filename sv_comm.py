@@ -0,0 +1,98 @@
+# sv_comm.py
+# python3
+
+""" Accounting of inter-server communication in simulated election.
+
+    The server array is simulated in one process (see sv_server.py), but
+    in a real deployment each server (row i, column j) is its own
+    machine, and many steps require inter-processor communication.
+    When accounting is enabled (set_comm_accounting(True)), those steps
+    record here, per phase and per link (sending server, receiving
+    server), the messages and bytes that would cross server boundaries:
+        "cast"            shares of ballots, voter -> (i, 0)
+        "precompute"      permutations and fuzz, (a, j) -> (i, j)
+        "mix"             outputs y of column j, (i, j) -> (i, j+1)
+        "prove:t_values"  t-value tracing, (i, j) -> (i, j+1)
+        "prove:pik"       composing permutations, (a, j) -> (a, j-1)
+    Servers are named "i:j" (e.g. "a:0"); tablets are named "voter".
+
+    Sizes are those of a compact binary encoding: a value modulo M takes
+    value_bytes(M) bytes, a position (one of n) takes index_bytes(n)
+    bytes, a commitment or randomizer takes sv.HASH_OUTPUT_BYTES bytes,
+    and a ballot_id one byte per hex digit.  (Message framing and
+    encryption overheads are not included.)
+
+    The report (see comm_report) is machine-readable (json).
+"""
+
+# MIT open-source license.
+# (See https://github.com/ron-rivest/split-value-voting.git)
+
+import json
+
+comm_parameters = {'enabled': False}
+
+# comm_log[phase][(src, dst)] = [messages, bytes]
+comm_log = dict()
+
+def set_comm_accounting(new_value):
+    """ Enable (True) or disable (False) accounting, clearing the log. """
+    comm_parameters['enabled'] = bool(new_value)
+    comm_log.clear()
+
+def record(phase, src, dst, n_bytes, n_messages=1):
+    """ Record n_messages messages, of n_bytes bytes in all, from server
+    src to server dst during phase (if accounting is enabled).
+    """
+    if not comm_parameters['enabled']:
+        return
+    link = comm_log.setdefault(phase, dict()).setdefault((src, dst), [0, 0])
+    link[0] += n_messages
+    link[1] += n_bytes
+
+def server_name(i, j):
+    """ Return name of server in row i, column j, e.g. "a:0". """
+    return i + ":" + str(j)
+
+def value_bytes(modulus):
+    """ Return number of bytes for a value modulo modulus. """
+    return max(1, ((modulus - 1).bit_length() + 7) // 8)
+
+def index_bytes(n):
+    """ Return number of bytes for a position (one of n positions). """
+    return max(1, ((n - 1).bit_length() + 7) // 8)
+
+def comm_report(election_id=None):
+    """ Return report (a dict) of communication recorded so far.
+
+    For each phase, and for the total over phases, gives the number of
+    messages and bytes, and the same sent and received per server; for
+    each phase, also the list of links.
+    """
+    report = {"election_id": election_id, "phases": dict()}
+    total = {"messages": 0, "bytes": 0, "servers": dict()}
+    for phase in sorted(comm_log.keys()):
+        phase_report = {"messages": 0, "bytes": 0,
+                        "servers": dict(), "links": []}
+        for (src, dst) in sorted(comm_log[phase].keys()):
+            (n_messages, n_bytes) = comm_log[phase][(src, dst)]
+            phase_report["links"].append({"src": src, "dst": dst,
+                                          "messages": n_messages,
+                                          "bytes": n_bytes})
+            for summary in (phase_report, total):
+                summary["messages"] += n_messages
+                summary["bytes"] += n_bytes
+                for (name, direction) in ((src, "sent"), (dst, "received")):
+                    server = summary["servers"].setdefault(
+                        name, {"messages_sent": 0, "bytes_sent": 0,
+                               "messages_received": 0, "bytes_received": 0})
+                    server["messages_" + direction] += n_messages
+                    server["bytes_" + direction] += n_bytes
+        report["phases"][phase] = phase_report
+    report["total"] = total
+    return report
+
+def write_comm_report(filename, election_id=None):
+    """ Write comm_report (as json) to file with given name. """
+    with open(filename, "w") as file:
+        json.dump(comm_report(election_id), file, indent=1, sort_keys=True)
@@ -0,0 +1,411 @@
+# sv_distributed.py
+# python3
+
+""" Distributed simulation of the server array for split-value election.
+
+    With election parameter "server_mode" equal to "distributed", each
+    server (row i, column j) of the server array is its own OS process,
+    holding only its own state, rather than the whole array being
+    simulated by the single object of sv_server.Server.  This allows
+    measuring the CPU time and memory of each server, and the amount of
+    data sent between servers, and lets the rows of a column run in
+    parallel.
+
+    The servers are started (by Server.precompute) before votes are cast,
+    and make and keep their permutations and obfuscation values then:
+    the server in row 'a' of each column makes them (from its randomness
+    source) and sends each server in its column its permutations and its
+    shares of the fuzz.  Once casting is closed, the first-column servers
+    are sent their shares of the cast votes, and the columns mix left to
+    right, each server sending its outputs to the server to its right
+    (row i, column j+1).  The outputs are sent one race and copy k at a
+    time, as soon as they are computed, so that the columns work as a
+    pipeline: while column j mixes copy k, column j+1 mixes the copy
+    before it.  (Each column still applies its whole permutation to all
+    positions of a copy at once, so the permutations stay uniformly
+    random.)  At the end each server reports back what the
+    prover needs (the permutations, and the outputs of the last column),
+    and its own measurements.  Results are the same as with the
+    simulated server array.
+
+    Message format: each message is a pair (kind, payload), pickled and
+    sent as one message over a pipe (multiprocessing.Pipe); kind is a
+    string and payload a dict.  Positions 0, 1, ..., n-1 stand for the
+    positions p0, p1, ... of the election.  Messages are
+        coordinator -> server (i, j):
+            ("setup", {"i", "j", "row_list", "threshold", "races",
+                       "k_list", "rand_states", "hash_suite",
+                       "small_modulus", "trace_origin"})
+                races is a list of (race_id, race_modulus) pairs;
+                rand_states maps race_id to the state of the randomness
+                source of the server for that race; trace_origin is
+                None, or the time origin if tracing (see sv_trace.py)
+            ("precompute", {"max_voters": max_voters})
+            ("mix", {"n_voters": {race_id: n},
+                     "inputs": {race_id: [x, ...]}})
+                (n is the number of positions of the race; inputs only
+                for first column)
+            ("stop", {})
+        server (a, j) -> server (i, j):
+            ("material", {race_id: {k: {"pi": [...], "fuzz": [...]}}})
+        server (i, j) -> server (i, j+1):
+            ("column_output", {"race_id": race_id, "k": k, "y": [y, ...]})
+                (one message for each race and copy k, in order)
+        server (i, j) -> coordinator:
+            ("precomputed", {"rand_states": {race_id: state}})
+            ("mixed", {"pi": {race_id: {k: [...]}},     (row 'a' only)
+                       "y": {race_id: {k: [y, ...]}}})  (last column only)
+            ("stats", {"cpu_seconds", "maxrss_kb", "bytes_sent",
+                       "bytes_received", "messages_sent",
+                       "messages_received", "trace"})
+                (trace, only if tracing, is (events, stacks) as given
+                by sv_trace.trace_record)
+"""
+
+# MIT open-source license.
+# (See https://github.com/ron-rivest/split-value-voting.git)
+
+import multiprocessing
+import pickle
+import time
+
+try:
+    import resource
+except ImportError:                # (not available on all platforms)
+    resource = None
+
+import sv
+import sv_trace
+
+SERVER_MODES = ("simulated", "distributed")
+
+class ServerProcessError(Exception):
+    """ Raised when a server process (or the coordinator) finds that a
+    server it was waiting on has exited.
+    """
+
+##############################################################################
+# messages
+##############################################################################
+
+def new_comm_stats():
+    """ Return dict for counting messages and bytes sent and received. """
+    return {"bytes_sent": 0, "bytes_received": 0,
+            "messages_sent": 0, "messages_received": 0}
+
+def send_message(conn, kind, payload, comm_stats):
+    """ Send message (kind, payload) over conn, counting it in comm_stats.
+    """
+    data = pickle.dumps((kind, payload), protocol=pickle.HIGHEST_PROTOCOL)
+    conn.send_bytes(data)
+    comm_stats["bytes_sent"] += len(data)
+    comm_stats["messages_sent"] += 1
+
+def receive_message(conn, kind, comm_stats):
+    """ Receive message over conn, which must be of given kind;
+    return its payload (counting the message in comm_stats).
+
+    Raise ServerProcessError if the process at the other end has exited
+    (so that a failed server stops the servers waiting on it, and then
+    the coordinator, rather than leaving them waiting).
+    """
+    try:
+        data = conn.recv_bytes()
+    except EOFError:
+        raise ServerProcessError("expected " + kind +
+                                 ", but server process has exited")
+    comm_stats["bytes_received"] += len(data)
+    comm_stats["messages_received"] += 1
+    (msg_kind, payload) = pickle.loads(data)
+    assert msg_kind == kind, "expected " + kind + ", got " + msg_kind
+    return payload
+
+def process_usage():
+    """ Return (cpu_seconds, maxrss_kb) used so far by this process.
+
+    (maxrss_kb is None if it can't be measured on this platform.)
+    """
+    if resource is None:
+        return (time.process_time(), None)
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return (usage.ru_utime + usage.ru_stime, usage.ru_maxrss)
+
+##############################################################################
+# one server of the array, in its own process
+##############################################################################
+
+def server_process(coordinator, material_outs, material_in,
+                   column_in, column_out):
+    """ Run server (i, j) of the server array, until told to stop.
+
+    Here coordinator is the pipe connection to the coordinator;
+    material_outs maps row ids to connections to the other servers in
+    the column (only for row 'a'); material_in is the connection from
+    the server in row 'a' (None for row 'a'); column_in and column_out
+    are the connections from the server to the left and to the right
+    (None if there is none).
+    """
+    comm_stats = new_comm_stats()
+    setup = receive_message(coordinator, "setup", comm_stats)
+    sv.set_hash_suite(setup["hash_suite"])
+    sv.set_small_modulus_fast_path(setup["small_modulus"])
+    i = setup["i"]
+    if setup["trace_origin"] is not None:
+        sv_trace.set_trace(True, setup["trace_origin"],
+                           "server:" + i + ":" + str(setup["j"]))
+    row_list = setup["row_list"]
+    races = setup["races"]
+    k_list = setup["k_list"]
+    leader = i == row_list[0]
+    rand_names = dict()
+    for race_id, state in setup["rand_states"].items():
+        rand_names[race_id] = "server:" + race_id + ":" + i + ":" + \
+                              str(setup["j"])
+        sv.randomness_sources[rand_names[race_id]] = state
+
+    # make (row 'a') or receive permutations and fuzz for this column
+    # (randomness is drawn in the same order as by Server.precompute)
+    max_voters = receive_message(coordinator, "precompute",
+                                 comm_stats)["max_voters"]
+    if leader:
+        with sv_trace.span("server:make_material"):
+            material = dict()
+            for (race_id, race_modulus) in races:
+                material[race_id] = dict()
+                for k in k_list:
+                    pi = sv.random_permutation(max_voters,
+                                               rand_names[race_id])
+                    material[race_id][k] = \
+                        {"pi": [pi[x] for x in range(max_voters)]}
+            fuzz = dict()
+            for (race_id, race_modulus) in races:
+                fuzz[race_id] = dict()
+                for k in k_list:
+                    fuzz[race_id][k] = sv.share_many([0] * max_voters,
+                                                     len(row_list),
+                                                     setup["threshold"],
+                                                     rand_names[race_id],
+                                                     race_modulus)
+        for row, i2 in enumerate(row_list):
+            material_i2 = dict()
+            for (race_id, race_modulus) in races:
+                material_i2[race_id] = dict()
+                for k in k_list:
+                    material_i2[race_id][k] = \
+                        {"pi": material[race_id][k]["pi"],
+                         "fuzz": fuzz[race_id][k][row]}
+            if i2 == i:
+                my_material = material_i2
+            else:
+                send_message(material_outs[i2], "material", material_i2,
+                             comm_stats)
+    else:
+        with sv_trace.span("server:wait_material"):
+            my_material = receive_message(material_in, "material",
+                                          comm_stats)
+    rand_states = dict([(race_id, sv.randomness_sources[rand_name])
+                        for race_id, rand_name in rand_names.items()])
+    send_message(coordinator, "precomputed", {"rand_states": rand_states},
+                 comm_stats)
+
+    # mix: shuffle, then add fuzz, passing outputs of each race and
+    # copy k to the right as soon as they are computed
+    msg = receive_message(coordinator, "mix", comm_stats)
+    outputs = dict()
+    pis = dict()
+    for (race_id, race_modulus) in races:
+        outputs[race_id] = dict()
+        pis[race_id] = dict()
+        n_voters = msg["n_voters"][race_id]
+        for k in k_list:
+            if column_in is None:
+                x = msg["inputs"][race_id]
+            else:
+                with sv_trace.span("server:wait_inputs"):
+                    column_output = receive_message(column_in,
+                                                    "column_output",
+                                                    comm_stats)
+                assert column_output["race_id"] == race_id
+                assert column_output["k"] == k
+                x = column_output["y"]
+            with sv_trace.span("server:mix", race_id=race_id, k=k):
+                pi = sv.restrict_permutation(my_material[race_id][k]["pi"],
+                                             n_voters)
+                y = sv.add_mod([x[pi[p]] for p in range(n_voters)],
+                               my_material[race_id][k]["fuzz"][:n_voters],
+                               race_modulus)
+            if column_out is not None:
+                send_message(column_out, "column_output",
+                             {"race_id": race_id, "k": k, "y": y},
+                             comm_stats)
+            outputs[race_id][k] = y
+            pis[race_id][k] = pi
+    mixed = dict()
+    if leader:
+        mixed["pi"] = pis
+    if column_out is None:
+        mixed["y"] = outputs
+    send_message(coordinator, "mixed", mixed, comm_stats)
+
+    receive_message(coordinator, "stop", comm_stats)
+    (cpu_seconds, maxrss_kb) = process_usage()
+    stats = {"cpu_seconds": cpu_seconds, "maxrss_kb": maxrss_kb}
+    stats.update(comm_stats)
+    if sv_trace.trace_parameters['enabled']:
+        stats["trace"] = sv_trace.trace_record()
+    send_message(coordinator, "stats", stats, comm_stats)
+
+##############################################################################
+# the array of server processes, as seen by the coordinator
+##############################################################################
+
+class ServerArray:
+    """ The server array of a Server, as one process per (row, column). """
+
+    def __init__(self, server):
+        """ Start a process for each server of server's array, and set
+        it up (sending it the state of its randomness sources).
+        """
+        self.server = server
+        election = server.election
+        rows = server.row_list
+        cols = range(server.cols)
+        self.comm_stats = new_comm_stats()   # of the coordinator
+        context = multiprocessing.get_context("spawn")
+        # pipes: coordinator <-> (i, j); (a, j) -> (i, j); (i, j) -> (i, j+1)
+        coordinator_ends = dict()
+        server_ends = dict()
+        for i in rows:
+            for j in cols:
+                (coordinator_ends[i, j], server_ends[i, j]) = \
+                    context.Pipe()
+        material_outs = dict([(j, dict()) for j in cols])
+        material_ins = dict()
+        for j in cols:
+            for i in rows[1:]:
+                (material_ins[i, j], material_outs[j][i]) = \
+                    context.Pipe(duplex=False)
+        column_ins = dict()
+        column_outs = dict()
+        for i in rows:
+            for j in cols[:-1]:
+                (column_ins[i, j+1], column_outs[i, j]) = \
+                    context.Pipe(duplex=False)
+        self.conns = coordinator_ends
+        self.processes = dict()
+        for i in rows:
+            for j in cols:
+                process = context.Process(
+                    target=server_process,
+                    args=(server_ends[i, j],
+                          material_outs[j] if i == rows[0] else None,
+                          material_ins.get((i, j)),
+                          column_ins.get((i, j)),
+                          column_outs.get((i, j))),
+                    name="server:" + i + ":" + str(j),
+                    daemon=True)
+                process.start()
+                self.processes[i, j] = process
+        # close the ends held by the servers, so that a server sees end
+        # of file once those it is waiting on have exited
+        for conn in list(server_ends.values()) + \
+                list(material_ins.values()) + list(column_ins.values()) + \
+                list(column_outs.values()):
+            conn.close()
+        for j in cols:
+            for conn in material_outs[j].values():
+                conn.close()
+        races = [(race.race_id, race.race_modulus)
+                 for race in election.races]
+        trace_origin = None
+        if sv_trace.trace_parameters['enabled']:
+            trace_origin = sv_trace.trace_parameters['origin']
+        for i in rows:
+            for j in cols:
+                rand_states = dict()
+                for race in election.races:
+                    rand_name = server.sdb[race.race_id][i][j]['rand_name']
+                    rand_states[race.race_id] = \
+                        sv.randomness_sources[rand_name]
+                setup = {"i": i, "j": j, "row_list": rows,
+                         "threshold": server.threshold,
+                         "races": races, "k_list": election.k_list,
+                         "rand_states": rand_states,
+                         "hash_suite": sv.hash_suite['name'],
+                         "small_modulus":
+                             sv.small_modulus_parameters['enabled'],
+                         "trace_origin": trace_origin}
+                send_message(self.conns[i, j], "setup", setup,
+                             self.comm_stats)
+
+    def precompute(self, max_voters):
+        """ Have the servers make their permutations and fuzz for up to
+        max_voters voters; then update the randomness sources used.
+        """
+        for conn in self.conns.values():
+            send_message(conn, "precompute", {"max_voters": max_voters},
+                         self.comm_stats)
+        for (i, j), conn in self.conns.items():
+            msg = receive_message(conn, "precomputed", self.comm_stats)
+            for race_id, state in msg["rand_states"].items():
+                rand_name = self.server.sdb[race_id][i][j]['rand_name']
+                sv.randomness_sources[rand_name] = state
+
+    def mix(self):
+        """ Send cast votes to first column, and have the servers mix.
+
+        Return (pis, ys), where pis[race_id][j][k] is the permutation
+        (list) of column j, and ys[race_id][i][k] is the list of outputs
+        of row i of the last column.
+        """
+        server = self.server
+        election = server.election
+        n_voters = dict([(race.race_id, len(race.p_list))
+                         for race in election.races])
+        for (i, j), conn in self.conns.items():
+            inputs = dict()
+            if j == 0:
+                for race in election.races:
+                    x = server.sdb[race.race_id][i][0]['x']
+                    inputs[race.race_id] = [x[p] for p in race.p_list]
+            send_message(conn, "mix",
+                         {"n_voters": n_voters, "inputs": inputs},
+                         self.comm_stats)
+        pis = dict([(race_id, dict()) for race_id in election.race_ids])
+        ys = dict([(race_id, dict()) for race_id in election.race_ids])
+        for (i, j), conn in self.conns.items():
+            msg = receive_message(conn, "mixed", self.comm_stats)
+            for race_id, pi_k in msg.get("pi", dict()).items():
+                pis[race_id][j] = pi_k
+            for race_id, y_k in msg.get("y", dict()).items():
+                ys[race_id][i] = y_k
+        return (pis, ys)
+
+    def stop(self):
+        """ Stop the servers; return list of their measurements (dicts,
+        each with the server's row i and column j added).
+        """
+        stats_list = []
+        for (i, j), conn in self.conns.items():
+            send_message(conn, "stop", dict(), self.comm_stats)
+            stats = receive_message(conn, "stats", self.comm_stats)
+            if "trace" in stats:
+                sv_trace.add_events(*stats.pop("trace"))
+            stats["i"] = i
+            stats["j"] = j
+            stats_list.append(stats)
+        for process in self.processes.values():
+            process.join()
+        return stats_list
+
+def print_process_stats(stats_list, f_out=None):
+    """ Print measurements of each server process (see ServerArray.stop).
+    """
+    print("server processes:", file=f_out)
+    print("     row col  cpu_seconds  maxrss_kb  bytes_sent  bytes_received",
+          file=f_out)
+    for stats in stats_list:
+        print("    %4s %3d %12.3f %10s %11d %15d" %
+              (stats["i"], stats["j"], stats["cpu_seconds"],
+               stats["maxrss_kb"], stats["bytes_sent"],
+               stats["bytes_received"]), file=f_out)
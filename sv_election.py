@@ -7,14 +7,63 @@
 # MIT open-source license.
 # (See https://github.com/ron-rivest/split-value-voting.git)
 
+import time
+
 import sv
+import sv_checkpoint
+import sv_comm
+import sv_distributed
 import sv_prover
 import sv_server
+import sv_stats
 import sv_race
 import sv_sbb
 import sv_tally
 import sv_voter
 
+# keys of the share of a ballot sent to each row (see ingest_ballot)
+BALLOT_SHARE_KEYS = frozenset(["ballot_id", "x", "u", "v", "r_seed",
+                               "cu", "cv"])
+
+class BallotError(Exception):
+    """ Raised by Election.ingest_ballot when a ballot is malformed or
+    cannot be cast (in which case nothing of it has been saved).
+    """
+
+def check_ballot_share(i, share, px, race_modulus):
+    """ Check share of a ballot sent to row i, for position px.
+
+    Raise BallotError unless x, u and v are integers in [0, race_modulus)
+    with x = u+v (mod race_modulus), r_seed is a seed (in base64), and cu
+    and cv (in base64) are the commitments to u and v with the
+    randomizers derived from r_seed (as made by Voter.make_ballot).
+    """
+    for key in ("x", "u", "v"):
+        value = share[key]
+        if not isinstance(value, int) or isinstance(value, bool) or \
+                not 0 <= value < race_modulus:
+            raise BallotError("bad " + key + " in share for row " + i)
+    if share["x"] != (share["u"] + share["v"]) % race_modulus:
+        raise BallotError("x != u+v in share for row " + i)
+    decoded = dict()
+    for key in ("r_seed", "cu", "cv"):
+        value = share[key]
+        try:
+            decoded[key] = sv.base64_2_bytes(value)
+        except (TypeError, ValueError):
+            raise BallotError("bad " + key + " in share for row " + i)
+        # (only the canonical base64 of a value is accepted)
+        if sv.bytes2base64(decoded[key]) != value:
+            raise BallotError("bad " + key + " in share for row " + i)
+    if len(decoded["r_seed"]) != sv.SECPARAM_RAND_SEED // 8:
+        raise BallotError("bad r_seed in share for row " + i)
+    r_seed = decoded["r_seed"]
+    r_list = [sv.derive_randomizer(r_seed, px, "ru"),
+              sv.derive_randomizer(r_seed, px, "rv")]
+    if sv.com_batch([share["u"], share["v"]], r_list) != \
+            [decoded["cu"], decoded["cv"]]:
+        raise BallotError("commitments do not open in share for row " + i)
+
 class Election:
     """ Implements a (simulated) election. """
 
@@ -57,11 +106,21 @@ class Election:
         n_leak = election_parameters["n_leak"]
         # optional parameters (with defaults)
         ballot_id_len = election_parameters.get("ballot_id_len", 32)
+        choice_encoding = election_parameters.get("choice_encoding", "bytes")
+        challenge_stretch = election_parameters.get("challenge_stretch",
+                                                    "iterate")
+        hash_suite = election_parameters.get("hash_suite", "sha256")
+        server_mode = election_parameters.get("server_mode", "simulated")
         json_indent = election_parameters.get("json_indent", 0)
         self.json_indent = json_indent
         sv.set_json_indent(json_indent)
 
         # check and save parameters
+        # (hash suite first, as all hashing and randomness depends on it)
+        assert hash_suite in sv.HASH_SUITES
+        self.hash_suite = hash_suite
+        sv.set_hash_suite(hash_suite)
+
         assert isinstance(election_id, str) and len(election_id) > 0
         self.election_id = election_id
 
@@ -78,6 +137,7 @@ class Election:
         # json "sort by keys" options works.
         # the following list is in sorted order!
         self.p_list = sv.p_list(n_voters)
+        self.p_set = frozenset(self.p_list)
 
         assert isinstance(n_reps, int) and \
             0 < n_reps <= 26 and n_reps % 2 == 0
@@ -93,6 +153,18 @@ class Election:
         assert ballot_id_len > 0
         self.ballot_id_len = ballot_id_len
 
+        assert choice_encoding in sv_race.CHOICE_ENCODINGS
+        self.choice_encoding = choice_encoding
+
+        # the id of the stretch algorithm (posted on the SBB), which
+        # uses the hash of the hash suite
+        self.challenge_stretch = \
+            sv.stretch_algorithm(sv.stretch_method(challenge_stretch),
+                                 hash_suite)
+
+        assert server_mode in sv_distributed.SERVER_MODES
+        self.server_mode = server_mode
+
         about_text = \
         ["Secure Bulletin Board for Split-Value Voting Method Demo.",
          "by Michael O. Rabin and Ronald L. Rivest",
@@ -118,59 +190,102 @@ class Election:
         ]
         # start secure bulletin board
         self.sbb = sv_sbb.SBB(election_id)
-        self.sbb.post("setup:start",
-                      {"about": about_text,
-                       "election_id": election_id,
-                       "legend": legend_text
-                      }
-                     )
+        start_dict = {"about": about_text,
+                      "election_id": election_id,
+                      "legend": legend_text
+                     }
+        if hash_suite != "sha256":
+            # (absent for the original suite, as on older SBBs)
+            start_dict["hash_suite"] = hash_suite
+        self.sbb.post("setup:start", start_dict)
 
         self.races = []
-        self.race_ids = [race_id for (race_id, choices) in ballot_style]
+        self.race_ids = []
         self.setup_races(ballot_style)
         self.voters = []
         self.voter_ids = []
         self.setup_voters(self, n_voters)
-        self.cast_votes = dict()
+        self.casting_open = False
+        self.completed_phases = []    # (see end_phase)
         self.server = sv_server.Server(self, n_fail, n_leak)
         self.output_commitments = dict()
         self.setup_keys()
         self.sbb.post("setup:finished")
 
     def run_election(self):
-        """ Run a (simulated) election. """
+        """ Run a (simulated) election.
 
-        self.initialize_cast_votes()
-
-        # Vote !
-        for voter in self.voters:
-            for race in self.races:
-                voter.cast_vote(race)
-
-        # send votes to mix-net
-        self.distribute_cast_votes()
+        (Each phase is timed, if enabled; see sv_stats.py.)
+        Phases already completed (by an election resumed from a
+        checkpoint; see sv_checkpoint.py) are skipped.
+        """
 
-        # post vote commitments on SBB
-        self.post_cast_vote_commitments()
+        self.start_election()
 
-        # post voter receipts on SBB
-        self.post_voter_receipts()
+        # Vote !
+        # (write-in tables are cast along with their parent race)
+        if "cast" not in self.completed_phases:
+            with sv_stats.phase("cast"):
+                for voter in self.voters:
+                    for race in self.races:
+                        if race.write_in_for is None:
+                            voter.cast_vote(race)
+
+        self.finish_election()
+
+    def start_election(self):
+        """ Do everything that comes before votes are cast. """
+
+        # make vote-independent material for mix and proof ahead of time
+        # (unless already made, with some upper bound on number of voters)
+        if self.server.precomputed is None:
+            with sv_stats.phase("precompute"):
+                self.server.precompute(self.n_voters)
+            self.end_phase("precompute")
+
+        # open casting; vote commitments and voter receipts are posted
+        # on SBB as ballots arrive
+        if "cast" not in self.completed_phases:
+            self.open_casting()
+
+    def finish_election(self):
+        """ Do everything that comes after all votes are cast. """
+
+        if "cast" not in self.completed_phases:
+            self.close_casting()
+            self.end_phase("cast")
 
         # Mix !
-        self.server.mix()
+        if "mix" not in self.completed_phases:
+            with sv_stats.phase("mix"):
+                self.server.mix()
+            self.end_phase("mix")
 
         # Tally!
-        sv_tally.compute_tally(self)
-        sv_tally.post_tally(self)
-        sv_tally.print_tally(self)
+        if "tally" not in self.completed_phases:
+            with sv_stats.phase("tally"):
+                sv_tally.compute_tally(self)
+                sv_tally.post_tally(self)
+                sv_tally.print_tally(self)
+            self.end_phase("tally")
 
         # Prove!
-        sv_prover.make_proof(self)
-
-        # Stop election and close sbb
-        self.sbb.post("election:done.",
-                      {"election_id": self.election_id})
-        self.sbb.close()
+        if "prove" not in self.completed_phases:
+            with sv_stats.phase("prove"):
+                sv_prover.make_proof(self)
+
+            # Stop election and close sbb
+            self.sbb.post("election:done.",
+                          {"election_id": self.election_id})
+            self.sbb.close()
+            self.end_phase("prove")
+
+    def end_phase(self, phase_name):
+        """ Note that phase phase_name is completed, and save checkpoint
+        (if enabled; see sv_checkpoint.py).
+        """
+        self.completed_phases.append(phase_name)
+        sv_checkpoint.save_checkpoint(self, phase_name)
 
     def setup_races(self, ballot_style):
         """ Set up races for this election, where ballot_style is
@@ -187,17 +302,33 @@ class Election:
              defines a ballot style with one race (for President), and
              for this race the voter may vote for Smith, for Jones, or
              may cast a write-in vote of length at most 8 characters.
-        """
-        # check that race_id's are distinct:
-        race_ids = [race_id for (race_id, choices) in ballot_style]
-        assert len(race_ids) == len(set(race_ids))
 
+        With "compact" choice encoding, a race allowing write-ins is
+        followed by its write-in table, which is set up as a race of its own.
+        """
         race_dict = dict()
         for (race_id, choices) in ballot_style:
-            race = sv_race.Race(self, race_id, choices)
+            race = sv_race.Race(self, race_id, choices, self.choice_encoding)
             self.races.append(race)
             race_dict[race_id] = {"choices": race.choices,
                                   "race_modulus": race.race_modulus}
+            if self.choice_encoding == "bytes":
+                continue
+            race_dict[race_id]["choice_encoding"] = race.choice_encoding
+            write_in_choice = race.write_in_choice()
+            if write_in_choice is not None:
+                table_id = race_id + sv_race.WRITE_IN_SUFFIX
+                table = sv_race.Race(self, table_id, (write_in_choice,),
+                                     write_in_for=race_id)
+                race.write_in_race = table
+                self.races.append(table)
+                race_dict[race_id]["write_in_race"] = table_id
+                race_dict[table_id] = {"choices": table.choices,
+                                       "race_modulus": table.race_modulus,
+                                       "write_in_for": race_id}
+        self.race_ids = [race.race_id for race in self.races]
+        # check that race_id's are distinct:
+        assert len(self.race_ids) == len(set(self.race_ids))
         self.sbb.post("setup:races",
                       {"ballot_style_race_dict": race_dict},
                       time_stamp=False)
@@ -231,73 +362,159 @@ class Election:
                                         self.voter_ids[-1])},
                               time_stamp=False)
 
-    def initialize_cast_votes(self):
-        """ Initialize the election data structure to receive the cast votes.
-
-            This data structure is updated by voter.cast_vote in sv_voter.py
-        """
-        cvs = dict()
-        for race_id in self.race_ids:
-            cvs[race_id] = dict()
-            for px in self.p_list:
-                cvs[race_id][px] = dict()    # maps row i to vote share
-        self.cast_votes = cvs
-
     def setup_keys(self):
         """ Set up cryptographic keys for this election simulation.
 
-        Not done here in this simulation for simplicity.
+        Only the key pair (intake_pk, intake_sk) used to encrypt ballots
+        sent from tablets to the servers (see sv_intake.py) is set up.
+        (Public-key encryption is a dummy here; see sv.pk_keygen.)
         """
-        pass
+        rand_name = "keys:" + self.election_id
+        sv.init_randomness_source(rand_name)
+        (self.intake_pk, self.intake_sk) = sv.pk_keygen(rand_name)
 
-    def distribute_cast_votes(self):
-        """ Distribute cast votes to server data structure. """
-        for race_id in self.race_ids:
-            for px in self.p_list:
-                for i in self.server.row_list:
-                    vote = self.cast_votes[race_id][px][i]
-                    # save these values in our server data structures
-                    # in a non-simulated real election, this would be done
-                    # by communicating securely from voter (or tablet) to the
-                    # first column of servers.
-                    sdbp = self.server.sdb[race_id][i][0]
-                    sdbp['ballot_id'][px] = vote['ballot_id']
-                    sdbp['x'][px] = vote['x']
-                    sdbp['u'][px] = vote['u']
-                    sdbp['v'][px] = vote['v']
-                    sdbp['ru'][px] = vote['ru']
-                    sdbp['rv'][px] = vote['rv']
-                    sdbp['cu'][px] = vote['cu']
-                    sdbp['cv'][px] = vote['cv']
-
-    def post_cast_vote_commitments(self):
-        """ Post cast vote commitments onto SBB. """
-        cvs = self.cast_votes
-        cvcs = dict()
+    def open_casting(self):
+        """ Open casting: prepare to ingest ballots, one at a time.
+
+        Each ballot's vote commitments and voter receipt are posted on
+        the SBB as the ballot arrives (see ingest_ballot), until casting
+        is closed (see close_casting).
+        """
+        assert not self.casting_open
+        self.cast_vote_commitments = dict()
         for race_id in self.race_ids:
-            cvcs[race_id] = dict()
-            for px in self.p_list:
-                cvcs[race_id][px] = dict()
-                for i in self.server.row_list:
-                    cvcs[race_id][px][i] = dict()
-                    cvcs[race_id][px][i]['ballot_id'] = \
-                        cvs[race_id][px][i]['ballot_id']
-                    cvcs[race_id][px][i]['cu'] = \
-                        cvs[race_id][px][i]['cu']
-                    cvcs[race_id][px][i]['cv'] = \
-                        cvs[race_id][px][i]['cv']
-        self.sbb.post("casting:votes",
-                      {"cast_vote_dict": cvcs},
+            self.cast_vote_commitments[race_id] = dict()
+        self.receipts = dict()
+        self.receipt_seconds = 0.0   # time taken making voter receipts
+        self.casting_open = True
+
+    def ingest_ballot(self, race_id, px, ballot):
+        """ Ingest one cast ballot for race race_id, at position px.
+
+        Here ballot is a dict mapping each row i of the server array to
+        the share of the vote sent to it, a dict with keys "ballot_id",
+        "x", "u", "v", "r_seed", "cu", and "cv" (where "r_seed" is the
+        seed of the randomness of the commitments "cu" and "cv").  In a
+        non-simulated real election, each share would be sent securely
+        from voter (or tablet) to the first-column server of its row;
+        here it is saved directly in the server data structure.  The
+        commitments are posted on the SBB, in a casting:ballot entry.
+
+        The ballot is checked before anything is saved (see also
+        check_ballot_share), so a rejected ballot (BallotError) leaves no
+        trace.
+
+        Return the voter receipt for the ballot: the hash (base64) of its
+        ballot_id and commitments, which is also posted on the SBB.
+        """
+        if not self.casting_open:
+            raise BallotError("casting is not open")
+        if not isinstance(race_id, str) or \
+                race_id not in self.cast_vote_commitments:
+            raise BallotError("unknown race: " + repr(race_id))
+        if not isinstance(px, str) or px not in self.p_set:
+            raise BallotError("unknown position: " + repr(px))
+        cvcs = self.cast_vote_commitments[race_id]
+        if px in cvcs:
+            raise BallotError("position already has a ballot: " + px)
+        if not isinstance(ballot, dict) or \
+                set(ballot.keys()) != set(self.server.row_list):
+            raise BallotError("ballot must have a share for each row")
+        for i in self.server.row_list:
+            vote = ballot[i]
+            if not isinstance(vote, dict) or \
+                    set(vote.keys()) != BALLOT_SHARE_KEYS:
+                raise BallotError("bad share for row " + i)
+        ballot_id = ballot[self.server.row_list[0]]['ballot_id']
+        if not isinstance(ballot_id, str) or \
+                len(ballot_id) != self.ballot_id_len:
+            raise BallotError("bad ballot_id")
+        if ballot_id in self.receipts:
+            raise BallotError("ballot_id already cast")
+        race_modulus = [race.race_modulus for race in self.races
+                        if race.race_id == race_id][0]
+        for i in self.server.row_list:
+            vote = ballot[i]
+            if vote['ballot_id'] != ballot_id:
+                raise BallotError("ballot_id differs in row " + i)
+            check_ballot_share(i, vote, px, race_modulus)
+
+        # now save the ballot
+        cast_vote = dict()
+        for i in self.server.row_list:
+            vote = ballot[i]
+            sdbp = self.server.sdb[race_id][i][0]
+            sdbp['ballot_id'][px] = ballot_id
+            sdbp['x'][px] = vote['x']
+            sdbp['u'][px] = vote['u']
+            sdbp['v'][px] = vote['v']
+            sdbp['r_seed'][px] = vote['r_seed']
+            sdbp['cu'][px] = vote['cu']
+            sdbp['cv'][px] = vote['cv']
+            cast_vote[i] = {'ballot_id': ballot_id,
+                            'cu': vote['cu'],
+                            'cv': vote['cv']}
+        cvcs[px] = cast_vote
+        if sv_comm.comm_parameters['enabled']:
+            # each share is sent from voter (tablet) to its server
+            # (ballot_id, x, u, v, seed of randomizers, cu and cv)
+            n_bytes = len(ballot_id) + \
+                3 * sv_comm.value_bytes(race_modulus) + \
+                sv.SECPARAM_RAND_SEED // 8 + \
+                2 * sv.HASH_OUTPUT_BYTES
+            for i in self.server.row_list:
+                sv_comm.record("cast", "voter", sv_comm.server_name(i, 0),
+                               n_bytes)
+        # (note that voter gets a receipt for each race she votes in)
+        receipt_start = time.perf_counter()
+        receipt_hash = self.receipt_hash(ballot)
+        self.receipt_seconds += time.perf_counter() - receipt_start
+        self.receipts[ballot_id] = {'race_id': race_id,
+                                    'hash': receipt_hash}
+        self.sbb.post("casting:ballot",
+                      {"race_id": race_id,
+                       "p": px,
+                       "cast_vote": cast_vote,
+                       "receipt": receipt_hash},
                       time_stamp=False)
+        return receipt_hash
 
-    def post_voter_receipts(self):
-        """ Post all voter receipts on the SBB. """
-        receipts = dict()
-        for voter in self.voters:
-            for ballot_id in voter.receipts:
-                receipts[ballot_id] = voter.receipts[ballot_id]
-        self.sbb.post("casting:receipts",
-                      {"receipt_dict": receipts},
-                      time_stamp=False)
+    def receipt_hash(self, ballot):
+        """ Return voter receipt for ballot (see ingest_ballot).
 
+        The receipt is the hash (base64) of the ballot_id and commitments.
+        """
+        ballot_id = ballot[self.server.row_list[0]]['ballot_id']
+        receipt_data = [ballot_id]
+        d = dict()
+        for i in self.server.row_list:
+            d[i] = {'cu': ballot[i]['cu'], 'cv': ballot[i]['cv']}
+        receipt_data.append(d)
+        receipt_data_str = sv.dumps(receipt_data)
+        return sv.bytes2base64(sv.secure_hash(receipt_data_str))
+
+    def ingest_ballots(self, ballots):
+        """ Ingest a batch of ballots, each a (race_id, px, ballot) triple.
+
+        Return list of voter receipts (see ingest_ballot), one per ballot.
+        (Ballots are ingested in turn; if one is rejected, those before it
+        stay ingested.)
+        """
+        return [self.ingest_ballot(race_id, px, ballot)
+                for (race_id, px, ballot) in ballots]
 
+    def close_casting(self):
+        """ Close casting; every position must have a ballot in every race
+        (but in a write-in table, whose positions are then set as those
+        with a ballot, in p_list order).
+        """
+        assert self.casting_open
+        for race in self.races:
+            cvcs = self.cast_vote_commitments[race.race_id]
+            if race.write_in_for is None:
+                assert len(cvcs) == self.n_voters
+            else:
+                race.p_list = [p for p in self.p_list if p in cvcs]
+        self.sbb.post("casting:closed",
+                      {"n_ballots": len(self.receipts)})
+        self.casting_open = False
@@ -0,0 +1,311 @@
+# sv_golden.py
+# python3
+
+""" Golden-output equivalence harness for the fast paths of sv.
+
+    An optimized ("fast") code path is acceptable only if it produces
+    exactly the same SBB as the reference code path.  This harness runs
+    an election on the reference path and on each fast path (see
+    VARIANTS), for the same parameters and seeds, and checks that the
+    SBB output by print_sbb is byte-identical.  (An election stopped
+    after some phase and resumed from its checkpoint, see
+    sv_checkpoint.py, is checked the same way.)  It first checks the
+    reference path against the checked-in SBB of the default election,
+    default_election.sbb.txt.  (The canonical hash of each reference
+    board, independent of json formatting, is printed too, for records.)
+    For an election with write-in tables ("compact" encoding), the
+    reference board is also checked to have ballots in them for the
+    write-in votes only (see check_write_in_tables).
+
+    Note that how the SBB is serialized (e.g. "json_indent") is not a
+    fast path: the serialized SBB is hashed to give the verifier
+    challenges, so it changes the board.
+
+    The SBB includes time stamps, and its hash (which includes them)
+    gives the verifier challenges; so all elections here are run with
+    time stamps frozen at GOLDEN_TIME (see sv_sbb.set_frozen_time).
+    default_election.sbb.txt is made the same way, by
+        python3 sv_golden.py --regenerate
+    which should be run (and the result committed) only when the board
+    is changed on purpose.
+
+    Usage:
+        python3 sv_golden.py [--quick] [--only VARIANT ...] [--regenerate]
+
+    --quick         only use the default election parameters
+    --only VARIANT ...
+                    only check the named variants
+    --regenerate    rewrite default_election.sbb.txt from reference path
+
+    Exit status is 1 if any check fails.
+
+    The reference path is: sv_server.Server simulating the server array
+    in one process, each column mixing all positions in turn, ballots
+    cast by direct calls of Election.ingest_ballot, and the small-modulus
+    fast path of sv.add_mod etc. disabled.  The reference election is
+    also verified (sv_verifier.verify).
+"""
+
+# MIT open-source license.
+# (See https://github.com/ron-rivest/split-value-voting.git)
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import sys
+import tempfile
+
+import sv
+import sv_checkpoint
+import sv_election
+import sv_intake
+import sv_main
+import sv_sbb
+import sv_verifier
+
+GOLDEN_TIME = "2014-06-26T14:08:17-0400"
+GOLDEN_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               "default_election.sbb.txt")
+
+# election parameters to check, as changes to the default parameters
+PARAMETER_SETS = [("default", dict()),
+                  ("big", {"election_id": "big", "n_voters": 40,
+                           "n_fail": 1, "n_leak": 2, "n_reps": 6}),
+                  ("compact", {"election_id": "compact", "n_voters": 20,
+                               "choice_encoding": "compact"})]
+
+# fast paths, each given by
+#   "parameters"     changes to the election parameters
+#   "small_modulus"  whether the small-modulus fast path is enabled
+#   "tablets"        None, or number of tablets casting via sv_intake
+#                    (ballots are posted on the SBB as they arrive, so
+#                    only with one tablet is their order, and so the
+#                    board, that of the reference path)
+#   "resume_after"   None, or phase after which the election is stopped,
+#                    and then resumed from its checkpoint (sv_checkpoint)
+VARIANTS = [("small_modulus", {"parameters": dict(),
+                               "small_modulus": True,
+                               "tablets": None,
+                               "resume_after": None}),
+            ("distributed", {"parameters": {"server_mode": "distributed"},
+                             "small_modulus": True,
+                             "tablets": None,
+                             "resume_after": None}),
+            ("intake", {"parameters": dict(),
+                        "small_modulus": True,
+                        "tablets": 1,
+                        "resume_after": None}),
+            ("resume_precompute", {"parameters": dict(),
+                                   "small_modulus": True,
+                                   "tablets": None,
+                                   "resume_after": "precompute"}),
+            ("resume_cast", {"parameters": dict(),
+                             "small_modulus": True,
+                             "tablets": None,
+                             "resume_after": "cast"}),
+            ("resume_tally", {"parameters": dict(),
+                              "small_modulus": True,
+                              "tablets": None,
+                              "resume_after": "tally"})]
+
+REFERENCE = {"parameters": dict(),
+             "small_modulus": False,
+             "tablets": None,
+             "resume_after": None}
+
+##############################################################################
+# running elections
+##############################################################################
+
+def canonical_hash(board):
+    """ Return canonical hash (hex) of board, independent of how the
+    board is serialized (indentation, etc.).
+    """
+    text = json.dumps(board, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def run_election(election_parameters, variant, verify=False):
+    """ Run election on the code path of variant, with frozen time stamps.
+
+    Return (sbb_text, board): the output of print_sbb, and the board.
+    (Output of the election, and of the verifier, is discarded; if
+    verify is True, the board is verified.)
+    """
+    election_parameters = dict(election_parameters)
+    election_parameters.update(variant["parameters"])
+    saved_small_modulus = sv.small_modulus_parameters['enabled']
+    sv.set_small_modulus_fast_path(variant["small_modulus"])
+    sv_sbb.set_frozen_time(GOLDEN_TIME)
+    output = io.StringIO()
+    try:
+        with tempfile.TemporaryDirectory() as directory, \
+             contextlib.redirect_stdout(output):
+            election = sv_election.Election(election_parameters)
+            if variant["resume_after"] is not None:
+                election = stop_and_resume(election, variant["resume_after"],
+                                           directory)
+            elif variant["tablets"] is None:
+                election.run_election()
+            else:
+                sv_intake.run_election_via_intake(election,
+                                                  variant["tablets"])
+            sbb_filename = os.path.join(directory, "golden.sbb.txt")
+            election.sbb.print_sbb(public=True, sbb_filename=sbb_filename)
+            with open(sbb_filename, "r") as file:
+                sbb_text = file.read()
+            if verify:
+                sv_verifier.verify(sbb_filename)
+    finally:
+        sv_sbb.set_frozen_time(None)
+        sv.set_small_modulus_fast_path(saved_small_modulus)
+    if verify:
+        assert "all verifications passed" in output.getvalue(), \
+            "reference election did not verify"
+    return (sbb_text, election.sbb.board)
+
+def stop_and_resume(election, phase_name, directory):
+    """ Run election until phase phase_name is completed, saving its
+    checkpoint in directory; then resume it from the checkpoint, as a
+    new process would.  Return the resumed election.
+    """
+    checkpoint_filename = os.path.join(directory, "golden.checkpoint.gz")
+    sv_checkpoint.set_checkpoint(checkpoint_filename, stop_after=phase_name)
+    try:
+        election.run_election()
+    except sv_checkpoint.ElectionStopped:
+        pass
+    finally:
+        sv_checkpoint.set_checkpoint(None)
+    sv.randomness_sources.clear()
+    return sv_checkpoint.resume_election(checkpoint_filename)
+
+##############################################################################
+# checks
+##############################################################################
+
+def check_golden_file(sbb_text):
+    """ Return True if sbb_text (of the reference default election) is
+    identical to the checked-in GOLDEN_FILENAME.
+    """
+    with open(GOLDEN_FILENAME, "r") as file:
+        return file.read() == sbb_text
+
+def regenerate_golden_file():
+    """ Rewrite GOLDEN_FILENAME from the reference default election. """
+    (sbb_text, board) = run_election(sv_main.default_election_parameters,
+                                     REFERENCE, verify=True)
+    with open(GOLDEN_FILENAME, "w") as file:
+        file.write(sbb_text)
+    print("reference board saved on file:", GOLDEN_FILENAME)
+
+def check_write_in_tables(election_parameters, board):
+    """ Return True if, for an election with write-in tables (compact
+    encoding) and its board: only a write-in is cast in a write-in
+    table, an empty write-in is rejected, and each write-in table on
+    the board has a ballot for each write-in vote in the tally of its
+    parent race, and no other.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        election = sv_election.Election(election_parameters)
+    voter = election.voters[0]
+    for race in election.races:
+        if race.is_valid_choice(""):
+            return False
+        if race.write_in_race is not None:
+            write_in = "x" * len(race.write_in_choice())
+            if voter.vote_choices(race, race.choices[0]) != \
+                    [(race, race.choices[0])] or \
+               voter.vote_choices(race, write_in) != \
+                    [(race, write_in), (race.write_in_race, write_in)]:
+                return False
+    races = dict()
+    tally = dict()
+    n_ballots = dict()
+    for item in board:
+        if item[0] == "setup:races":
+            races = item[1]["ballot_style_race_dict"]
+        elif item[0] == "tally:results":
+            tally = item[1]["tally"]
+        elif item[0] == "casting:ballot":
+            race_id = item[1]["race_id"]
+            n_ballots[race_id] = n_ballots.get(race_id, 0) + 1
+    for race_id, race_dict in races.items():
+        if "write_in_race" in race_dict:
+            n_write_ins = sum([count
+                               for choice, count in tally[race_id].items()
+                               if choice not in race_dict["choices"]])
+            if n_ballots.get(race_dict["write_in_race"], 0) != n_write_ins:
+                return False
+    return True
+
+def check_variants(parameter_sets, variant_names=None, f_out=None):
+    """ Check each variant against reference path for each parameter set.
+
+    Print a line per check; return list of names of checks that failed.
+    """
+    failures = []
+    for (set_name, changes) in parameter_sets:
+        election_parameters = dict(sv_main.default_election_parameters)
+        election_parameters.update(changes)
+        (reference_text, reference_board) = \
+            run_election(election_parameters, REFERENCE, verify=True)
+        print("%-10s %-18s %s" % (set_name, "reference",
+                                  canonical_hash(reference_board)[:16]),
+              file=f_out)
+        if set_name == "default":
+            ok = check_golden_file(reference_text)
+            print("%-10s %-18s %s" % (set_name, "golden_file",
+                                      "ok" if ok else "DIFFERENT"),
+                  file=f_out)
+            if not ok:
+                failures.append(set_name + ":golden_file")
+        if election_parameters.get("choice_encoding") == "compact":
+            ok = check_write_in_tables(election_parameters, reference_board)
+            print("%-10s %-18s %s" % (set_name, "write_in_tables",
+                                      "ok" if ok else "WRONG"),
+                  file=f_out)
+            if not ok:
+                failures.append(set_name + ":write_in_tables")
+        for (name, variant) in VARIANTS:
+            if variant_names is not None and name not in variant_names:
+                continue
+            (sbb_text, board) = run_election(election_parameters, variant)
+            ok = sbb_text == reference_text
+            print("%-10s %-18s %s" % (set_name, name,
+                                      "ok" if ok else "DIFFERENT"),
+                  file=f_out, flush=True)
+            if not ok:
+                failures.append(set_name + ":" + name)
+    return failures
+
+def main():
+    """ Check fast paths against reference (or regenerate golden file). """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--quick", action="store_true",
+                        help="only use default election parameters")
+    parser.add_argument("--only", metavar="VARIANT", nargs="+",
+                        default=None,
+                        choices=[name for (name, variant) in VARIANTS],
+                        help="only check the named variants")
+    parser.add_argument("--regenerate", action="store_true",
+                        help="rewrite default_election.sbb.txt")
+    args = parser.parse_args()
+
+    if args.regenerate:
+        regenerate_golden_file()
+        return
+    parameter_sets = PARAMETER_SETS
+    if args.quick:
+        parameter_sets = PARAMETER_SETS[:1]
+    failures = check_variants(parameter_sets, args.only)
+    if failures:
+        print("FAILED:", " ".join(failures))
+        sys.exit(1)
+    print("all fast paths give identical boards.")
+
+if __name__ == "__main__":
+    assert sys.version_info[0] == 3
+    main()
@@ -0,0 +1,474 @@
+# sv_intake.py
+# python3
+
+""" Ballot-intake service for simulated split-value election.
+
+    Simulated tablets send ballots to an intake server, over a local TCP
+    or Unix socket, instead of calling election.ingest_ballot directly.
+    The intake server (an asyncio server, so it handles many concurrent
+    tablets) feeds the ballots to the first-column server store and
+    returns the voter receipts.  This is for measuring casting throughput
+    and latency under concurrency.
+
+    Each tablet runs in a process of its own (see tablet_process), where
+    it makes its ballots, so that the event loop of the intake server
+    does only intake work.  (Basic operations done by the tablets are
+    thus not counted; see sv.count_op.)
+
+    Usage:
+        python3 sv_intake.py [election_id] [--tablets N] [--unix PATH]
+    where election description is given in election_id.parameters.txt
+    (as for sv_main.py; default election if not given).
+
+    Wire format: each message is a frame, consisting of its length as a
+    4-byte big-endian integer followed by that many bytes.  A tablet
+    sends a request frame containing (as json)
+        {"key": pk_enc(intake_pk, sym_key), "ct": sym_enc(sym_key, msg)}
+    (both in base64), where sym_key is a fresh symmetric key and msg is
+    (json for) {"race_id": race_id, "px": px, "ballot": ballot}.
+    The intake server answers with a response frame containing (as json)
+        {"ct": sym_enc(sym_key, (json for) {"receipt": receipt_hash})}
+    (in base64), where the encrypted message is {"error": reason} instead
+    if the ballot was not accepted; or, if the request could not be
+    opened (so there is no key to encrypt with), {"error": reason}.
+    (Encryption is the dummy encryption of sv.py.)  A connection sending
+    a frame longer than MAX_FRAME_LEN, or closed in the middle of a
+    frame, is closed.
+"""
+
+# MIT open-source license.
+# (See https://github.com/ron-rivest/split-value-voting.git)
+
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import sv
+import sv_election
+import sv_main
+import sv_verifier
+import sv_voter
+
+FRAME_HEADER_LEN = 4            # bytes giving the length of a frame
+MAX_FRAME_LEN = 2**20           # longest frame accepted
+TABLET_START_TIMEOUT = 60       # seconds to wait for all tablets to start
+
+# state of a tablet process: barrier at which the tablets wait for each
+# other before casting (see tablet_process_init)
+tablet_parameters = {'barrier': None}
+
+# errors raised by a request that cannot be opened or understood, or by
+# a ballot that is not accepted (ValueError includes json and base64
+# decoding errors)
+REQUEST_ERRORS = (ValueError, KeyError, TypeError, AssertionError,
+                  sv_election.BallotError)
+
+##############################################################################
+# framing and envelopes
+##############################################################################
+
+async def read_frame(reader):
+    """ Read one frame from asyncio stream reader; return its bytes.
+
+    Return None if the stream is closed before a frame starts; raise
+    asyncio.IncompleteReadError if it is closed within a frame, and
+    ValueError if the frame is longer than MAX_FRAME_LEN.
+    """
+    try:
+        header = await reader.readexactly(FRAME_HEADER_LEN)
+    except asyncio.IncompleteReadError as error:
+        if error.partial == b"":
+            return None
+        raise
+    length = int.from_bytes(header, 'big')
+    if length > MAX_FRAME_LEN:
+        raise ValueError("frame too long: %d bytes" % length)
+    return await reader.readexactly(length)
+
+def write_frame(writer, data):
+    """ Write bytes data as one frame to asyncio stream writer. """
+    writer.write(len(data).to_bytes(FRAME_HEADER_LEN, 'big') + data)
+
+def seal_request(intake_pk, sym_key, msg):
+    """ Return request (bytes) carrying msg (a dict) to intake server. """
+    envelope = {"key": sv.bytes2base64(sv.pk_enc(intake_pk, sym_key)),
+                "ct": sv.bytes2base64(sv.sym_enc(sym_key,
+                                                 json.dumps(msg).encode()))}
+    return json.dumps(envelope).encode()
+
+def open_request(intake_pk, intake_sk, request):
+    """ Return (sym_key, msg) from request made by seal_request. """
+    envelope = json.loads(request.decode())
+    sym_key = sv.pk_dec(intake_pk, intake_sk,
+                        sv.base64_2_bytes(envelope["key"]))
+    msg = sv.sym_dec(sym_key, sv.base64_2_bytes(envelope["ct"]))
+    return (sym_key, json.loads(msg.decode()))
+
+##############################################################################
+# intake server
+##############################################################################
+
+class IntakeServer:
+    """ Accept ballots from tablets over a socket, for an election.
+
+    Ballots are ingested one at a time (see Election.ingest_ballot),
+    in the order they arrive; casting must be open.
+    """
+
+    def __init__(self, election):
+        """ Initialize intake server for election (not yet listening). """
+        self.election = election
+        self.server = None
+        self.address = None
+        self.connections = set()     # tasks handling open connections
+        self.n_ballots = 0
+        self.receipt_seconds = 0.0   # time taken making their receipts
+
+    async def start(self, host="127.0.0.1", port=0, path=None):
+        """ Start listening, on Unix socket path if given, else on TCP.
+
+        (With port 0, some free port is used.)  Return the address
+        listened on: path, or (host, port).
+        """
+        if path is not None:
+            self.server = await asyncio.start_unix_server(
+                self.handle_connection, path=path)
+            self.address = path
+        else:
+            self.server = await asyncio.start_server(
+                self.handle_connection, host=host, port=port)
+            self.address = self.server.sockets[0].getsockname()[:2]
+        return self.address
+
+    async def close(self):
+        """ Stop listening (removing Unix socket, if any), once the
+        open connections are finished.
+        """
+        self.server.close()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        await self.server.wait_closed()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
+
+    async def handle_connection(self, reader, writer):
+        """ Handle requests on one connection (from one tablet).
+
+        The connection is closed when the tablet closes it, or when it
+        breaks the framing (see read_frame).
+        """
+        task = asyncio.current_task()
+        self.connections.add(task)
+        try:
+            while True:
+                request = await read_frame(reader)
+                if request is None:
+                    break
+                write_frame(writer, self.handle_request(request))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass                # tablet went away, or sent a bad frame
+        finally:
+            self.connections.discard(task)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    def handle_request(self, request):
+        """ Ingest ballot carried by request; return response (bytes).
+
+        A request that cannot be opened gets an error response in the
+        clear; a ballot that is not accepted gets an encrypted one.
+        """
+        election = self.election
+        try:
+            (sym_key, msg) = open_request(election.intake_pk,
+                                          election.intake_sk, request)
+        except REQUEST_ERRORS as error:
+            response = {"error": "bad request: " + repr(error)}
+            return json.dumps(response).encode()
+        try:
+            if not isinstance(msg, dict):
+                raise sv_election.BallotError("request is not a dict")
+            receipt_seconds = election.receipt_seconds
+            receipt_hash = election.ingest_ballot(msg["race_id"],
+                                                  msg["px"],
+                                                  msg["ballot"])
+            response = {"receipt": receipt_hash}
+            self.n_ballots += 1
+            self.receipt_seconds += \
+                election.receipt_seconds - receipt_seconds
+        except REQUEST_ERRORS as error:
+            response = {"error": repr(error)}
+        ct = sv.sym_enc(sym_key, json.dumps(response).encode())
+        return json.dumps({"ct": sv.bytes2base64(ct)}).encode()
+
+##############################################################################
+# tablet client
+##############################################################################
+
+class TabletClient:
+    """ A simulated tablet, sending ballots to an intake server. """
+
+    def __init__(self, intake_pk, tablet_id):
+        """ Initialize tablet, sending ballots encrypted for intake_pk
+        (the public key of the intake server); tablet_id is a string
+        identifying it.
+        """
+        self.intake_pk = intake_pk
+        self.rand_name = "tablet:" + tablet_id
+        sv.init_randomness_source(self.rand_name)
+        self.reader = None
+        self.writer = None
+
+    async def connect(self, address):
+        """ Connect to intake server at address (path, or (host, port)). """
+        if isinstance(address, str):
+            (self.reader, self.writer) = \
+                await asyncio.open_unix_connection(path=address)
+        else:
+            (self.reader, self.writer) = \
+                await asyncio.open_connection(address[0], address[1])
+
+    async def close(self):
+        """ Close connection to intake server. """
+        self.writer.close()
+        await self.writer.wait_closed()
+
+    async def submit(self, race_id, px, ballot):
+        """ Send ballot for race_id at position px; return receipt hash. """
+        sym_key = sv.sym_keygen(self.rand_name)
+        msg = {"race_id": race_id, "px": px, "ballot": ballot}
+        write_frame(self.writer, seal_request(self.intake_pk, sym_key, msg))
+        await self.writer.drain()
+        response = await read_frame(self.reader)
+        assert response is not None, "intake server closed connection"
+        response = json.loads(response.decode())
+        assert "error" not in response, response.get("error")
+        ct = sv.base64_2_bytes(response["ct"])
+        response = json.loads(sv.sym_dec(sym_key, ct).decode())
+        assert "error" not in response, response.get("error")
+        return response["receipt"]
+
+##############################################################################
+# casting via intake server
+##############################################################################
+
+def percentile(values, q):
+    """ Return q-th percentile (0 <= q <= 100) of list values (nearest rank).
+    """
+    assert len(values) > 0 and 0 <= q <= 100
+    values = sorted(values)
+    rank = max(1, -(-len(values) * q // 100))     # ceiling
+    return values[int(rank) - 1]
+
+def latency_summary(latencies, seconds):
+    """ Return dict summarizing latencies (in seconds) of ballots cast
+    over the given number of seconds.
+    """
+    n = len(latencies)
+    return {"ballots": n,
+            "seconds": seconds,
+            "ballots_per_second": n / seconds if seconds > 0 else 0.0,
+            "latency_p50_ms": 1000 * percentile(latencies, 50) if n else 0.0,
+            "latency_p99_ms": 1000 * percentile(latencies, 99) if n else 0.0}
+
+def voter_ballot_choices(election):
+    """ Return list of (voter, [(race, choice_str), ...]), one per voter.
+
+    Choices are made here, in voter order, as in Election.run_election,
+    so that the outcome does not depend on the order ballots arrive in.
+    """
+    choices = []
+    for voter in election.voters:
+        voter_choices = []
+        for race in election.races:
+            if race.write_in_for is None:
+                voter_choices.extend(voter.vote_choices(race))
+        choices.append((voter, voter_choices))
+    return choices
+
+def tablet_setup(election):
+    """ Return what a tablet process needs to know of election (a dict,
+    which can be sent to another process).
+    """
+    return {"intake_pk": election.intake_pk,
+            "hash_suite": sv.hash_suite['name'],
+            "small_modulus": sv.small_modulus_parameters['enabled'],
+            "row_list": election.server.row_list,
+            "threshold": election.server.threshold,
+            "ballot_id_len": election.ballot_id_len}
+
+def tablet_work(work):
+    """ Return (items, rand_states) for a tablet process, for work (list
+    of (due, voter, race, choice_str)): a list of (due, rand_name, px,
+    race_id, race_modulus, choice_int), one per ballot, and the state of
+    the randomness sources of the voters (see sv_voter.make_ballot).
+
+    Here due is None, or the time (in seconds after casting starts) at
+    which the ballot is due to be cast.
+    """
+    items = []
+    rand_states = dict()
+    for (due, voter, race, choice_str) in work:
+        items.append((due, voter.rand_name, voter.px, race.race_id,
+                      race.race_modulus, race.choice_str2int(choice_str)))
+        rand_states[voter.rand_name] = sv.randomness_sources[voter.rand_name]
+    return (items, rand_states)
+
+def tablet_process_init(barrier):
+    """ Initialize a tablet process (of a tablet_pool). """
+    tablet_parameters['barrier'] = barrier
+
+def tablet_pool(n_tablets):
+    """ Return pool of n_tablets processes, one for each tablet (as each
+    tablet waits for all of them to start; see tablet_process).
+    """
+    context = multiprocessing.get_context("spawn")
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=n_tablets, mp_context=context,
+        initializer=tablet_process_init,
+        initargs=(context.Barrier(n_tablets),))
+
+def tablet_process(setup, tablet_id, address, items, rand_states):
+    """ Cast ballots for items (see tablet_work) from a tablet, in a
+    process of a tablet_pool, once all tablets are connected.
+
+    A ballot with a due time is not made before then, and its latency
+    is measured from then; otherwise latency is measured from the start
+    of making the ballot.  Return (results, rand_states, start, end): a
+    (ballot, receipt_hash, latency) triple for each item, the state of
+    the randomness sources afterwards, and the (wall clock) time casting
+    started and ended.
+    """
+    sv.set_hash_suite(setup["hash_suite"])
+    sv.set_small_modulus_fast_path(setup["small_modulus"])
+    sv.randomness_sources.update(rand_states)
+    return asyncio.run(tablet_task(setup, tablet_id, address, items,
+                                   list(rand_states.keys())))
+
+async def tablet_task(setup, tablet_id, address, items, rand_names):
+    """ Cast ballots for items from tablet (see tablet_process). """
+    tablet = TabletClient(setup["intake_pk"], tablet_id)
+    await tablet.connect(address)
+    tablet_parameters['barrier'].wait(TABLET_START_TIMEOUT)
+    start = time.time()
+    start_counter = time.perf_counter()
+    results = []
+    for (due, rand_name, px, race_id, race_modulus, choice_int) in items:
+        if due is None:
+            due = time.perf_counter()
+        else:
+            due = start_counter + due
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        ballot = sv_voter.make_ballot(rand_name, px, choice_int,
+                                      race_modulus, setup["row_list"],
+                                      setup["threshold"],
+                                      setup["ballot_id_len"])
+        receipt_hash = await tablet.submit(race_id, px, ballot)
+        results.append((ballot, receipt_hash, time.perf_counter() - due))
+    end = time.time()
+    await tablet.close()
+    rand_states = dict([(rand_name, sv.randomness_sources[rand_name])
+                        for rand_name in rand_names])
+    return (results, rand_states, start, end)
+
+async def cast_from_tablets(election, address, works):
+    """ Cast ballots from tablets to the intake server at address, one
+    tablet for each work in works (see tablet_work), each in a process
+    of its own; then save the receipts with the voters.
+
+    Return (latencies, seconds): the latency of each ballot (see
+    tablet_process), and the time taken, from when the tablets start
+    casting (once all are connected) till the last one is done.
+    """
+    setup = tablet_setup(election)
+    loop = asyncio.get_running_loop()
+    futures = []
+    with tablet_pool(len(works)) as pool:
+        for t, work in enumerate(works):
+            (items, rand_states) = tablet_work(work)
+            futures.append(loop.run_in_executor(pool, tablet_process,
+                                                setup, str(t), address,
+                                                items, rand_states))
+        outcomes = await asyncio.gather(*futures)
+    latencies = []
+    for work, (results, rand_states, start, end) in zip(works, outcomes):
+        sv.randomness_sources.update(rand_states)
+        for (due, voter, race, choice_str), (ballot, receipt_hash,
+                                             latency) in zip(work, results):
+            voter.save_receipt(race, ballot, receipt_hash)
+            latencies.append(latency)
+    seconds = max([outcome[3] for outcome in outcomes]) - \
+        min([outcome[2] for outcome in outcomes])
+    return (latencies, seconds)
+
+async def cast_via_intake(election, n_tablets=1, path=None):
+    """ Cast votes of all voters via an intake server, from n_tablets
+    concurrent tablets (voter number v uses tablet v mod n_tablets),
+    each in a process of its own.
+
+    Listen on Unix socket path if given, else on a local TCP port.
+    Casting must be open.  Return summary (see latency_summary); latency
+    is from start of making a ballot to receipt of its voter receipt,
+    and the time taken is from when the tablets start casting (once all
+    are connected) till the last one is done.
+    """
+    assert isinstance(n_tablets, int) and n_tablets > 0
+    intake = IntakeServer(election)
+    address = await intake.start(path=path)
+    choices = voter_ballot_choices(election)
+    works = [[(None, voter, race, choice_str)
+              for (voter, voter_choices) in choices[t::n_tablets]
+              for (race, choice_str) in voter_choices]
+             for t in range(n_tablets)]
+    (latencies, seconds) = await cast_from_tablets(election, address, works)
+    await intake.close()
+    assert intake.n_ballots == len(latencies)
+    return latency_summary(latencies, seconds)
+
+def run_election_via_intake(election, n_tablets=1, path=None):
+    """ Run a (simulated) election, casting votes via an intake server.
+
+    Return summary of casting (see cast_via_intake).
+    """
+    election.start_election()
+    summary = asyncio.run(cast_via_intake(election, n_tablets, path))
+    election.finish_election()
+    return summary
+
+def main():
+    """ Run (and verify) an election with votes cast via intake server. """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("election_id", nargs="?",
+                        help="election_id of election_id.parameters.txt")
+    parser.add_argument("--tablets", type=int, default=4,
+                        help="number of concurrent tablets (default 4)")
+    parser.add_argument("--unix", metavar="PATH", default=None,
+                        help="listen on Unix socket PATH (default: TCP)")
+    args = parser.parse_args()
+
+    election_parameters = sv_main.default_election_parameters
+    if args.election_id is not None:
+        election_parameters = sv.load(args.election_id + ".parameters.txt")
+    election = sv_election.Election(election_parameters)
+    summary = run_election_via_intake(election, args.tablets, args.unix)
+
+    sbb_filename = election_parameters["election_id"] + ".sbb.txt"
+    election.sbb.print_sbb(public=True, sbb_filename=sbb_filename)
+    sv_verifier.verify(sbb_filename)
+    print("casting via intake server (%d tablets):" % args.tablets)
+    for key in sorted(summary.keys()):
+        print("    ", key, "=", summary[key])
+
+if __name__ == "__main__":
+    assert sys.version_info[0] == 3
+    main()
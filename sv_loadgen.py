@@ -0,0 +1,190 @@
+# sv_loadgen.py
+# python3
+
+""" Load generator for ballot casting in simulated split-value election.
+
+    Simulates a number of tablets casting ballots, at a target rate,
+    into an election via the intake server of sv_intake.py, and reports
+    sustained throughput, latency percentiles per cast, and the cost of
+    generating a voter receipt (as timed in the intake server).  Each
+    tablet runs in a process of its own, so that the load is driven
+    from outside the process of the intake server.
+
+    Usage:
+        python3 sv_loadgen.py [election_id] [--tablets N] [--rate R]
+                              [--voters N] [--choices FILE] [--unix PATH]
+                              [--finish]
+    where election description is given in election_id.parameters.txt
+    (as for sv_main.py; default election if not given).
+
+    --rate R     target rate, in ballots per second, summed over all
+                 tablets (default: as fast as possible)
+    --voters N   number of voters (overrides n_voters of the election)
+    --choices FILE
+                 json file giving a choice distribution for some races:
+                     {race_id: {choice: weight, ...}, ...}
+                 with positive integer weights; a choice may also be the
+                 text of a write-in.  Other races use Race.random_choice.
+    --finish     also finish (mix, tally, prove) and verify the election
+
+    With a target rate, ballot number m (counting over all tablets) is
+    due at time m/R after the start (once all tablets are connected),
+    and its latency is measured from then (so that time spent waiting
+    behind slow ballots is counted).  Otherwise latency is measured from
+    the start of making the ballot.
+"""
+
+# MIT open-source license.
+# (See https://github.com/ron-rivest/split-value-voting.git)
+
+import argparse
+import asyncio
+import sys
+
+import sv
+import sv_election
+import sv_intake
+import sv_main
+import sv_verifier
+
+##############################################################################
+# choice distributions
+##############################################################################
+
+def make_chooser(election, distribution=None):
+    """ Return function mapping race to a choice (string) for that race.
+
+    Here distribution is None, or a dict mapping (some) race_ids to dicts
+    of {choice: weight}, with positive integer weights; races without a
+    distribution use Race.random_choice.
+    """
+    if distribution is None:
+        distribution = dict()
+    tables = dict()
+    for race in election.races:
+        weights = distribution.get(race.race_id)
+        if weights is None:
+            continue
+        assert race.write_in_for is None
+        table = []
+        for choice_str in sorted(weights.keys()):
+            weight = weights[choice_str]
+            assert isinstance(weight, int) and weight > 0
+            assert race.is_valid_choice(choice_str) and \
+                choice_str != race.write_in_choice(), choice_str
+            table.append((choice_str, weight))
+        rand_name = "loadgen:" + race.race_id
+        sv.init_randomness_source(rand_name)
+        tables[race.race_id] = (table, sum(weights.values()), rand_name)
+    assert set(distribution.keys()) <= set(tables.keys())
+
+    def chooser(race):
+        """ Return a choice for race. """
+        if race.race_id not in tables:
+            return race.random_choice()
+        (table, total, rand_name) = tables[race.race_id]
+        x = sv.get_random_from_source(rand_name, total)
+        for (choice_str, weight) in table:
+            if x < weight:
+                return choice_str
+            x -= weight
+        assert False
+    return chooser
+
+def make_schedule(election, chooser):
+    """ Return list of (voter, race, choice_str) triples, one per ballot.
+
+    Choices are made here, in voter order, before casting starts.
+    """
+    schedule = []
+    for voter in election.voters:
+        for race in election.races:
+            if race.write_in_for is None:
+                for (vote_race, choice_str) in \
+                        voter.vote_choices(race, chooser(race)):
+                    schedule.append((voter, vote_race, choice_str))
+    return schedule
+
+##############################################################################
+# casting under load
+##############################################################################
+
+async def cast_under_load(election, n_tablets=1, rate=None,
+                          distribution=None, path=None):
+    """ Cast votes of all voters via intake server from n_tablets tablets,
+    each in a process of its own (see sv_intake.cast_from_tablets), at
+    target rate (ballots per second over all tablets; None for as fast
+    as possible), with choices from distribution (see make_chooser).
+
+    Casting must be open.  Return summary: that of sv_intake.latency_summary,
+    plus the target rate, the number of tablets and the mean time the
+    intake server took to generate a receipt.
+    """
+    assert isinstance(n_tablets, int) and n_tablets > 0
+    assert rate is None or rate > 0
+    intake = sv_intake.IntakeServer(election)
+    address = await intake.start(path=path)
+    schedule = make_schedule(election, make_chooser(election, distribution))
+    # ballots of voter number v are cast from tablet v mod n_tablets;
+    # ballot number m (over all tablets) is due m / rate after the start
+    works = [[] for t in range(n_tablets)]
+    voter_numbers = {voter.voter_id: v
+                     for v, voter in enumerate(election.voters)}
+    for m, (voter, race, choice_str) in enumerate(schedule):
+        t = voter_numbers[voter.voter_id] % n_tablets
+        due = None if rate is None else m / rate
+        works[t].append((due, voter, race, choice_str))
+    (latencies, seconds) = await sv_intake.cast_from_tablets(election,
+                                                             address, works)
+    await intake.close()
+    summary = sv_intake.latency_summary(latencies, seconds)
+    summary["target_ballots_per_second"] = rate
+    summary["tablets"] = n_tablets
+    summary["receipt_mean_ms"] = \
+        1000 * intake.receipt_seconds / max(1, intake.n_ballots)
+    return summary
+
+def main():
+    """ Run load generator, and print summary. """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("election_id", nargs="?",
+                        help="election_id of election_id.parameters.txt")
+    parser.add_argument("--tablets", type=int, default=4,
+                        help="number of concurrent tablets (default 4)")
+    parser.add_argument("--rate", type=float, default=None,
+                        help="target ballots per second (default: max)")
+    parser.add_argument("--voters", type=int, default=None,
+                        help="number of voters (default: from election)")
+    parser.add_argument("--choices", metavar="FILE", default=None,
+                        help="json file giving choice distributions")
+    parser.add_argument("--unix", metavar="PATH", default=None,
+                        help="listen on Unix socket PATH (default: TCP)")
+    parser.add_argument("--finish", action="store_true",
+                        help="also finish and verify the election")
+    args = parser.parse_args()
+
+    election_parameters = dict(sv_main.default_election_parameters)
+    if args.election_id is not None:
+        election_parameters = sv.load(args.election_id + ".parameters.txt")
+    if args.voters is not None:
+        election_parameters["n_voters"] = args.voters
+    distribution = None
+    if args.choices is not None:
+        distribution = sv.load(args.choices)
+
+    election = sv_election.Election(election_parameters)
+    election.start_election()
+    summary = asyncio.run(cast_under_load(election, args.tablets, args.rate,
+                                          distribution, args.unix))
+    if args.finish:
+        election.finish_election()
+        sbb_filename = election_parameters["election_id"] + ".sbb.txt"
+        election.sbb.print_sbb(public=True, sbb_filename=sbb_filename)
+        sv_verifier.verify(sbb_filename)
+    print("load generator results (%d voters):" % election.n_voters)
+    for key in sorted(summary.keys()):
+        print("    ", key, "=", summary[key])
+
+if __name__ == "__main__":
+    assert sys.version_info[0] == 3
+    main()
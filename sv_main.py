@@ -11,16 +11,42 @@ Usage:
   or
         python3 sv_main.py election_id
         where election description is given in election_id.parameters.txt
+Options:
+        --comm    write report of inter-server communication
+                  (see sv_comm.py) to election_id.comm.json
+        --stats   write time and operation counts of each phase of
+                  election and verification (see sv_stats.py) to
+                  election_id.stats.json
+        --memprofile
+                  as --stats, also recording peak and retained memory
+                  of each phase, and its top allocation sites (this is
+                  slow); a summary is printed
+        --trace   write spans of election and verification (see
+                  sv_trace.py) as Chrome trace-event json to
+                  election_id.trace.json, and as collapsed stacks (for
+                  flamegraphs) to election_id.collapsed.txt
+        --checkpoint
+                  save state of election after each phase (see
+                  sv_checkpoint.py) to election_id.checkpoint.gz
+        --resume  resume election from election_id.checkpoint.gz,
+                  running the phases after the last one completed
+                  (and saving checkpoints as with --checkpoint)
 """
 
 # MIT open-source license.
 # (See https://github.com/ron-rivest/split-value-voting.git)
 
+import argparse
 import sys
 assert sys.version_info[0] == 3
 
 import sv
+import sv_checkpoint
+import sv_comm
+import sv_distributed
 import sv_election
+import sv_stats
+import sv_trace
 import sv_verifier
 
 default_election_parameters = {
@@ -38,6 +64,23 @@ default_election_parameters = {
     # optional parameters:
     # number of hex digits in ballot id (default 32)
     "ballot_id_len": 32,
+    # how choices are encoded as integers (default "bytes"):
+    # "bytes" encodes the choice string itself, while "compact" encodes
+    # the index of the choice, and puts the text of write-ins into a
+    # separate write-in table, keeping race_modulus small
+    "choice_encoding": "bytes",
+    # method used to stretch the hash of the SBB from which the
+    # verifier challenges are derived, with the hash of the hash suite
+    # (default "iterate", the original python loop; "pbkdf2" does the
+    # work at C speed)
+    "challenge_stretch": "iterate",
+    # hash suite used for hashing, commitments and pseudo-random
+    # generation (default "sha256"; "blake2b" and "blake2s" are faster)
+    "hash_suite": "sha256",
+    # how the server array is simulated (default "simulated", as one
+    # object; "distributed" runs each server as its own process, and
+    # reports the CPU time, memory and bytes sent of each)
+    "server_mode": "simulated",
     # number of spaces per tab in json output (>=0, default 0)
     # setting this to 0 reduces readability of SBB output, but
     # also reduces SBB size by roughly 25%
@@ -46,13 +89,33 @@ default_election_parameters = {
     "json_indent": 1
 }
 
-def get_election_parameters():
+def get_arguments():
+    """ Return command-line arguments (see usage above). """
+    parser = argparse.ArgumentParser(description="Simulate an election.")
+    parser.add_argument("election_id", nargs="?", default=None,
+                        help="election_id of election_id.parameters.txt")
+    parser.add_argument("--comm", action="store_true",
+                        help="write election_id.comm.json")
+    parser.add_argument("--stats", action="store_true",
+                        help="write election_id.stats.json")
+    parser.add_argument("--memprofile", action="store_true",
+                        help="as --stats, also profiling memory")
+    parser.add_argument("--trace", action="store_true",
+                        help="write election_id.trace.json and "
+                             "election_id.collapsed.txt")
+    parser.add_argument("--checkpoint", action="store_true",
+                        help="write election_id.checkpoint.gz after "
+                             "each phase")
+    parser.add_argument("--resume", action="store_true",
+                        help="resume from election_id.checkpoint.gz")
+    return parser.parse_args()
+
+def get_election_parameters(election_id=None):
     """ Get election parameters if available, from a file.
         Else use default.
     """
     election_parameters = default_election_parameters
-    if len(sys.argv) > 1:
-        election_id = sys.argv[1]
+    if election_id is not None:
         election_parameter_filename = election_id + ".parameters.txt"
         election_parameters = sv.load(election_parameter_filename)
     return election_parameters
@@ -60,22 +123,52 @@ def get_election_parameters():
 def do_election():
     """ Do (simulate) an election. """
 
-    election_parameters = get_election_parameters()
+    args = get_arguments()
+    election_parameters = get_election_parameters(args.election_id)
     print("starting election (simulation).")
     print("election parameters:")
     for key in sorted(election_parameters.keys()):
         print("    ", key, "=", election_parameters[key])
-    election = sv_election.Election(election_parameters)
-
-    election.run_election()
+    sv_comm.set_comm_accounting(args.comm)
+    sv_stats.set_stats(args.stats or args.memprofile, args.memprofile)
+    sv_trace.set_trace(args.trace)
+    checkpoint_filename = \
+        sv_checkpoint.checkpoint_filename(election_parameters["election_id"])
+    if args.checkpoint or args.resume:
+        sv_checkpoint.set_checkpoint(checkpoint_filename)
+    if args.resume:
+        election = sv_checkpoint.resume_election(checkpoint_filename)
+    else:
+        election = sv_election.Election(election_parameters)
+        election.run_election()
+    if election.server.process_stats is not None:
+        sv_distributed.print_process_stats(election.server.process_stats)
 
     sbb_filename = election_parameters["election_id"] + ".sbb.txt"
     election.sbb.print_sbb(public=True, sbb_filename=sbb_filename)
+    if args.comm:
+        comm_filename = election_parameters["election_id"] + ".comm.json"
+        sv_comm.write_comm_report(comm_filename, election.election_id)
+        print("inter-server communication report saved on file:",
+              comm_filename)
 
     print("election finished.")
     print()
     print("beginning verification...")
     sv_verifier.verify(sbb_filename)
+    if args.memprofile:
+        sv_stats.print_memory_report()
+    if args.stats or args.memprofile:
+        stats_filename = election_parameters["election_id"] + ".stats.json"
+        sv_stats.write_stats_report(stats_filename, election.election_id)
+        print("phase statistics saved on file:", stats_filename)
+    if args.trace:
+        trace_filename = election_parameters["election_id"] + ".trace.json"
+        sv_trace.write_chrome_trace(trace_filename)
+        collapsed_filename = \
+            election_parameters["election_id"] + ".collapsed.txt"
+        sv_trace.write_collapsed_stacks(collapsed_filename)
+        print("trace saved on files:", trace_filename, collapsed_filename)
     print("done. (", election_parameters['election_id'], ")")
 
 if __name__ == "__main__":
@@ -0,0 +1,256 @@
+# sv_microbench.py
+# python3
+
+""" Micro-benchmarks for the primitives of sv.py.
+
+    Measures operations per second of the cryptographic and encoding
+    primitives that the election and verifier spend their time in:
+        secure_hash, com, get_random_from_source, random_permutation,
+        share, lagrange, get_sv_pair, bytes2hex, bytes2int, int2bytes,
+        make_prime, and dumps and load on board-shaped data,
+    across input sizes and race moduli.  Uses only the standard library
+    (timeit).
+
+    Usage:
+        python3 sv_microbench.py [--only NAME ...] [--repeat N]
+                                 [--hash-suite NAME] [--output FILE]
+
+    --only NAME ...    run only the named benchmarks (see BENCHMARKS)
+    --repeat N         time each case N times, keeping the best (default 3)
+    --hash-suite NAME  hash suite to use (see sv.HASH_SUITES;
+                       default "sha256")
+    --output FILE      also save results (json) to FILE
+
+    Each case is timed with timeit: the number of calls is chosen so that
+    one timing takes at least 0.2 seconds (timeit.Timer.autorange), and
+    the best of the repeated timings gives the rate.
+"""
+
+# MIT open-source license.
+# (See https://github.com/ron-rivest/split-value-voting.git)
+
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+
+import sv
+
+RAND_NAME = "microbench"
+
+# race moduli: as for a yes/no race (compact encoding), for choices of
+# up to 8 bytes, and for 16-character write-ins ("bytes" encoding)
+MODULI = [("2^16", sv.make_prime(256**2)),
+          ("2^64", sv.make_prime(256**8)),
+          ("2^136", sv.make_prime(256**17))]
+
+BYTE_SIZES = [32, 1024, 65536]
+
+temp_filenames = []             # removed after benchmarks are run
+
+##############################################################################
+# cases
+##############################################################################
+
+# Each benchmark function returns a list of cases (params, func), where
+# params describes the case and func (taking no arguments) does one
+# operation.
+
+def bench_secure_hash():
+    """ secure_hash of inputs of various sizes. """
+    cases = []
+    for size in BYTE_SIZES:
+        x = bytes(size)
+        cases.append(("%d bytes" % size, lambda x=x: sv.secure_hash(x)))
+    return cases
+
+def bench_com():
+    """ com of values of various sizes. """
+    r_b64 = sv.bytes2base64(bytes(sv.SECPARAM_SYMMETRIC // 8))
+    cases = []
+    for size in (16, 1024):
+        v = bytes(size)
+        cases.append(("%d bytes" % size,
+                      lambda v=v: sv.com(v, r_b64)))
+    return cases
+
+def bench_get_random_from_source():
+    """ get_random_from_source, as bytes and modulo race moduli. """
+    cases = [("bytes", lambda: sv.get_random_from_source(RAND_NAME))]
+    for (label, M) in MODULI:
+        cases.append(("mod " + label,
+                      lambda M=M: sv.get_random_from_source(RAND_NAME, M)))
+    return cases
+
+def bench_random_permutation():
+    """ random_permutation of various sizes. """
+    return [("n=%d" % n, lambda n=n: sv.random_permutation(n, RAND_NAME))
+            for n in (100, 10000)]
+
+def bench_share():
+    """ share for various race moduli and (n, t). """
+    cases = []
+    for (label, M) in MODULI:
+        for (n, t) in ((3, 2), (5, 3)):
+            cases.append(("mod %s n=%d t=%d" % (label, n, t),
+                          lambda M=M, n=n, t=t:
+                          sv.share(M // 3, n, t, RAND_NAME, M)))
+    return cases
+
+def bench_lagrange():
+    """ lagrange for various race moduli and (n, t). """
+    cases = []
+    for (label, M) in MODULI:
+        for (n, t) in ((3, 2), (5, 3)):
+            share_list = sv.share(M // 3, n, t, RAND_NAME, M)
+            cases.append(("mod %s n=%d t=%d" % (label, n, t),
+                          lambda M=M, n=n, t=t, share_list=share_list:
+                          sv.lagrange(share_list, n, t, M)))
+    return cases
+
+def bench_get_sv_pair():
+    """ get_sv_pair for various race moduli. """
+    return [("mod " + label,
+             lambda M=M: sv.get_sv_pair(M // 3, RAND_NAME, M))
+            for (label, M) in MODULI]
+
+def bench_conversions():
+    """ bytes2hex, bytes2int and int2bytes of various sizes. """
+    cases = []
+    for size in BYTE_SIZES[:2]:
+        x = bytes(range(256)) * (size // 256) + bytes(range(size % 256))
+        i = sv.bytes2int(x)
+        cases.append(("bytes2hex %d bytes" % size,
+                      lambda x=x: sv.bytes2hex(x)))
+        cases.append(("bytes2int %d bytes" % size,
+                      lambda x=x: sv.bytes2int(x)))
+        cases.append(("int2bytes %d bytes" % size,
+                      lambda i=i, size=size: sv.int2bytes(i, size)))
+    return cases
+
+def bench_make_prime():
+    """ make_prime (not from PRIME_TABLE, nor cache) of various sizes. """
+    def make_prime_uncached(n):
+        """ make_prime(n), with n removed from cache first. """
+        sv.prime_cache.pop(n, None)
+        return sv.make_prime(n)
+    return [("%d bits" % bits,
+             lambda n=3 * 2**(bits-2) + 1: make_prime_uncached(n))
+            for bits in (32, 64, 128, 256)]
+
+def make_board(n_voters):
+    """ Return SBB-shaped data: a board with a casting:ballot entry for
+    each of n_voters voters in one race, 3 rows.
+    """
+    r_b64 = sv.bytes2base64(bytes(sv.SECPARAM_HASH_OUTPUT // 8))
+    board = [["setup:start", {"election_id": "microbench"}]]
+    for p in sv.p_list(n_voters):
+        cast_vote = dict()
+        for i in "abc":
+            cast_vote[i] = {"ballot_id": "0" * 32, "cu": r_b64, "cv": r_b64}
+        board.append(["casting:ballot", {"race_id": "race", "p": p,
+                                         "cast_vote": cast_vote,
+                                         "receipt": r_b64}])
+    board.append(["election:done.", {"election_id": "microbench"}])
+    return board
+
+def bench_dumps_load():
+    """ dumps and load of board-shaped data of various sizes. """
+    cases = []
+    for n_voters in (100, 10000):
+        board = make_board(n_voters)
+        (fd, filename) = tempfile.mkstemp(suffix=".sbb.txt")
+        os.close(fd)
+        sv.dump(board, filename)
+        cases.append(("dumps %d voters" % n_voters,
+                      lambda board=board: sv.dumps(board)))
+        cases.append(("load %d voters" % n_voters,
+                      lambda filename=filename: sv.load(filename)))
+        temp_filenames.append(filename)
+    return cases
+
+BENCHMARKS = [("secure_hash", bench_secure_hash),
+              ("com", bench_com),
+              ("get_random_from_source", bench_get_random_from_source),
+              ("random_permutation", bench_random_permutation),
+              ("share", bench_share),
+              ("lagrange", bench_lagrange),
+              ("get_sv_pair", bench_get_sv_pair),
+              ("conversions", bench_conversions),
+              ("make_prime", bench_make_prime),
+              ("dumps_load", bench_dumps_load)]
+
+##############################################################################
+# running
+##############################################################################
+
+def ops_per_second(func, repeat=3):
+    """ Return rate (calls per second) of func, best of repeat timings. """
+    timer = timeit.Timer(func)
+    (number, seconds) = timer.autorange()
+    best = min([seconds] + timer.repeat(repeat - 1, number))
+    return number / best
+
+def run_benchmarks(names=None, repeat=3, f_out=None):
+    """ Run benchmarks with given names (all if None); print each result
+    as it is found, and return list of (name, params, ops_per_second).
+    """
+    assert isinstance(repeat, int) and repeat > 0
+    known_names = [name for (name, bench) in BENCHMARKS]
+    assert names is None or set(names) <= set(known_names), names
+    saved_sources = dict(sv.randomness_sources)
+    saved_prime_cache_filename = sv.prime_cache_parameters['filename']
+    sv.set_prime_cache_filename(None)       # don't touch cache on disk
+    sv.init_randomness_source(RAND_NAME)
+    results = []
+    print("%-24s %-28s %14s" % ("benchmark", "case", "ops/sec"),
+          file=f_out)
+    try:
+        for (name, bench) in BENCHMARKS:
+            if names is not None and name not in names:
+                continue
+            for (params, func) in bench():
+                rate = ops_per_second(func, repeat)
+                print("%-24s %-28s %14.1f" % (name, params, rate),
+                      file=f_out, flush=True)
+                results.append((name, params, rate))
+    finally:
+        for filename in temp_filenames:
+            os.remove(filename)
+        del temp_filenames[:]
+        sv.set_prime_cache_filename(saved_prime_cache_filename)
+        sv.randomness_sources.clear()
+        sv.randomness_sources.update(saved_sources)
+    return results
+
+def main():
+    """ Run micro-benchmarks, and print (and save) results. """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--only", metavar="NAME", nargs="+", default=None,
+                        choices=[name for (name, bench) in BENCHMARKS],
+                        help="run only the named benchmarks")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="timings per case, keeping best (default 3)")
+    parser.add_argument("--hash-suite", default="sha256",
+                        choices=sorted(sv.HASH_SUITES.keys()),
+                        help="hash suite (default sha256)")
+    parser.add_argument("--output", metavar="FILE", default=None,
+                        help="also save results (json) to FILE")
+    args = parser.parse_args()
+
+    sv.set_hash_suite(args.hash_suite)
+    print("hash suite:", args.hash_suite)
+    results = run_benchmarks(args.only, args.repeat)
+    if args.output is not None:
+        sv.dump({"hash_suite": args.hash_suite,
+                 "python": sys.version.split()[0],
+                 "results": [{"benchmark": name, "case": params,
+                              "ops_per_second": rate}
+                             for (name, params, rate) in results]},
+                args.output)
+        print("micro-benchmark results saved on file:", args.output)
+
+if __name__ == "__main__":
+    assert sys.version_info[0] == 3
+    main()
@@ -0,0 +1,565 @@
+# sv_planner.py
+# python3
+
+""" Cost estimator for simulated split-value elections.
+
+    Predicts, before an election is run, what it will cost: the number
+    of basic operations (commitments (keyed hashes), hashes, random
+    draws, secrets shared and reconstructed; see sv.op_counts), the
+    time of each phase of the election, prover and verifier (see
+    sv_stats.py), their peak memory, and the size of the SBB; and
+    suggests settings of n_reps and of parallelism.
+
+    Usage:
+        python3 sv_planner.py [election_id] [--budget SECONDS]
+                              [--output FILE]
+    where election description is given in election_id.parameters.txt
+    (as for sv_main.py; default election if not given).
+
+    --budget SECONDS  suggest the largest n_reps for which the election
+                      and its verification take at most SECONDS
+    --output FILE     also save the plan (json) to FILE
+
+    Model: the number of each basic operation done in each phase is
+    computed from the shape of the election (see op_counts): the number
+    of voters, copies (n_reps), races, rows, columns and threshold.  The
+    time of a phase is then
+        sum of (count of op) * (cost of op), over the basic operations,
+      + the rest of the work of the phase (bookkeeping, serialization),
+      + the stretched hash, for the phases doing it (STRETCH_PHASES).
+    The rest of the work of a phase, and the size of each kind of SBB
+    entry, are taken to be a + b * units, where the units are the
+    number of voters, the number of voters times n_reps, or the size of
+    the SBB (or there are none), as given by PHASE_GROWTH and
+    HEADER_GROWTH; the peak memory of a phase is taken to be in
+    proportion to its units.
+
+    Calibration, on this machine: the cost of each basic operation is
+    measured by timing it on its own (see op_costs); the stretched hash
+    is timed once (see stretch_seconds); and small elections of the
+    same shape (with CALIBRATION_VOTERS voters), and their verification,
+    are run (with the stretch shortened) to measure the rest of the work
+    of each phase and the SBB size, and the larger one once more with
+    tracemalloc to measure peak memory (Python allocations only).  This
+    takes a few seconds.  Predictions for very large elections are
+    extrapolations, and should be checked by sv_bench.py.
+"""
+
+# MIT open-source license.
+# (See https://github.com/ron-rivest/split-value-voting.git)
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+import sv
+import sv_election
+import sv_main
+import sv_stats
+import sv_verifier
+
+CALIBRATION_VOTERS = (16, 48)
+CALIBRATION_STRETCH_WORK = 1    # work of stretched hash while calibrating
+OP_REPEATS = 200                # calls timed per basic operation
+MAX_REPS = 26                   # (see Election.__init__)
+PARALLEL_MIN_SECONDS = 5.0      # mix worth parallelizing above this
+OPS = ("com", "secure_hash", "random", "share", "lagrange")
+STRETCH_PHASES = ("prove:verifier_challenges",
+                  "verify:read_verifier_challenges")
+
+# how the rest of the work and the peak memory of a phase grow:
+# "voters" (with n_voters), "copies" (with n_voters * n_reps), "sbb"
+# (with the size of the SBB) or "fixed"; phases not listed: "copies"
+# (see growth_units)
+PHASE_GROWTH = {"cast": "voters",
+                "prove:verifier_challenges": "sbb",
+                "verify:load": "sbb",
+                "verify:check_headers": "sbb",
+                "verify:print_sizes": "sbb",
+                "verify:check_attributes": "sbb",
+                "verify:check_monotonic_time": "sbb",
+                "verify:check_consistent_election_ids": "sbb",
+                "verify:read_hash_suite": "fixed",
+                "verify:read_races": "fixed",
+                "verify:read_n_voters": "fixed",
+                "verify:read_rows_cols_n_reps_threshold_indent": "fixed",
+                "verify:read_cast_votes": "voters",
+                "verify:read_receipts": "voters",
+                "verify:read_tally": "fixed",
+                "verify:read_verifier_challenges": "sbb",
+                "verify:check_receipts": "voters"}
+
+# how the size of SBB entries with each header grows (as PHASE_GROWTH;
+# headers not listed: "fixed")
+HEADER_GROWTH = {"casting:ballot": "voters",
+                 "proof:output_commitments": "copies",
+                 "proof:output_commitment_t_values": "copies",
+                 "proof:verifier_challenges": "voters",
+                 "proof:outcome_check": "copies",
+                 "proof:input_consistency:input_openings": "voters",
+                 "proof:input_consistency:output_openings": "copies",
+                 "proof:input_consistency:pik_for_k_in_icl": "copies"}
+
+##############################################################################
+# operation counts
+##############################################################################
+
+def election_shape(election):
+    """ Return shape (a dict) of election: what op counts depend on,
+    besides the number of voters and n_reps.
+    """
+    parent_races = [race for race in election.races
+                    if race.write_in_for is None]
+    return {"races": len(election.races),
+            "parent_races": len(parent_races),
+            # expected random draws for write-ins, per voter
+            "write_in_draws": sum([1.0 / len(race.choices)
+                                   for race in parent_races
+                                   if race.write_in_choice() is not None]),
+            # expected ballots in write-in tables, per voter
+            "table_ballots": sum([1.0 / len(race.choices)
+                                  for race in parent_races
+                                  if race.write_in_race is not None]),
+            "rows": election.server.rows,
+            "cols": election.server.cols,
+            "threshold": election.server.threshold}
+
+def op_counts(shape, n_voters, n_reps):
+    """ Return dict mapping phase names to dicts of (expected) op counts,
+    for an election of given shape with n_voters voters and n_reps copies.
+
+    (The counts are exact, but for the random draws for write-ins made
+    by the simulated voters, and the ballots in write-in tables, whose
+    expected numbers are given.  A phase with subphases, such as
+    "prove", is not included; see predict.)
+    """
+    n = n_voters
+    races = shape["races"]
+    rows = shape["rows"]
+    cols = shape["cols"]
+    t = shape["threshold"]
+    m = n_reps // 2
+    # ballots (positions mixed), over all races
+    ballots = n * (shape["parent_races"] + shape["table_ballots"])
+    # precompute: per race, column and copy, a permutation, and a
+    # sharing of zero per position; per race and copy, u for outputs
+    # (for n positions in every race, write-in tables included)
+    random = races * n_reps * (cols * ((n - 1) + n * t) + n * rows)
+    counts = {"precompute": {"random": random,
+                             "secure_hash": 2 * random,
+                             "share": races * cols * n_reps * n,
+                             "lagrange": races * cols * n_reps * n}}
+    # cast: per voter, random choices; per ballot, a ballot_id, a
+    # sharing (checked twice), and per row a split value pair, a seed
+    # and two commitments (checked again on ingest); and a receipt hash
+    random = n * (shape["parent_races"] + shape["write_in_draws"]) + \
+        ballots * (1 + t + 2 * rows)
+    counts["cast"] = {"random": random,
+                      "secure_hash": 2 * random + ballots,
+                      "share": ballots,
+                      "lagrange": 2 * ballots,
+                      "com": 4 * rows * ballots}
+    counts["tally"] = {"lagrange": n_reps * ballots}
+    counts["prove:output_commitments"] = {"com":
+                                          2 * n_reps * rows * ballots}
+    # challenges: cut (a permutation of the copies), and left/right
+    random = (n_reps - 1) + ballots
+    counts["prove:verifier_challenges"] = {"random": random,
+                                           "secure_hash": 2 * random}
+    counts["verify:read_verifier_challenges"] = \
+        dict(counts["prove:verifier_challenges"])
+    counts["verify:check_receipts"] = {"secure_hash": ballots}
+    counts["verify:check_opened_output_commitments"] = \
+        {"com": 2 * m * rows * ballots}
+    counts["verify:check_opened_output_commitment_tallies"] = \
+        {"lagrange": m * ballots}
+    counts["verify:check_input_consistency"] = \
+        {"com": ballots * rows + m * ballots * rows,
+         "lagrange": 2 * m * ballots}
+    return counts
+
+##############################################################################
+# calibration
+##############################################################################
+
+@contextlib.contextmanager
+def saved_state():
+    """ Context manager restoring, on exit, the state of sv.py and
+    sv_stats.py that calibration changes: the hash suite, randomness
+    sources, json settings, stretch work, and the statistics settings
+    (with the phases and op counts recorded so far).
+    """
+    hash_suite_name = sv.hash_suite['name']
+    randomness_sources = dict(sv.randomness_sources)
+    json_parameters = dict(sv.json_parameters)
+    hash_iterate_count = sv.HASH_ITERATE_COUNT
+    stats_parameters = dict(sv_stats.stats_parameters)
+    phase_log = list(sv_stats.phase_log)
+    counting = sv.count_parameters['enabled']
+    counts = sv.get_op_counts()
+    try:
+        yield
+    finally:
+        sv.set_hash_suite(hash_suite_name)
+        sv.randomness_sources.clear()
+        sv.randomness_sources.update(randomness_sources)
+        sv.json_parameters.update(json_parameters)
+        sv.HASH_ITERATE_COUNT = hash_iterate_count
+        sv_stats.set_stats(stats_parameters['enabled'],
+                           stats_parameters['memory'],
+                           stats_parameters['top_sites'])
+        sv_stats.phase_log.extend(phase_log)
+        sv.set_op_counting(counting)
+        for op, count in counts.items():
+            sv.count_op(op, count)
+
+def cpu_seconds_per_call(function, repeats=OP_REPEATS):
+    """ Return CPU seconds per call of function() (best of three). """
+    times = []
+    for _ in range(3):
+        start = time.process_time()
+        for _ in range(repeats):
+            function()
+        times.append((time.process_time() - start) / repeats)
+    return min(times)
+
+def op_costs(election):
+    """ Return dict mapping each op of OPS to its cost (CPU seconds per
+    call, not counting the other basic operations it calls), for the
+    race of election with the largest modulus.
+
+    Secrets are shared and reconstructed OP_REPEATS at a time, as by
+    sv.share_many and sv.lagrange_many, which do most of them.
+
+    (Op counting must be disabled; call within saved_state.)
+    """
+    race = max(election.races, key=lambda race: race.race_modulus)
+    modulus = race.race_modulus
+    n = election.server.rows
+    t = election.server.threshold
+    rand_name = "planner:op_costs"
+    sv.init_randomness_source(rand_name)
+    secrets = [modulus - 1] * OP_REPEATS
+    y_lists = sv.share_many(secrets, n, t, rand_name, modulus)
+    value = sv.int2bytes(modulus - 1)
+    key = bytes(sv.SECPARAM_SYMMETRIC // 8)
+    seconds = dict()
+    seconds["secure_hash"] = cpu_seconds_per_call(
+        lambda: sv.secure_hash(key))
+    seconds["random"] = cpu_seconds_per_call(
+        lambda: sv.get_random_from_source(rand_name, modulus))
+    seconds["lagrange"] = cpu_seconds_per_call(
+        lambda: sv.lagrange_many(y_lists, n, t, modulus), 1) / OP_REPEATS
+    seconds["share"] = cpu_seconds_per_call(
+        lambda: sv.share_many(secrets, n, t, rand_name, modulus),
+        1) / OP_REPEATS
+    seconds["com"] = cpu_seconds_per_call(lambda: sv.com_raw(value, key))
+    # take out the basic operations called
+    costs = {"secure_hash": seconds["secure_hash"],
+             "random": seconds["random"] - 2 * seconds["secure_hash"],
+             "lagrange": seconds["lagrange"],
+             "share": seconds["share"] - t * seconds["random"] -
+                      seconds["lagrange"],
+             "com": seconds["com"]}
+    return dict([(op, max(0.0, cost)) for op, cost in costs.items()])
+
+def stretch_seconds(election_parameters):
+    """ Return CPU seconds taken by the stretched hash of the SBB (for
+    the verifier challenges; see sv_prover.make_verifier_challenges),
+    with the hash suite of the election.
+
+    (Call within saved_state.)
+    """
+    sv.set_hash_suite(election_parameters.get("hash_suite", "sha256"))
+    method = sv.stretch_method(election_parameters.get("challenge_stretch",
+                                                       "iterate"))
+    stretch = {"algorithm": sv.stretch_algorithm(method,
+                                                 sv.hash_suite['name']),
+               "work": sv.HASH_ITERATE_COUNT}
+    start = time.process_time()
+    sv.stretched_hash(b"", "hash_sbb", stretch)
+    return time.process_time() - start
+
+def calibration_run(election_parameters, n_voters, memory=False):
+    """ Run (and verify) small election like the given one, with
+    n_voters voters; return (election, measurements).
+
+    The measurements are a dict with "phases" (mapping phase names to
+    dicts with "seconds" (CPU), "peak_bytes" (if memory) and op counts),
+    and "sbb_bytes" (mapping each SBB header to the bytes of its
+    entries).  Always uses the simulated server array.  The stretched
+    hash is shortened (to CALIBRATION_STRETCH_WORK).
+
+    (Call within saved_state.)
+    """
+    election_parameters = dict(election_parameters)
+    election_parameters.update({"election_id": "planner",
+                                "n_voters": n_voters,
+                                "server_mode": "simulated"})
+    sv.HASH_ITERATE_COUNT = CALIBRATION_STRETCH_WORK
+    sv_stats.set_stats(True, memory, top_sites=False)
+    with tempfile.TemporaryDirectory() as directory, \
+         contextlib.redirect_stdout(io.StringIO()):
+        sbb_filename = os.path.join(directory, "planner.sbb.txt")
+        election = sv_election.Election(election_parameters)
+        election.run_election()
+        election.sbb.print_sbb(public=True, sbb_filename=sbb_filename)
+        sv_verifier.verify(sbb_filename)
+        board = sv.load(sbb_filename)
+        file_bytes = os.path.getsize(sbb_filename)
+    phases = dict()
+    for record in sv_stats.phase_log:
+        phase = dict([(op, record["counts"].get(op, 0)) for op in OPS])
+        phase["seconds"] = record["cpu_seconds"]
+        if memory:
+            phase["peak_bytes"] = record["peak_bytes"]
+        phases[record["phase"]] = phase
+    # share out the size of the file among the headers of its entries
+    item_bytes = dict()
+    for item in board:
+        item_bytes[item[0]] = item_bytes.get(item[0], 0) + \
+            len(json.dumps(item))
+    total = sum(item_bytes.values())
+    sbb_bytes = dict([(header, file_bytes * size / total)
+                      for header, size in item_bytes.items()])
+    return (election, {"phases": phases, "sbb_bytes": sbb_bytes})
+
+def growth_units(growth, n_voters, n_reps, sbb_bytes):
+    """ Return units of work of given growth (see PHASE_GROWTH), for
+    n_voters voters, n_reps copies and an SBB of sbb_bytes bytes.
+    """
+    return {"voters": n_voters,
+            "copies": n_voters * n_reps,
+            "sbb": sbb_bytes,
+            "fixed": 0}[growth]
+
+def fit(q1, q2, u1, u2):
+    """ Return (a, b), both at least 0, with q = a + b * u through the
+    points (u1, q1) and (u2, q2) (b is 0 if u1 == u2).
+    """
+    b = 0.0
+    if u1 != u2:
+        b = max(0.0, (q2 - q1) / (u2 - u1))
+    return (max(0.0, q2 - b * u2), b)
+
+def calibrate(election_parameters):
+    """ Return cost model for elections shaped like the given one.
+
+    The model is a dict with "shape" (see election_shape), "op_costs"
+    (see op_costs), "stretch_seconds", "phases" (mapping phase names to
+    dicts with "rest_seconds" (a, b) (see fit), and "peak_bytes" and
+    "peak_units" of the larger calibration election), "sbb_bytes"
+    (mapping SBB headers to (a, b)), and "rows" and "cols".
+    """
+    n_reps = election_parameters["n_reps"]
+    with saved_state():
+        fixed = stretch_seconds(election_parameters)
+        runs = [calibration_run(election_parameters, n_voters)
+                for n_voters in CALIBRATION_VOTERS]
+        (election, memory_run) = calibration_run(election_parameters,
+                                                 CALIBRATION_VOTERS[-1],
+                                                 memory=True)
+        shape = election_shape(election)
+        sv_stats.set_stats(False)
+        costs = op_costs(election)
+    sbb_bytes = [sum(run["sbb_bytes"].values()) for (_, run) in runs]
+    phases = dict()
+    for name in runs[-1][1]["phases"]:
+        growth = PHASE_GROWTH.get(name, "copies")
+        (q1, q2) = [run["phases"][name]["seconds"] -
+                    sum([run["phases"][name][op] * costs[op]
+                         for op in OPS])
+                    for (_, run) in runs]
+        (u1, u2) = [growth_units(growth, n_voters, n_reps, size)
+                    for n_voters, size in zip(CALIBRATION_VOTERS,
+                                              sbb_bytes)]
+        phases[name] = {"rest_seconds": fit(q1, q2, u1, u2),
+                        "peak_bytes":
+                            memory_run["phases"][name]["peak_bytes"],
+                        "peak_units": u2}
+    header_bytes = dict()
+    for header in runs[-1][1]["sbb_bytes"]:
+        growth = HEADER_GROWTH.get(header, "fixed")
+        (q1, q2) = [run["sbb_bytes"].get(header, 0) for (_, run) in runs]
+        (u1, u2) = [growth_units(growth, n_voters, n_reps, 0)
+                    for n_voters in CALIBRATION_VOTERS]
+        header_bytes[header] = fit(q1, q2, u1, u2)
+    return {"shape": shape,
+            "op_costs": costs,
+            "stretch_seconds": fixed,
+            "phases": phases,
+            "sbb_bytes": header_bytes,
+            "rows": shape["rows"],
+            "cols": shape["cols"]}
+
+##############################################################################
+# prediction
+##############################################################################
+
+def predict(model, n_voters, n_reps):
+    """ Return prediction (a dict) for n_voters voters and n_reps copies.
+
+    Gives, for the "election" (precompute, cast, mix, tally, prove), the
+    "prover" (prove) and the "verifier" (all of verify), the total op
+    counts, (CPU) seconds and peak bytes; and the phases, and SBB size.
+    """
+    sbb_bytes = 0.0
+    for header, (a, b) in model["sbb_bytes"].items():
+        growth = HEADER_GROWTH.get(header, "fixed")
+        sbb_bytes += a + b * growth_units(growth, n_voters, n_reps, 0)
+    counts = op_counts(model["shape"], n_voters, n_reps)
+    phases = dict()
+    for name, phase_model in model["phases"].items():
+        phase = dict([(op, counts.get(name, dict()).get(op, 0))
+                      for op in OPS])
+        units = growth_units(PHASE_GROWTH.get(name, "copies"), n_voters,
+                             n_reps, sbb_bytes)
+        (a, b) = phase_model["rest_seconds"]
+        phase["seconds"] = sum([phase[op] * model["op_costs"][op]
+                                for op in OPS]) + a + b * units
+        if name in STRETCH_PHASES:
+            phase["seconds"] += model["stretch_seconds"]
+        phase["peak_bytes"] = phase_model["peak_bytes"]
+        if phase_model["peak_units"] > 0:
+            phase["peak_bytes"] *= units / phase_model["peak_units"]
+        phases[name] = phase
+    # a phase with subphases (e.g. "prove") does the work of theirs
+    for name in phases:
+        subphases = [sub for sub in phases if sub.startswith(name + ":")]
+        if subphases:
+            for key in OPS + ("seconds",):
+                phases[name][key] = sum([phases[sub][key]
+                                         for sub in subphases])
+    prediction = {"n_voters": n_voters,
+                  "n_reps": n_reps,
+                  "phases": phases,
+                  "sbb_bytes": sbb_bytes}
+    parts = {"election": [name for name in phases if ":" not in name],
+             "prover": ["prove"],
+             "verifier": [name for name in phases
+                          if name.startswith("verify:")]}
+    for part, names in parts.items():
+        total = dict([(key, sum([phases[name][key] for name in names]))
+                      for key in OPS + ("seconds",)])
+        total["peak_bytes"] = max([phases[name]["peak_bytes"]
+                                   for name in names])
+        prediction[part] = total
+    return prediction
+
+def total_seconds(model, n_voters, n_reps):
+    """ Return predicted seconds of election plus verification. """
+    prediction = predict(model, n_voters, n_reps)
+    return prediction["election"]["seconds"] + \
+        prediction["verifier"]["seconds"]
+
+def physical_memory_bytes():
+    """ Return physical memory of this machine, or None if unknown. """
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def suggestions(model, election_parameters, budget_seconds=None):
+    """ Return list of suggestions (strings) for n_reps and parallelism. """
+    n_voters = election_parameters["n_voters"]
+    n_reps = election_parameters["n_reps"]
+    prediction = predict(model, n_voters, n_reps)
+    suggested = []
+    seconds = total_seconds(model, n_voters, n_reps)
+    if n_reps + 2 <= MAX_REPS:
+        extra = total_seconds(model, n_voters, n_reps + 2) - seconds
+        suggested.append("each 2 more copies (n_reps) cost about %.1f "
+                         "seconds" % max(0.0, extra))
+    if budget_seconds is not None:
+        fitting = [r for r in range(2, MAX_REPS + 1, 2)
+                   if total_seconds(model, n_voters, r) <= budget_seconds]
+        if not fitting:
+            suggested.append("no n_reps fits in %.1f seconds; use fewer "
+                             "voters per election" % budget_seconds)
+        else:
+            suggested.append("largest n_reps within %.1f seconds: %d" %
+                             (budget_seconds, max(fitting)))
+    mix_seconds = prediction["phases"]["precompute"]["seconds"] + \
+        prediction["phases"]["mix"]["seconds"]
+    n_servers = model["rows"] * model["cols"]
+    cpus = os.cpu_count() or 1
+    if mix_seconds >= PARALLEL_MIN_SECONDS and cpus > 1:
+        suggested.append("precompute and mix take about %.1f seconds: "
+                         "use server_mode \"distributed\" (%d server "
+                         "processes, rows of a column in parallel on %d "
+                         "CPUs)" % (mix_seconds, n_servers,
+                                    min(cpus, model["rows"])))
+    else:
+        suggested.append("server_mode \"simulated\" (precompute and mix "
+                         "take about %.1f seconds)" % mix_seconds)
+    memory = physical_memory_bytes()
+    peak = max(prediction["election"]["peak_bytes"],
+               prediction["verifier"]["peak_bytes"])
+    if memory is not None and peak > memory / 2:
+        suggested.append("peak memory (%.0f MB) is more than half of "
+                         "physical memory (%.0f MB): split the election"
+                         % (peak / 1e6, memory / 1e6))
+    return suggested
+
+def plan(election_parameters, budget_seconds=None):
+    """ Return plan (a dict): prediction for the election given by
+    election_parameters, with suggestions.
+    """
+    model = calibrate(election_parameters)
+    prediction = predict(model, election_parameters["n_voters"],
+                         election_parameters["n_reps"])
+    prediction["election_id"] = election_parameters["election_id"]
+    prediction["suggestions"] = suggestions(model, election_parameters,
+                                            budget_seconds)
+    return prediction
+
+def print_plan(prediction, f_out=None):
+    """ Print plan made by plan. """
+    print("predicted costs for election", prediction["election_id"],
+          "(%d voters, n_reps = %d):" %
+          (prediction["n_voters"], prediction["n_reps"]), file=f_out)
+    print("    %-10s %12s %12s %12s %12s %12s %10s %10s" %
+          (("part",) + OPS + ("seconds", "peak MB")), file=f_out)
+    for part in ("election", "prover", "verifier"):
+        total = prediction[part]
+        print("    %-10s %12d %12d %12d %12d %12d %10.2f %10.1f" %
+              ((part,) + tuple([int(total[op]) for op in OPS]) +
+               (total["seconds"], total["peak_bytes"] / 1e6)), file=f_out)
+    print("    phases (seconds):", file=f_out)
+    for name in sorted(prediction["phases"].keys()):
+        print("        %-48s %10.3f" %
+              (name, prediction["phases"][name]["seconds"]), file=f_out)
+    print("    SBB size: %.1f MB" % (prediction["sbb_bytes"] / 1e6),
+          file=f_out)
+    print("suggestions:", file=f_out)
+    for suggestion in prediction["suggestions"]:
+        print("    " + suggestion, file=f_out)
+
+def main():
+    """ Print (and save) plan for election given by parameters file. """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("election_id", nargs="?",
+                        help="election_id of election_id.parameters.txt")
+    parser.add_argument("--budget", metavar="SECONDS", type=float,
+                        default=None,
+                        help="time budget for election and verification")
+    parser.add_argument("--output", metavar="FILE", default=None,
+                        help="also save plan (json) to FILE")
+    args = parser.parse_args()
+
+    election_parameters = sv_main.get_election_parameters(args.election_id)
+    print("calibrating (running small elections of the same shape)...")
+    prediction = plan(election_parameters, args.budget)
+    print_plan(prediction)
+    if args.output is not None:
+        sv.dump(prediction, args.output)
+        print("plan saved on file:", args.output)
+
+if __name__ == "__main__":
+    assert sys.version_info[0] == 3
+    main()
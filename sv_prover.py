@@ -10,25 +10,36 @@
 # (See https://github.com/ron-rivest/split-value-voting.git)
 
 import sv
+import sv_comm
+import sv_stats
 
 def make_proof(election):
-    """ Prove that the outcome is correct. (Make it verifiable.) """
+    """ Prove that the outcome is correct. (Make it verifiable.)
+
+    (Each step is timed, if enabled; see sv_stats.py.)
+    """
 
     # write out commitments for outputs of last column
-    compute_output_commitments(election)
-    post_output_commitments(election)
-    compute_and_post_t_values(election)
+    with sv_stats.phase("prove:output_commitments"):
+        compute_output_commitments(election)
+        post_output_commitments(election)
+    with sv_stats.phase("prove:t_values"):
+        compute_and_post_t_values(election)
 
     # make verifier challenges to proof
-    challenges = make_verifier_challenges(election)
+    with sv_stats.phase("prove:verifier_challenges"):
+        challenges = make_verifier_challenges(election)
 
     # part 1 of proof production
-    prove_outcome_correct(election, challenges)
+    with sv_stats.phase("prove:outcome"):
+        prove_outcome_correct(election, challenges)
 
     # part 2 of proof production
     # make proof of consistency of icl copies with input
-    prove_input_consistent(election, challenges)
-    compute_and_post_pik_dict(election, challenges)
+    with sv_stats.phase("prove:input_consistency"):
+        prove_input_consistent(election, challenges)
+    with sv_stats.phase("prove:pik"):
+        compute_and_post_pik_dict(election, challenges)
 
 ##############################################################################
 # output section
@@ -43,7 +54,12 @@ def compute_output_commitments(election):
     for each of the n vote shares (call them y)
     compute two commitments (cu and cv) to split-value rep (u,v) of y.
     using randomization values ru and rv.
+
+    The randomization values are derived from the seed of the server
+    (see Server.get_randomizer), and are not saved.  The u values were
+    made ahead of time (see Server.precompute).
     """
+    server = election.server
     cols = election.server.cols
     full_output = dict()
     for race in election.races:
@@ -52,26 +68,36 @@ def compute_output_commitments(election):
         full_output[race_id] = dict()
         for k in election.k_list:
             full_output[race_id][k] = dict()
-            for py in election.p_list:
+            for py in race.p_list:
                 full_output[race_id][k][py] = dict()
+            u_dict = server.precomputed[race_id][cols-1][k]['u']
+            uv_lists = dict()
+            r_lists = dict()
+            for i in election.server.row_list:
+                uv_lists[i] = []
+                r_lists[i] = []
+            for index, py in enumerate(race.p_list):
                 for i in election.server.row_list:
-                    rand_name = \
-                        election.server.sdb[race_id][i][cols-1]['rand_name']
-                    sdbp = election.server.sdb[race_id][i][cols-1][k]
+                    y = server.sdb[race_id][i][cols-1][k]['y'][py]
+                    u = u_dict[i][index]
+                    v = (y - u) % race_modulus
+                    ru = server.get_randomizer(race_id, i, py, "ru", k)
+                    rv = server.get_randomizer(race_id, i, py, "rv", k)
+                    uv_lists[i].extend([u, v])
+                    r_lists[i].extend([ru, rv])
+            for i in election.server.row_list:
+                sdbp = server.sdb[race_id][i][cols-1][k]
+                c_list = sv.com_batch(uv_lists[i], r_lists[i])
+                for index, py in enumerate(race.p_list):
                     y = sdbp['y'][py]
-                    (u, v) = sv.get_sv_pair(y, rand_name, race_modulus)
-                    ru = sv.bytes2base64(sv.get_random_from_source(rand_name))
-                    rv = sv.bytes2base64(sv.get_random_from_source(rand_name))
-                    cu = sv.com(u, ru)
-                    cv = sv.com(v, rv)
+                    (u, v) = uv_lists[i][2*index:2*index+2]
+                    (cu, cv) = [sv.bytes2base64(c)
+                                for c in c_list[2*index:2*index+2]]
                     sdbp['u'][py] = u
                     sdbp['v'][py] = v
-                    sdbp['ru'][py] = ru
-                    sdbp['rv'][py] = rv
                     sdbp['cu'][py] = cu
                     sdbp['cv'][py] = cv
-                    ballot = {'y': y, 'u': u, 'v': v,
-                              'ru': ru, 'rv': rv, 'cu': cu, 'cv': cv}
+                    ballot = {'y': y, 'u': u, 'v': v, 'cu': cu, 'cv': cv}
                     full_output[race_id][k][py][i] = ballot
     election.full_output = full_output
 
@@ -85,7 +111,7 @@ def post_output_commitments(election):
         coms[race_id] = dict()
         for k in election.k_list:
             coms[race_id][k] = dict()
-            for py in election.p_list:
+            for py in race.p_list:
                 coms[race_id][k][py] = dict()
                 for i in election.server.row_list:
                     coms[race_id][k][py][i] = \
@@ -123,22 +149,39 @@ def compute_and_post_t_values(election):
         ts[race_id] = dict()
         for k in election.k_list:
             ts[race_id][k] = dict()
-            for px in election.p_list:
+            for px in race.p_list:
                 ts[race_id][k][px] = dict()
-                for i in election.server.row_list:
-                    ts[race_id][k][px][i] = dict()
-                    ux = server.sdb[race_id][i][0]['u'][px]
-                    vx = server.sdb[race_id][i][0]['v'][px]
+            for i in election.server.row_list:
+                # trace each px through the mix to its output position py
+                py_list = []
+                for px in race.p_list:
                     py = px
                     for j in range(cols):
                         pi_inv = server.sdb[race_id][i][j][k]['pi_inv']
                         py = pi_inv[py]
-                    uy = server.sdb[race_id][i][cols-1][k]['u'][py]
-                    vy = server.sdb[race_id][i][cols-1][k]['v'][py]
-                    tu = (uy-ux) % race.race_modulus
-                    tv = (vy-vx) % race.race_modulus
-                    ts[race_id][k][px][i]["tu"] = tu
-                    ts[race_id][k][px][i]["tv"] = tv
+                    py_list.append(py)
+                sdbx = server.sdb[race_id][i][0]
+                sdby = server.sdb[race_id][i][cols-1][k]
+                tu_list = sv.sub_mod([sdby['u'][py] for py in py_list],
+                                     [sdbx['u'][px] for px in race.p_list],
+                                     race.race_modulus)
+                tv_list = sv.sub_mod([sdby['v'][py] for py in py_list],
+                                     [sdbx['v'][px] for px in race.p_list],
+                                     race.race_modulus)
+                for px, tu, tv in zip(race.p_list, tu_list, tv_list):
+                    ts[race_id][k][px][i] = {"tu": tu, "tv": tv}
+    if sv_comm.comm_parameters['enabled']:
+        # tracing passes (tu, tv) along each row, column to column
+        for race in election.races:
+            n_bytes = 2 * len(race.p_list) * \
+                sv_comm.value_bytes(race.race_modulus)
+            for i in server.row_list:
+                for j in range(cols - 1):
+                    sv_comm.record("prove:t_values",
+                                   sv_comm.server_name(i, j),
+                                   sv_comm.server_name(i, j+1),
+                                   n_bytes * election.n_reps,
+                                   election.n_reps)
     election.sbb.post("proof:output_commitment_t_values",
                       {"t_values": ts},
                       time_stamp=False)
@@ -154,7 +197,10 @@ def make_verifier_challenges(election):
         but could also incorporate additional random input (e.g.
         dice rolls).
     """
-    sbb_hash = election.sbb.hash_sbb(public=True)
+    # the algorithm used to stretch the hash is posted with the challenges
+    stretch = {"algorithm": election.challenge_stretch,
+               "work": sv.HASH_ITERATE_COUNT}
+    sbb_hash = election.sbb.hash_sbb(public=True, stretch=stretch)
     election.sbb_hash = sbb_hash
     rand_name = "verifier_challenges"
     sv.init_randomness_source(rand_name, sbb_hash)
@@ -163,6 +209,7 @@ def make_verifier_challenges(election):
     make_left_right_challenges(election, rand_name, challenges)
     election.sbb.post("proof:verifier_challenges",
                       {"sbb_hash": sv.bytes2hex(sbb_hash),
+                       "stretch": stretch,
                        "challenges": challenges},
                       time_stamp=False)
     return challenges
@@ -187,17 +234,18 @@ def make_cut_and_choose_challenges(election, rand_name, challenges):
     challenges['cut'] = {'icl': icl, 'opl': opl}
 
 def make_left_right_challenges(election, rand_name, challenges):
-    """ make dict with a list of n_voters left/right challenges for each race.
+    """ make dict with a left/right challenge for each position of each race.
 
-        Modify dict challenges to have a per race list of True/False values
-        of length n_voters (True = left).
+        Modify dict challenges to have a per race dict of "left"/"right"
+        values, one for each position in the p_list of the race.
     """
     leftright_dict = dict()
     # sorting needed in next line else result depends on enumeration order
     # (sorting is also done is sv_verifier.py)
+    races = dict([(race.race_id, race) for race in election.races])
     for race_id in sorted(election.race_ids):
         leftright = dict()
-        for p in election.p_list:   # note: p_list is already sorted
+        for p in races[race_id].p_list:   # note: p_list is already sorted
             leftright[p] = "left"\
                            if bool(sv.get_random_from_source(rand_name,
                                                              modulus=2))\
@@ -222,20 +270,24 @@ def prove_outcome_correct(election, challenges):
     """
     opl = challenges['cut']['opl']
     opened = dict()
-    cols = election.server.cols
+    server = election.server
+    cols = server.cols
     for race in election.races:
         race_id = race.race_id
         opened[race_id] = dict()
         for k in opl:
             opened[race_id][k] = dict()
-            for py in election.p_list:
+            for py in race.p_list:
                 opened[race_id][k][py] = dict()
                 for i in election.server.row_list:
                     y = election.server.sdb[race_id][i][cols-1][k]['y'][py]
                     u = election.server.sdb[race_id][i][cols-1][k]['u'][py]
                     v = election.server.sdb[race_id][i][cols-1][k]['v'][py]
-                    ru = election.server.sdb[race_id][i][cols-1][k]['ru'][py]
-                    rv = election.server.sdb[race_id][i][cols-1][k]['rv'][py]
+                    # randomizers are derived only for opened commitments
+                    ru = sv.bytes2base64(
+                        server.get_randomizer(race_id, i, py, "ru", k))
+                    rv = sv.bytes2base64(
+                        server.get_randomizer(race_id, i, py, "rv", k))
                     # cu, cv already given in output commitments
                     # so we only need to supply opening values here
                     # cu = election.server.sdb[race_id][i][cols-1][k]['cu'][py]
@@ -261,20 +313,23 @@ def prove_input_consistent(election, challenges):
     """
     icl = challenges['cut']['icl']
     leftright_dict = challenges['leftright']
+    server = election.server
 
     coms = dict()
     for race in election.races:
         race_id = race.race_id
         leftright = leftright_dict[race_id]
         coms[race_id] = dict()
-        for px in election.p_list:
+        for px in race.p_list:
             coms[race_id][px] = dict()
             for i in election.server.row_list:
-                vote = election.cast_votes[race_id][px][i]
+                sdbx = server.sdb[race_id][i][0]
                 if leftright[px] == "left":
-                    com = {"u": vote['u'], "ru": vote['ru']}
+                    ru = server.get_randomizer(race_id, i, px, "ru")
+                    com = {"u": sdbx['u'][px], "ru": sv.bytes2base64(ru)}
                 else:
-                    com = {"v": vote['v'], "rv": vote['rv']}
+                    rv = server.get_randomizer(race_id, i, px, "rv")
+                    com = {"v": sdbx['v'][px], "rv": sv.bytes2base64(rv)}
                 coms[race_id][px][i] = com
     election.sbb.post("proof:input_consistency:input_openings",
                       {"opened_commitments": coms},
@@ -288,9 +343,9 @@ def prove_input_consistent(election, challenges):
         coms[race_id] = dict()
         for k in icl:
             coms[race_id][k] = dict()
-            for py in election.p_list:
+            for py in race.p_list:
                 coms[race_id][k][py] = dict()
-            for py in election.p_list:
+            for py in race.p_list:
                 for i in election.server.row_list:
                     cols = election.server.cols
                     sdbp = election.server.sdb
@@ -299,11 +354,13 @@ def prove_input_consistent(election, challenges):
                         pi = sdbp[race_id][i][j][k]['pi']
                         px = pi[px]
                     if leftright[px] == "left":
+                        ru = server.get_randomizer(race_id, i, py, "ru", k)
                         com = {"u": sdbp[race_id][i][cols-1][k]['u'][py],
-                               "ru": sdbp[race_id][i][cols-1][k]['ru'][py]}
+                               "ru": sv.bytes2base64(ru)}
                     else:
+                        rv = server.get_randomizer(race_id, i, py, "rv", k)
                         com = {"v": sdbp[race_id][i][cols-1][k]['v'][py],
-                               "rv": sdbp[race_id][i][cols-1][k]['rv'][py]}
+                               "rv": sv.bytes2base64(rv)}
                     coms[race_id][k][py][i] = com
     election.sbb.post("proof:input_consistency:output_openings",
                       {"opened_commitments": coms},
@@ -327,13 +384,23 @@ def compute_and_post_pik_dict(election, challenges):
         pik_dict[race_id] = dict()
         for k in icl:
             pik_dict[race_id][k] = dict()
-            for py in election.p_list:
+            for py in race.p_list:
                 px = py
                 for j in range(cols-1, -1, -1):
                     pi = server.sdb[race_id]['a'][j][k]['pi']
                     px = pi[px]
                 pik_dict[race_id][k][py] = px
             # now pik maps py's to their original px's
+    if sv_comm.comm_parameters['enabled']:
+        # composing the permutations passes along row 'a', right to left
+        for race in election.races:
+            n_bytes = len(race.p_list) * \
+                sv_comm.index_bytes(len(race.p_list))
+            for j in range(cols - 1, 0, -1):
+                sv_comm.record("prove:pik",
+                               sv_comm.server_name('a', j),
+                               sv_comm.server_name('a', j-1),
+                               n_bytes * len(icl), len(icl))
     election.sbb.post("proof:input_consistency:pik_for_k_in_icl",
                       {'pik_dict': pik_dict},
                       time_stamp=False)
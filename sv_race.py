@@ -18,10 +18,31 @@ WRITE_INS = ["Donald Duck",
              "Lizard People",
              "Mickey Mouse"]
 
+# Choice encodings.
+# "bytes": a choice is encoded as the integer whose (little-endian) bytes
+#          are the utf-8 encoding of the choice string; race_modulus
+#          must then exceed 256**(max choice length).
+# "compact": a choice is encoded as its index in the list of choices, and
+#          a write-in is encoded as the index of the "****" entry; the
+#          text of the write-in is cast separately in a write-in table
+#          (a race of its own, using "bytes" encoding, with race_id equal
+#          to the race_id of its parent race plus WRITE_IN_SUFFIX).
+#          Only voters who write in a candidate cast an entry in the
+#          write-in table (at their own position), so that the table,
+#          and its part of the proof, is as long as the number of
+#          write-ins, and not the number of voters.  The SBB thus shows
+#          which positions wrote in (though not what they wrote);
+#          "bytes" encoding does not show this.
+# A write-in must not be empty.
+CHOICE_ENCODINGS = ("bytes", "compact")
+WRITE_IN_SUFFIX = ":write-ins"
+COMPACT_MODULUS_MIN = 256    # at least 2 + number of rows of server array
+
 class Race:
     """ Implements a race in a split-value voting method. """
 
-    def __init__(self, election, race_id, choices):
+    def __init__(self, election, race_id, choices,
+                 choice_encoding="bytes", write_in_for=None):
         """ Initialize race
 
             race_id is a string
@@ -36,6 +57,9 @@ class Race:
                  defines a race (for President), and
                  for this race the voter may vote for Smith, for Jones, or
                  may cast a write-in vote of length at most 8 characters.
+            choice_encoding is "bytes" or "compact" (see CHOICE_ENCODINGS)
+            write_in_for is None, or (for a write-in table) the race_id
+               of the race whose write-ins this race holds.
         """
 
         assert isinstance(race_id, str) and len(race_id) > 0
@@ -48,16 +72,35 @@ class Race:
         # choices must be strings
         assert all([isinstance(choice, str) for choice in choices])
 
+        assert choice_encoding in CHOICE_ENCODINGS
+        assert write_in_for is None or choice_encoding == "bytes"
+
         self.election = election
         self.race_id = race_id
         self.choices = choices
+        self.choice_encoding = choice_encoding
+        self.write_in_for = write_in_for
+        self.write_in_race = None     # set by election if race has a table
+        # positions with a ballot in this race: all positions, except in
+        # a write-in table (set when casting is closed; see close_casting)
+        if write_in_for is None:
+            self.p_list = election.p_list
+        else:
+            self.p_list = None
 
         # set race.race_modulus = modulus for representing choices in this race.
-        # note that for computation and comparison purposes, choices will
-        # be converted to type bytes
         # make race_modulus a prime big enough to encode all possible choices
         self.max_choice_len = max([len(choice.encode()) for choice in choices])
-        self.race_modulus = sv.make_prime(256**self.max_choice_len)
+        if choice_encoding == "bytes":
+            # note that for computation and comparison purposes, choices will
+            # be converted to type bytes
+            self.race_modulus = sv.make_prime(256**self.max_choice_len)
+        else:
+            self.race_modulus = sv.make_prime(max(COMPACT_MODULUS_MIN,
+                                                  len(choices)))
+
+        self.codec = RaceCodec(choices, self.race_modulus, choice_encoding,
+                               write_in_table=write_in_for is not None)
 
         self.tally = None
 
@@ -75,8 +118,7 @@ class Race:
         choice_index = sv.get_random_from_source(self.rand_name,
                                                  len(self.choices))
         choice = self.choices[choice_index]
-        all_stars = all([c == "*" for c in choice])
-        if not all_stars:
+        if choice != self.codec.write_in_choice:
             return choice
         # select write_in from fixed list of alternatives
         # but truncate if needed so it is not longer than list of stars
@@ -87,32 +129,119 @@ class Race:
 
     def is_valid_choice(self, choice):
         """ Return True if and only choice is a valid one for this race. """
-        assert isinstance(choice, str)
-        if choice in self.choices:
-            return True
-        for valid_choice in self.choices:
-            if all([c == "*" for c in valid_choice]):
-                if len(choice) <= len(valid_choice):
-                    return True
-        return False
+        return self.codec.is_valid_choice(choice)
+
+    def write_in_choice(self):
+        """ Return the "****" choice of this race (or None if none). """
+        return self.codec.write_in_choice
 
     def choice_str2int(self, choice_str):
+        """ Convert choice_str (a string) to an integer modulo race_modulus.
+
+        With "compact" encoding a write-in is converted to the index of
+        the "****" choice; its text goes into the write-in table.
+        """
+        return self.codec.str2int(choice_str)
+
+    def choice_int2str(self, choice_int):
+        """ Inverse of choice_str2int; convert integer to choice string.
+
+        (With "compact" encoding a write-in converts back to "****".)
+        """
+        return self.codec.int2str(choice_int)
+
+
+class RaceCodec:
+    """ Convert choices of a race to and from integers modulo race_modulus.
+
+    Built once per race (by the race, or by the verifier from the
+    setup:races entry on the SBB), with lookup tables for the listed
+    choices, so that converting a vote is usually one dict lookup.
+    """
+
+    def __init__(self, choices, race_modulus, choice_encoding="bytes",
+                 write_in_table=False):
+        """ Initialize codec for a race with given choices and race_modulus.
+
+        choice_encoding is "bytes" or "compact" (see CHOICE_ENCODINGS).
+        write_in_table is True for the write-in table of a race with
+        "compact" encoding.
+        """
+        assert choice_encoding in CHOICE_ENCODINGS
+        assert not write_in_table or choice_encoding == "bytes"
+        self.choices = choices
+        self.race_modulus = race_modulus
+        self.choice_encoding = choice_encoding
+        self.write_in_table = write_in_table
+
+        # the "****" choice (if any) gives the maximum length of a write-in
+        self.write_in_choice = None
+        self.max_write_in_len = -1
+        for choice in choices:
+            if all([c == "*" for c in choice]):
+                self.write_in_choice = choice
+                self.max_write_in_len = len(choice)
+        self.valid_choices = frozenset(choices)
+
+        self.str2int_table = dict()
+        self.int2str_table = dict()
+        for index, choice in enumerate(choices):
+            if choice_encoding == "compact":
+                choice_int = index
+            elif choice == self.write_in_choice:
+                continue
+            else:
+                choice_int = int.from_bytes(choice.encode(), 'little')
+            assert 0 <= choice_int < race_modulus
+            self.str2int_table[choice] = choice_int
+            self.int2str_table[choice_int] = choice
+
+    @classmethod
+    def from_race_dict(cls, race_dict):
+        """ Return codec for race described by race_dict (from setup:races).
+        """
+        return cls(race_dict['choices'],
+                   race_dict['race_modulus'],
+                   race_dict.get('choice_encoding', 'bytes'),
+                   write_in_table='write_in_for' in race_dict)
+
+    def is_valid_choice(self, choice):
+        """ Return True if and only choice is a valid one for this race. """
+        assert isinstance(choice, str)
+        return choice in self.valid_choices or \
+            0 < len(choice) <= self.max_write_in_len
+
+    def is_write_in_marker(self, choice_str):
+        """ Return True if choice_str stands for a write-in whose text is
+        in the race's write-in table (i.e. with "compact" encoding).
+        """
+        return self.choice_encoding == "compact" and \
+            choice_str == self.write_in_choice
+
+    def str2int(self, choice_str):
         """ Convert choice_str (a string) to an integer modulo race_modulus. """
+        choice_int = self.str2int_table.get(choice_str)
+        if choice_int is not None:
+            return choice_int
+        # write-in
         assert isinstance(choice_str, str)
-        choice_bytes = choice_str.encode()           # convert to bytes
-        choice_int = sv.bytes2int(choice_bytes)      # convert to int
+        assert self.is_valid_choice(choice_str)
+        if self.choice_encoding == "compact":
+            return self.str2int_table[self.write_in_choice]
+        choice_int = int.from_bytes(choice_str.encode(), 'little')
         assert 0 <= choice_int < self.race_modulus
         return choice_int
 
-    def choice_int2str(self, choice_int):
-        """ Inverse of choice_str2int; convert integer to choice string. """
+    def int2str(self, choice_int):
+        """ Inverse of str2int; convert integer to choice string. """
+        choice_str = self.int2str_table.get(choice_int)
+        if choice_str is not None:
+            return choice_str
+        # write-in
         assert isinstance(choice_int, int) and \
             0 <= choice_int < self.race_modulus
+        assert self.choice_encoding == "bytes"
         choice_bytes = sv.int2bytes(choice_int)
         choice_str = choice_bytes.decode()
         assert self.is_valid_choice(choice_str)
         return choice_str
-
-
-
-
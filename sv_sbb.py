@@ -13,6 +13,23 @@ import time
 
 import sv
 
+# If frozen_time is not None, it is used as the time stamp of every
+# message posted, instead of the current time, so that the SBB (whose
+# hash gives the verifier challenges) does not depend on when the
+# election was run; see sv_golden.py.
+time_parameters = {'frozen_time': None}
+
+def set_frozen_time(time_str):
+    """ Use time_str as the time of every post (None: use current time). """
+    assert time_str is None or isinstance(time_str, str)
+    time_parameters['frozen_time'] = time_str
+
+def current_time_str():
+    """ Return time stamp (string) for a message posted now. """
+    if time_parameters['frozen_time'] is not None:
+        return time_parameters['frozen_time']
+    return time.strftime("%Y-%m-%dT%H:%M:%S%z")
+
 class SBB:
     """ Implement secure bulletin board.
 
@@ -57,7 +74,7 @@ class SBB:
         assert "time_str" not in msg_dict
         if time_stamp:
             # msg_dict['time_seconds'] = time.time()
-            msg_dict['time'] = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+            msg_dict['time'] = current_time_str()
 
         if msg_dict:
             msg = [msg_header, msg_dict]
@@ -90,8 +107,13 @@ class SBB:
         if sbb_filename is not None:
             print("Secure bulletin board saved on file:", sbb_filename)
 
-    def hash_sbb(self, public):
-        """ Return a (tweaked) hash of the sbb contents. """
+    def hash_sbb(self, public, stretch=sv.LEGACY_STRETCH):
+        """ Return a (tweaked) hash of the sbb contents.
+
+        The hash is that of the hash suite in use, stretched with the
+        given algorithm and work factor (see sv.stretched_hash) to slow
+        down adversarial attack.
+        """
         board = self.board
         # next is commented out since we have no no-public posting
         # in the current code.
@@ -100,7 +122,7 @@ class SBB:
                 board = [item for item in board if item[0][0] != "("]
         board_str = sv.dumps(board)
         hash_tweak = "hash_sbb"
-        return sv.secure_hash(board_str, hash_tweak, iterate=True)
+        return sv.stretched_hash(board_str, hash_tweak, stretch)
 
 
 
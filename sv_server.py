@@ -12,6 +12,9 @@
 # (See https://github.com/ron-rivest/split-value-voting.git)
 
 import sv
+import sv_comm
+import sv_distributed
+import sv_trace
 
 class Server():
 
@@ -97,8 +100,9 @@ class Server():
                 sdbp['x'] = dict()           # choice x, where x = u+v mod M
                 sdbp['u'] = dict()           # u
                 sdbp['v'] = dict()           # v
-                sdbp['ru'] = dict()          # randomness to open com(u)
-                sdbp['rv'] = dict()          # randomness to open com(v)
+                # seeds (base64), sent by voters, from which randomness to
+                # open com(u) and com(v) is derived (see get_randomizer)
+                sdbp['r_seed'] = dict()
                 # for all columns, have 2m-way replicated data structures
                 for j in range(cols):
                     sdbp = self.sdb[race_id][i][j]
@@ -112,10 +116,17 @@ class Server():
                     sdbp['y'] = dict()
                     sdbp['u'] = dict()
                     sdbp['v'] = dict()
-                    sdbp['ru'] = dict()
-                    sdbp['rv'] = dict()
                     sdbp['cu'] = dict()
                     sdbp['cv'] = dict()
+                    sdbp['r_seed'] = sv.get_random_from_source(
+                        self.sdb[race_id][i][self.cols-1]['rand_name'])
+        # vote-independent material for mix and proof (see precompute)
+        self.max_voters = None
+        self.precomputed = None
+        # server processes, in "distributed" server mode
+        self.array = None
+        self.process_stats = None
+
         # post on log that server array is set up
         election.sbb.post("setup:server-array",
                           {"rows": rows, "cols": cols,
@@ -124,27 +135,97 @@ class Server():
                            'json_indent': election.json_indent},
                           time_stamp=False)
 
-    def mix(self):
-        """ Mix votes.  Information flows left to right. """
+    def get_randomizer(self, race_id, i, p, field, k=None):
+        """ Return randomizer (bytes) for a commitment made in row i.
+
+        With k None, this is for the commitment to field ("ru" for u, or
+        "rv" for v) of input p (in the first column), derived from the
+        seed sent by the voter with the share (see Voter.make_ballot);
+        otherwise it is for the commitment to field of output p of copy k
+        (in the last column), derived from the seed of the server.
+        Randomizers are derived when needed, not stored.
+        """
+        if k is None:
+            seed = sv.base64_2_bytes(self.sdb[race_id][i][0]['r_seed'][p])
+        else:
+            seed = self.sdb[race_id][i][self.cols-1][k]['r_seed']
+        return sv.derive_randomizer(seed, p, field)
+
+    def precompute(self, max_voters):
+        """ Precompute vote-independent material for the mix and proof.
+
+        The permutations and obfuscation values ("fuzz") of each column,
+        and the u values of the split-value pairs for the outputs (last
+        column), do not depend on the votes cast, but only on the races
+        and the number of voters.  They are made here, for each race,
+        column, and copy, ahead of time, given an upper bound max_voters
+        on the number of voters; mix and the prover then only apply them.
+
+        Material is made for max_voters positions, indexed 0, 1, ...;
+        when fewer voters vote, permutations are restricted and the
+        unused positions of other material are ignored.  With max_voters
+        equal to the number of voters, the results are exactly those of
+        making the material when needed.
+
+        The result is saved as self.precomputed[race_id][j][k], a dict with
+            'pi': permutation (list) of range(max_voters)
+            'fuzz': dict mapping row i to list of max_voters fuzz values
+            'u': (for j == cols-1) dict mapping row i to list of
+                 max_voters u values
+        (In "distributed" server mode, the servers are started here, and
+        'pi' and 'fuzz' are instead made and kept by the servers; see
+        sv_distributed.py.)
+        """
         election = self.election
-        # replicate input to become first-column x inputs for each race & pass
-        for race_id in election.race_ids:
-            for k in election.k_list:
-                for i in self.row_list:
-                    x = self.sdb[race_id][i][0]['x']   # dict of n x's
-                    self.sdb[race_id][i][0][k]['x'] = x.copy()
-        # generate permutations (and inverses) used in each column
+        assert isinstance(max_voters, int) and max_voters > 0
+        precomputed = dict()
+        for race in election.races:
+            race_id = race.race_id
+            precomputed[race_id] = dict()
+            for j in range(self.cols):
+                precomputed[race_id][j] = dict()
+                for k in election.k_list:
+                    precomputed[race_id][j][k] = dict()
+        if election.server_mode == "distributed":
+            # servers (each a process) make and keep their own material
+            with sv_trace.span("precompute:start_servers"):
+                self.array = sv_distributed.ServerArray(self)
+            with sv_trace.span("precompute:mix"):
+                self.array.precompute(max_voters)
+        else:
+            with sv_trace.span("precompute:mix"):
+                self.precompute_mix(max_voters, precomputed)
+        with sv_trace.span("precompute:outputs"):
+            self.precompute_outputs(max_voters, precomputed)
+        if sv_comm.comm_parameters['enabled']:
+            # row 'a' of each column sends the others their material
+            for race in election.races:
+                n_bytes = max_voters * \
+                    (sv_comm.index_bytes(max_voters) +
+                     sv_comm.value_bytes(race.race_modulus))
+                for j in range(self.cols):
+                    for i in self.row_list[1:]:
+                        sv_comm.record("precompute",
+                                       sv_comm.server_name('a', j),
+                                       sv_comm.server_name(i, j),
+                                       n_bytes * election.n_reps,
+                                       election.n_reps)
+        self.max_voters = max_voters
+        self.precomputed = precomputed
+
+    def precompute_mix(self, max_voters, precomputed):
+        """ Make permutations and fuzz for mix (see precompute). """
+        election = self.election
+        # generate permutations used in each column
         # in practice, these could be generated by row 0 server
         # and sent securely to the others in the same column.
         for race_id in election.race_ids:
             for j in range(self.cols):
                 rand_name = self.sdb[race_id]['a'][j]['rand_name']
                 for k in election.k_list:
-                    pi = sv.random_permutation(election.p_list, rand_name)
-                    pi_inv = sv.inverse_permutation(pi)
-                    for i in self.row_list:
-                        self.sdb[race_id][i][j][k]['pi'] = pi
-                        self.sdb[race_id][i][j][k]['pi_inv'] = pi_inv
+                    pi = sv.random_permutation(max_voters, rand_name)
+                    precomputed[race_id][j][k]['pi'] = \
+                        [pi[x] for x in range(max_voters)]
         # generate obfuscation values used in each column
         # in practice, these could be generated by row 0 server
         # and sent securely to the others in the same column.
@@ -153,43 +234,150 @@ class Server():
             for j in range(self.cols):
                 rand_name = self.sdb[race_id]['a'][j]['rand_name']
                 for k in election.k_list:
-                    fuzz_dict = dict()      # fuzz_dict[i][pnn]
-                    for i in self.row_list:
-                        fuzz_dict[i] = dict()
-                    for v in election.p_list:
-                        share_list = sv.share(0,
+                    # one sharing of zero per position, all made at once
+                    fuzz_rows = sv.share_many([0] * max_voters,
                                               self.rows,
                                               self.threshold,
                                               rand_name,
                                               race.race_modulus)
-                        for row, i in enumerate(self.row_list):
-                            fuzz_dict[i][v] = share_list[row][1]
+                    precomputed[race_id][j][k]['fuzz'] = \
+                        dict(zip(self.row_list, fuzz_rows))
+
+    def precompute_outputs(self, max_voters, precomputed):
+        """ Make u values of split-value pairs for outputs (see precompute).
+        """
+        election = self.election
+        # (randomness is drawn in the same order as by sv.get_sv_pair
+        # when each output is split in turn, for py, for i)
+        cols = self.cols
+        for race in election.races:
+            race_id = race.race_id
+            for k in election.k_list:
+                u_dict = dict()
+                for i in self.row_list:
+                    u_dict[i] = []
+                for py in range(max_voters):
+                    for i in self.row_list:
+                        rand_name = self.sdb[race_id][i][cols-1]['rand_name']
+                        u = sv.get_random_from_source(rand_name,
+                                                      race.race_modulus)
+                        u_dict[i].append(u)
+                precomputed[race_id][cols-1][k]['u'] = u_dict
+
+    def mix(self):
+        """ Mix votes.  Information flows left to right.
+
+        Uses the material made by precompute (which is called now, with
+        the number of voters as bound, if it has not been called already).
+        """
+        election = self.election
+        n_voters = election.n_voters
+        if self.precomputed is None:
+            self.precompute(n_voters)
+        assert n_voters <= self.max_voters
+        if sv_comm.comm_parameters['enabled']:
+            # each column sends its outputs on to the next column
+            for race in election.races:
+                n_bytes = len(race.p_list) * \
+                    sv_comm.value_bytes(race.race_modulus)
+                for i in self.row_list:
+                    for j in range(self.cols - 1):
+                        sv_comm.record("mix",
+                                       sv_comm.server_name(i, j),
+                                       sv_comm.server_name(i, j+1),
+                                       n_bytes * election.n_reps,
+                                       election.n_reps)
+        if election.server_mode == "distributed":
+            self.mix_distributed()
+            return
+        # replicate input to become first-column x inputs for each race & pass
+        for race_id in election.race_ids:
+            for k in election.k_list:
+                for i in self.row_list:
+                    x = self.sdb[race_id][i][0]['x']   # dict of n x's
+                    self.sdb[race_id][i][0][k]['x'] = x.copy()
+        # apply precomputed permutations (and inverses) and obfuscation
+        # values to the positions p_list of each race
+        for race in election.races:
+            race_id = race.race_id
+            p_list = race.p_list
+            for j in range(self.cols):
+                for k in election.k_list:
+                    pre = self.precomputed[race_id][j][k]
+                    pi_index = sv.restrict_permutation(pre['pi'],
+                                                       len(p_list))
+                    pi = dict()
+                    for x in range(len(p_list)):
+                        pi[p_list[x]] = p_list[pi_index[x]]
+                    pi_inv = sv.inverse_permutation(pi)
                     for i in self.row_list:
                         # note that fuzz_dict[i] is dict of size n
-                        self.sdb[race_id][i][j][k]['fuzz_dict'] = fuzz_dict[i]
+                        fuzz_dict = dict(zip(p_list, pre['fuzz'][i]))
+                        self.sdb[race_id][i][j][k]['pi'] = pi
+                        self.sdb[race_id][i][j][k]['pi_inv'] = pi_inv
+                        self.sdb[race_id][i][j][k]['fuzz_dict'] = fuzz_dict
         # process columns left-to-right, mixing as you go
         for race in self.election.races:
+            for j in range(self.cols):
+                with sv_trace.span("mix:column", race_id=race.race_id, j=j):
+                    self.mix_column(race, j)
+
+    def mix_column(self, race, j):
+        """ Mix column j for race (all copies k and rows i). """
+        election = self.election
+        p_list = race.p_list
+        race_id = race.race_id
+        race_modulus = race.race_modulus
+        for k in election.k_list:
+            for i in self.row_list:
+                # shuffle first
+                pi = self.sdb[race_id][i][j][k]['pi'] # length n
+                # note that pi is independent of i
+                x = self.sdb[race_id][i][j][k]['x']   # length n
+                xp = sv.apply_permutation(pi, x)      # length n
+                # then obfuscate by adding "fuzz"
+                fuzz_dict = self.sdb[race_id][i][j][k]['fuzz_dict']
+                xpo = sv.add_mod([xp[v] for v in p_list],
+                                 [fuzz_dict[v] for v in p_list],
+                                 race_modulus)
+                y = dict(zip(p_list, xpo))
+                self.sdb[race_id][i][j][k]['y'] = y
+                # this column's y's become next column's x's.
+                # in practice would be sent via secure channels
+                if j < self.cols - 1:
+                    self.sdb[race_id][i][j+1][k]['x'] = y
+
+    def mix_distributed(self):
+        """ Mix votes with the servers of the array, each its own process.
+
+        The permutations and last-column outputs are then saved here, as
+        by mix, for the prover; the servers are stopped, and their
+        measurements saved in self.process_stats.
+        """
+        election = self.election
+        (pis, ys) = self.array.mix()
+        for race in election.races:
             race_id = race.race_id
-            race_modulus = race.race_modulus
+            p_list = race.p_list
+            for k in election.k_list:
+                for i in self.row_list:
+                    x = self.sdb[race_id][i][0]['x']
+                    self.sdb[race_id][i][0][k]['x'] = x.copy()
             for j in range(self.cols):
                 for k in election.k_list:
+                    pi = dict()
+                    for x, pi_x in enumerate(pis[race_id][j][k]):
+                        pi[p_list[x]] = p_list[pi_x]
+                    pi_inv = sv.inverse_permutation(pi)
                     for i in self.row_list:
-                        # shuffle first
-                        pi = self.sdb[race_id][i][j][k]['pi'] # length n
-                        # note that pi is independent of i
-                        x = self.sdb[race_id][i][j][k]['x']   # length n
-                        xp = sv.apply_permutation(pi, x)      # length n
-                        # then obfuscate by adding "fuzz"
-                        fuzz_dict = self.sdb[race_id][i][j][k]['fuzz_dict']
-                        xpo = dict()
-                        for v in election.p_list:
-                            xpo[v] = (xp[v] + fuzz_dict[v]) % race_modulus
-                        y = xpo
-                        self.sdb[race_id][i][j][k]['y'] = y
-                        # this column's y's become next column's x's.
-                        # in practice would be sent via secure channels
-                        if j < self.cols - 1:
-                            self.sdb[race_id][i][j+1][k]['x'] = y
+                        self.sdb[race_id][i][j][k]['pi'] = pi
+                        self.sdb[race_id][i][j][k]['pi_inv'] = pi_inv
+            for i in self.row_list:
+                for k in election.k_list:
+                    y = dict(zip(p_list, ys[race_id][i][k]))
+                    self.sdb[race_id][i][self.cols-1][k]['y'] = y
+        self.process_stats = self.array.stop()
+        self.array = None
 
     def test_mix(self):
         """ Test that mixing is giving reasonable results. """
@@ -0,0 +1,187 @@
+# sv_stats.py
+# python3
+
+""" Phase timing and operation counts for simulated election.
+
+    When enabled (set_stats(True)), each phase of an election (see
+    Election.run_election and the prover) and each step of verification
+    (see sv_verifier.verify) records its wall-clock time, its CPU time,
+    and the number of basic operations done during it (see sv.op_counts):
+    calls of secure_hash, random draws, commitments, secrets shared and
+    secrets reconstructed.
+
+    Phases may be nested (e.g. "prove:outcome" within "prove"); each
+    phase is recorded on its own, with its own counts.
+
+    The report (see stats_report) is machine-readable (json), and is
+    written alongside the SBB (python3 sv_main.py --stats writes
+    election_id.stats.json), not in it.  When disabled (and tracing is
+    disabled), a phase costs little more than two dict lookups.
+
+    Memory profiling (set_stats(True, memory=True); python3 sv_main.py
+    --memprofile) also records, for each phase, using tracemalloc:
+        "peak_bytes"        peak memory allocated during the phase
+        "retained_bytes"    memory allocated at the end of the phase
+        "retained_delta_bytes"  change of that over the phase
+        "top_sites"         the MEMORY_TOP_SITES source lines (file:line)
+                            holding the most memory at the end of the
+                            phase (unless disabled; see set_stats)
+    This shows which data structures (the server array sdb, the SBB
+    board, the verifier's sbb and sbb_dict, ...) dominate.  Tracing
+    allocations makes everything several times slower, so times taken
+    with memory profiling are not representative.
+"""
+
+# MIT open-source license.
+# (See https://github.com/ron-rivest/split-value-voting.git)
+
+import contextlib
+import json
+import time
+import tracemalloc
+
+import sv
+import sv_trace
+
+stats_parameters = {'enabled': False,
+                    'memory': False,
+                    'top_sites': True}
+
+MEMORY_TOP_SITES = 5      # allocation sites listed per phase
+
+# list of recorded phases, in order of completion; each is a dict with
+# "phase", "wall_seconds", "cpu_seconds" and "counts" (and memory
+# statistics, if memory profiling)
+phase_log = []
+
+# peaks (bytes) of open phases, innermost last (if memory profiling)
+memory_peaks = []
+
+def set_stats(new_value, memory=False, top_sites=True):
+    """ Enable (True) or disable (False) statistics, clearing the log.
+
+    If memory is True, also profile memory (starting tracemalloc), with
+    top allocation sites if top_sites is True (finding them takes a
+    snapshot at the end of every phase, which is slow).
+    """
+    stats_parameters['enabled'] = bool(new_value)
+    stats_parameters['memory'] = bool(new_value) and bool(memory)
+    stats_parameters['top_sites'] = bool(top_sites)
+    sv.set_op_counting(new_value)
+    del phase_log[:]
+    del memory_peaks[:]
+    if stats_parameters['memory']:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+    elif tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+def memory_start():
+    """ Start memory profiling of a phase; return memory allocated now.
+
+    Since tracemalloc has one peak, it is reset at the start of each
+    phase, after saving it as peak so far of the enclosing phase.
+    """
+    (current, peak) = tracemalloc.get_traced_memory()
+    if memory_peaks:
+        memory_peaks[-1] = max(memory_peaks[-1], peak)
+    tracemalloc.reset_peak()
+    memory_peaks.append(current)
+    return current
+
+def memory_end(current_before):
+    """ End memory profiling of a phase; return its memory statistics.
+
+    The top sites are those source lines whose allocations still held
+    at the end of the phase are largest.  (The snapshot giving them is
+    taken after the memory is measured, so is not counted.)
+    """
+    (current, peak) = tracemalloc.get_traced_memory()
+    peak = max(memory_peaks.pop(), peak)
+    if memory_peaks:
+        memory_peaks[-1] = max(memory_peaks[-1], peak)
+    memory = {"peak_bytes": peak,
+              "retained_bytes": current,
+              "retained_delta_bytes": current - current_before}
+    if not stats_parameters['top_sites']:
+        return memory
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        (tracemalloc.Filter(False, tracemalloc.__file__),
+         tracemalloc.Filter(False, __file__),
+         tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+         tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>")))
+    top_sites = []
+    for stat in snapshot.statistics("lineno")[:MEMORY_TOP_SITES]:
+        frame = stat.traceback[0]
+        top_sites.append({"site": frame.filename + ":" + str(frame.lineno),
+                          "size_bytes": stat.size,
+                          "count": stat.count})
+    memory["top_sites"] = top_sites
+    return memory
+
+@contextlib.contextmanager
+def phase(name):
+    """ Context manager recording time and counts of phase with given name.
+
+    The phase is also a span for the tracer (see sv_trace.py).
+
+    Usage:
+        with sv_stats.phase("mix"):
+            ...
+    """
+    with sv_trace.span(name, "phase"):
+        if not stats_parameters['enabled']:
+            yield
+            return
+        if stats_parameters['memory']:
+            current_before = memory_start()
+        counts_before = sv.get_op_counts()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            cpu_seconds = time.process_time() - cpu_start
+            wall_seconds = time.perf_counter() - wall_start
+            counts = dict()
+            for op, count in sv.get_op_counts().items():
+                if count != counts_before.get(op, 0):
+                    counts[op] = count - counts_before.get(op, 0)
+            record = {"phase": name,
+                      "wall_seconds": wall_seconds,
+                      "cpu_seconds": cpu_seconds,
+                      "counts": counts}
+            if stats_parameters['memory']:
+                record.update(memory_end(current_before))
+            phase_log.append(record)
+
+def stats_report(election_id=None):
+    """ Return report (a dict) of phases recorded so far, and the total
+    operation counts.
+    """
+    return {"election_id": election_id,
+            "phases": list(phase_log),
+            "counts": sv.get_op_counts()}
+
+def write_stats_report(filename, election_id=None):
+    """ Write stats_report (as json) to file with given name. """
+    with open(filename, "w") as file:
+        json.dump(stats_report(election_id), file, indent=1, sort_keys=True)
+
+def print_memory_report(f_out=None):
+    """ Print peak and retained memory of each phase (in order of
+    completion), with its top allocation site.
+    """
+    print("memory by phase (MB):", file=f_out)
+    print("    %-48s %8s %8s %8s" % ("phase", "peak", "retained", "delta"),
+          file=f_out)
+    for record in phase_log:
+        if "peak_bytes" not in record:
+            continue
+        print("    %-48s %8.2f %8.2f %+8.2f" %
+              (record["phase"], record["peak_bytes"] / 1e6,
+               record["retained_bytes"] / 1e6,
+               record["retained_delta_bytes"] / 1e6), file=f_out)
+        for site in record.get("top_sites", [])[:1]:
+            print("        top site: %s (%.2f MB)" %
+                  (site["site"], site["size_bytes"] / 1e6), file=f_out)
@@ -9,14 +9,23 @@
 # MIT open-source license.
 # (See https://github.com/ron-rivest/split-value-voting.git)
 
+import collections
 import sys
 
 import sv
 
+class TallyError(Exception):
+    """ Raised when the mixed votes are inconsistent, so that no tally
+    can be given (see compute_tally).
+    """
+
 def compute_tally(election):
     """ Compute tallies for this election.
 
     Data is from last column of mix servers.
+    Raise TallyError if the copies of a race do not give the same votes,
+    or if the number of entries in a write-in table does not match the
+    number of write-in votes in its parent race.
     """
     server = election.server
     cols = server.cols
@@ -24,34 +33,55 @@ def compute_tally(election):
     for race in election.races:
         race_id = race.race_id
         for k in election.k_list:
-            choice_int_list = []
-            for p in election.p_list:
-                share_list = \
-                    [(row+1, server.sdb[race_id][i][cols-1][k]['y'][p]) \
-                     for row, i in enumerate(election.server.row_list)]
-                choice_int = sv.lagrange(share_list, server.rows,\
-                                         server.threshold, race.race_modulus)
-                choice_int_list.append(choice_int)
-            choice_str_list = [race.choice_int2str(choice_int)
-                               for choice_int in choice_int_list]
-            choice_str_list = sorted(choice_str_list)
+            y_lists = [[server.sdb[race_id][i][cols-1][k]['y'][p]
+                        for p in race.p_list]
+                       for i in election.server.row_list]
+            choice_int_list = sv.lagrange_many(y_lists, server.rows,
+                                               server.threshold,
+                                               race.race_modulus)
+            # all copies must give the same multiset of choices; compare
+            # the counts of each (integer) choice
+            choice_int_counts = collections.Counter(choice_int_list)
             if k == election.k_list[0]:
-                last_choice_str_list = choice_str_list
-            else:
-                assert choice_str_list == last_choice_str_list
+                last_choice_int_counts = choice_int_counts
+            elif choice_int_counts != last_choice_int_counts:
+                raise TallyError("race %s: copy %s gives different votes "
+                                 "than copy %s" %
+                                 (race_id, k, election.k_list[0]))
         # now compute tally for this race
+        # (decoding each distinct choice only once)
         tally = dict()
+        n_write_ins = 0
         for choice_str in race.choices:
             if not all([c == '*' for c in choice_str]):
                 tally[choice_str] = 0
-        for choice_str in choice_str_list:
-            tally[choice_str] = tally.get(choice_str, 0) + 1
+        for choice_int, count in sorted(choice_int_counts.items()):
+            choice_str = race.codec.int2str(choice_int)
+            if race.codec.is_write_in_marker(choice_str):
+                n_write_ins += count  # text of write-in is in write-in table
+                continue
+            tally[choice_str] = tally.get(choice_str, 0) + count
         # save it
         race.tally = tally
+        race.n_write_ins = n_write_ins
         election.tally[race_id] = tally
+    # with compact encoding, add the write-ins from each write-in table
+    # into the tally of its parent race
+    for race in election.races:
+        table = race.write_in_race
+        if table is not None:
+            n_entries = sum(table.tally.values())
+            if n_entries != race.n_write_ins:
+                raise TallyError("race %s: %d write-in votes, but %d "
+                                 "entries in write-in table %s" %
+                                 (race.race_id, race.n_write_ins,
+                                  n_entries, table.race_id))
+            for choice_str, count in table.tally.items():
+                race.tally[choice_str] = race.tally.get(choice_str, 0) + count
 
-def print_tally(election, f_out=sys.stdout):
-    """ Print tallies computed for this election to file f_out.
+def print_tally(election, f_out=None):
+    """ Print tallies computed for this election to file f_out
+    (sys.stdout if None).
 
     Uses results compiled by compute_tally, and saved in race.tally fields.
     """
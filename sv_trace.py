@@ -0,0 +1,181 @@
+# sv_trace.py
+# python3
+
+""" Span tracer for simulated election and its verification.
+
+    When enabled (set_trace(True)), each span (a named stretch of work,
+    such as a phase of the election (see sv_stats.phase), a column of
+    the mix, or a copy mixed by a server process) is recorded with its
+    start time, duration, process and thread, so that one can see which
+    work overlaps, and how busy each worker thread or server process is.
+
+    Usage:
+        with sv_trace.span("mix:column", j=j):
+            ...
+
+    Two outputs are produced from the recorded spans:
+      -- Chrome trace-event json (write_chrome_trace), viewable in
+         chrome://tracing or at https://ui.perfetto.dev ;
+      -- collapsed stacks (write_collapsed_stacks), one line
+             "outer;inner;innermost microseconds"
+         per stack of nested spans, giving the time spent in the
+         innermost span itself (not in spans nested within it); this is
+         the input format of flamegraph.pl and speedscope.
+
+    (python3 sv_main.py --trace writes both, as election_id.trace.json
+    and election_id.collapsed.txt.)
+
+    When disabled, span() returns a shared do-nothing context manager,
+    so a span costs one dict lookup and a function call.
+
+    Spans of the server processes of "distributed" server mode (see
+    sv_distributed.py) are recorded by each process and sent back to
+    the coordinator (see add_events); times are then comparable since
+    time.perf_counter is the system-wide monotonic clock (on Linux).
+"""
+
+# MIT open-source license.
+# (See https://github.com/ron-rivest/split-value-voting.git)
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+trace_parameters = {'enabled': False,
+                    'origin': 0.0,             # perf_counter at time 0
+                    'process_name': "election"}
+
+# list of recorded trace events (dicts in Chrome trace-event format)
+trace_events = []
+
+# collapsed_stacks[stack] = microseconds spent in innermost span itself,
+# where stack is the ";"-separated list of names of nested spans
+collapsed_stacks = dict()
+
+# stacks of open spans, one per thread
+open_spans = threading.local()
+
+# (pid, tid) pairs already named in trace_events
+named_threads = set()
+
+# lock for recording (spans may end in several threads at once)
+trace_lock = threading.Lock()
+
+NULL_SPAN = contextlib.nullcontext()
+
+def set_trace(new_value, origin=None, process_name="election"):
+    """ Enable (True) or disable (False) tracing, clearing the record.
+
+    Times are measured from origin (a time.perf_counter value; now, if
+    not given); spans are shown as those of a process process_name.
+    """
+    trace_parameters['enabled'] = bool(new_value)
+    if origin is None:
+        origin = time.perf_counter()
+    trace_parameters['origin'] = origin
+    trace_parameters['process_name'] = process_name
+    del trace_events[:]
+    collapsed_stacks.clear()
+    named_threads.clear()
+    open_spans.__dict__.clear()
+
+def span(name, category="sv", **args):
+    """ Return context manager recording a span with given name.
+
+    Here category is a Chrome trace-event category, and args (if any)
+    are shown with the span.  (Does nothing if tracing is disabled.)
+    """
+    if not trace_parameters['enabled']:
+        return NULL_SPAN
+    return Span(name, category, args)
+
+class Span:
+    """ A span being recorded (see span). """
+
+    def __init__(self, name, category, args):
+        """ Initialize span (not yet started). """
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = None
+        self.child_seconds = 0.0      # time in spans nested within this
+
+    def __enter__(self):
+        """ Start span, as innermost open span of this thread. """
+        if not hasattr(open_spans, "stack"):
+            open_spans.stack = []
+        open_spans.stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """ End span, and record it. """
+        end = time.perf_counter()
+        seconds = end - self.start
+        stack = open_spans.stack
+        assert stack[-1] is self
+        stack.pop()
+        if stack:
+            stack[-1].child_seconds += seconds
+        pid = os.getpid()
+        tid = threading.get_native_id()
+        event = {"name": self.name, "cat": self.category, "ph": "X",
+                 "ts": (self.start - trace_parameters['origin']) * 1e6,
+                 "dur": seconds * 1e6, "pid": pid, "tid": tid}
+        if self.args:
+            event["args"] = self.args
+        # stack names start with process, and thread unless main thread
+        names = [trace_parameters['process_name']]
+        thread = threading.current_thread()
+        if thread is not threading.main_thread():
+            names.append(thread.name)
+        names.extend([s.name for s in stack])
+        names.append(self.name)
+        key = ";".join(names)
+        with trace_lock:
+            if (pid, tid) not in named_threads:
+                name_thread(pid, tid, thread.name)
+            trace_events.append(event)
+            collapsed_stacks[key] = collapsed_stacks.get(key, 0.0) + \
+                (seconds - self.child_seconds) * 1e6
+        return False
+
+def name_thread(pid, tid, thread_name):
+    """ Add metadata events naming thread tid (and, the first time,
+    process pid).
+    """
+    if not any([pid == p for (p, t) in named_threads]):
+        trace_events.append(
+            {"name": "process_name", "ph": "M", "pid": pid,
+             "args": {"name": trace_parameters['process_name']}})
+    named_threads.add((pid, tid))
+    trace_events.append({"name": "thread_name", "ph": "M", "pid": pid,
+                         "tid": tid, "args": {"name": thread_name}})
+
+def add_events(events, stacks):
+    """ Add trace events and collapsed stacks recorded elsewhere (e.g. by
+    a server process; see trace_record).
+    """
+    trace_events.extend(events)
+    for key, microseconds in stacks.items():
+        collapsed_stacks[key] = collapsed_stacks.get(key, 0.0) + microseconds
+
+def trace_record():
+    """ Return (events, stacks) recorded so far (for add_events). """
+    return (list(trace_events), dict(collapsed_stacks))
+
+def write_chrome_trace(filename):
+    """ Write recorded spans as Chrome trace-event json to file. """
+    with open(filename, "w") as file:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"},
+                  file)
+
+def write_collapsed_stacks(filename):
+    """ Write recorded spans as collapsed stacks (for flamegraphs). """
+    with open(filename, "w") as file:
+        for key in sorted(collapsed_stacks.keys()):
+            microseconds = int(round(collapsed_stacks[key]))
+            if microseconds > 0:
+                file.write("%s %d\n" % (key, microseconds))
@@ -17,9 +17,12 @@
 # MIT open-source license.
 # (See https://github.com/ron-rivest/split-value-voting.git)
 
+import collections
 import json
 
 import sv
+import sv_race
+import sv_stats
 import sys
 
 # headers, in ordered expected in SBB file.
@@ -29,8 +32,8 @@ HEADER_LIST = ['sbb:open',
                'setup:voters',
                'setup:server-array',
                'setup:finished',
-               'casting:votes',
-               'casting:receipts',
+               'casting:ballot',        # (one entry per cast ballot)
+               'casting:closed',
                'tally:results',
                'proof:output_commitments',
                'proof:output_commitment_t_values',
@@ -42,6 +45,12 @@ HEADER_LIST = ['sbb:open',
                'election:done.',
                'sbb:close']
 
+# headers of older SBBs, which posted all cast votes and all receipts in
+# one entry each (see legacy_casting_ballots)
+LEGACY_HEADER_LIST = HEADER_LIST[:HEADER_LIST.index('casting:ballot')] + \
+                     ['casting:votes', 'casting:receipts'] + \
+                     HEADER_LIST[HEADER_LIST.index('casting:closed')+1:]
+
 # attributes expected for each header
 ATTRIBUTES = {'sbb:open': ['election_id', 'time'],
               'setup:start': ['election_id', 'time',
@@ -51,8 +60,8 @@ ATTRIBUTES = {'sbb:open': ['election_id', 'time'],
               'setup:server-array':
                   ['cols', 'rows', 'n_reps', 'threshold', 'json_indent'],
               'setup:finished': ['time'],
-              'casting:votes': ['cast_vote_dict'],
-              'casting:receipts': ['receipt_dict'],
+              'casting:ballot': ['race_id', 'p', 'cast_vote', 'receipt'],
+              'casting:closed': ['n_ballots', 'time'],
               'tally:results': ['election_id', 'tally', 'time'],
               'proof:output_commitments': ['commitments'],
               'proof:output_commitment_t_values': ['t_values'],
@@ -66,10 +75,19 @@ ATTRIBUTES = {'sbb:open': ['election_id', 'time'],
               'sbb:close': ['time']
              }
 
+# attributes that may also appear (they are absent on older SBBs)
+OPTIONAL_ATTRIBUTES = {'setup:start': ['hash_suite'],
+                       'proof:verifier_challenges': ['stretch']}
+
 # 'cheat sheet' on sbb formats:
-# casting:votes['cast_vote_dict'][race_id][p][i]['ballot_id']
-# casting:votes['cast_vote_dict'][race_id][p][i]['cu']
-# casting:votes['cast_vote_dict'][race_id][p][i]['cv']
+# setup:start['hash_suite']
+# casting:ballot['race_id']
+# casting:ballot['p']
+# casting:ballot['cast_vote'][i]['ballot_id']
+# casting:ballot['cast_vote'][i]['cu']
+# casting:ballot['cast_vote'][i]['cv']
+# casting:ballot['receipt']
+# casting:closed['n_ballots']
 # tally:results['election_id']
 # tally:results['tally'][race_id]{choice: cnt}
 # proof:output_commitments['commitments'][race_id][k][p][i]['cu']
@@ -80,6 +98,7 @@ ATTRIBUTES = {'sbb:open': ['election_id', 'time'],
 # proof:verifier_challenges['challenges']['cut']['opl'][...]
 # proof:verifier_challenges['leftright'][race_id]{ px: left or right }
 # proof:verifier_challenges['sbb_hash']
+# proof:verifier_challenges['stretch']{'algorithm': ..., 'work': ...}
 # proof:outcome_check['opened_output_commitments][race_id][k][p][i]['ru']
 # proof:outcome_check['opened_output_commitments][race_id][k][p][i]['rv']
 # proof:outcome_check['opened_output_commitments][race_id][k][p][i]['u']
@@ -119,33 +138,44 @@ def verify(sbb_filename):
 
     assert isinstance(sbb_filename, str) and len(sbb_filename) > 0
 
-    sbb = sv.load(sbb_filename)
+    with sv_stats.phase("verify:load"):
+        sbb = sv.load(sbb_filename)
 
     db = dict()          # master database for storing stuff
 
-    sbb_dict = check_headers(sbb)
-    print_sizes(sbb_dict)
-    check_attributes(sbb_dict)
-    check_monotonic_time(sbb)
-    check_consistent_election_ids(sbb)
-    read_races(sbb_dict, db)
-    read_n_voters(sbb_dict, db)
-    read_rows_cols_n_reps_threshold_indent(sbb_dict, db)
-    read_cast_votes(sbb_dict, db)
-    read_receipts(sbb_dict, db)
-    read_tally(sbb_dict, db)
-    read_output_commitments(sbb_dict, db)
-    read_t_values(sbb_dict, db)
-    read_verifier_challenges(sbb_dict, sbb, db)
-    check_receipts(sbb_dict, db)
-    check_opened_output_commitments(sbb_dict, db)
-    check_opened_output_commitment_tallies(sbb_dict, db)
-    check_input_consistency(sbb_dict, db)
+    with sv_stats.phase("verify:check_headers"):
+        sbb_dict = check_headers(sbb)
+    # remaining steps, each timed (if enabled; see sv_stats.py)
+    steps = [(print_sizes, (sbb_dict,)),
+             (check_attributes, (sbb_dict,)),
+             (check_monotonic_time, (sbb,)),
+             (check_consistent_election_ids, (sbb,)),
+             (read_hash_suite, (sbb_dict, db)),
+             (read_races, (sbb_dict, db)),
+             (read_n_voters, (sbb_dict, db)),
+             (read_rows_cols_n_reps_threshold_indent, (sbb_dict, db)),
+             (read_cast_votes, (sbb_dict, db)),
+             (read_receipts, (sbb_dict, db)),
+             (read_tally, (sbb_dict, db)),
+             (read_output_commitments, (sbb_dict, db)),
+             (read_t_values, (sbb_dict, db)),
+             (read_verifier_challenges, (sbb_dict, sbb, db)),
+             (check_receipts, (sbb_dict, db)),
+             (check_opened_output_commitments, (sbb_dict, db)),
+             (check_opened_output_commitment_tallies, (sbb_dict, db)),
+             (check_input_consistency, (sbb_dict, db))]
+    for (step, args) in steps:
+        with sv_stats.phase("verify:" + step.__name__):
+            step(*args)
     print('all verifications passed; election outcome verified!!')
 
 def check_headers(sbb):
     """ Check that expected headers are present, and return sbb_dict
         mapping headers to dict's.
+
+        (sbb_dict['casting:ballot'] is the list of the dict's of all
+        casting:ballot entries, which must be consecutive.  The casting
+        entries of an older SBB are converted to such a list.)
     """
     header_list = []
     sbb_dict = dict()
@@ -153,27 +183,72 @@ def check_headers(sbb):
         assert isinstance(item, list) and len(item) > 0
         item_header = item[0]
         assert isinstance(item_header, str) and len(item_header) > 0
-        header_list.append(item_header)
         item_dict = item[1]
         assert isdict(item_dict)
+        if item_header == 'casting:ballot':
+            if not header_list or header_list[-1] != item_header:
+                header_list.append(item_header)
+                sbb_dict[item_header] = []
+            sbb_dict[item_header].append(item_dict)
+            continue
+        header_list.append(item_header)
         sbb_dict[item_header] = item_dict
-    assert header_list == HEADER_LIST
+    if header_list == LEGACY_HEADER_LIST:
+        sbb_dict = legacy_casting_ballots(sbb_dict)
+    else:
+        assert header_list == HEADER_LIST
     print('check_headers: passed.')
     return sbb_dict
 
+def legacy_casting_ballots(sbb_dict):
+    """ Return sbb_dict of an older SBB, with its casting:votes and
+        casting:receipts entries replaced by the list of equivalent
+        casting:ballot entries (without casting:closed).
+    """
+    cast_vote_dict = sbb_dict['casting:votes']['cast_vote_dict']
+    receipt_dict = sbb_dict['casting:receipts']['receipt_dict']
+    assert isdict(cast_vote_dict) and isdict(receipt_dict)
+    ballots = []
+    for race_id in sorted(cast_vote_dict.keys()):
+        for p in sorted(cast_vote_dict[race_id].keys()):
+            cast_vote = cast_vote_dict[race_id][p]
+            assert isdict(cast_vote) and len(cast_vote) > 0
+            ballot_id = cast_vote[min(cast_vote.keys())]['ballot_id']
+            assert ballot_id in receipt_dict
+            assert receipt_dict[ballot_id]['race_id'] == race_id
+            ballots.append({'race_id': race_id,
+                            'p': p,
+                            'cast_vote': cast_vote,
+                            'receipt': receipt_dict[ballot_id]['hash']})
+    assert len(ballots) == len(receipt_dict)
+    new_sbb_dict = dict()
+    for item_header in sbb_dict:
+        if item_header == 'casting:votes':
+            new_sbb_dict['casting:ballot'] = ballots
+        elif item_header != 'casting:receipts':
+            new_sbb_dict[item_header] = sbb_dict[item_header]
+    return new_sbb_dict
+
 def print_sizes(sbb_dict):
     """ Debugging tool to understand where sbb size is, mostly. """
     print('print_sizes: (FYI) sizes of components of sbb:')
-    for item_header in HEADER_LIST:
+    for item_header in sbb_dict:
         item_dict = sbb_dict[item_header]
         item_dict_str = json.dumps(item_dict, sort_keys=True, indent=2)
         print('   ', '%11d'%len(item_dict_str), item_header)
 
 def check_attributes(sbb_dict):
-    """ Check that each item in sbb has precisely expected attributes. """
+    """ Check that each item in sbb has precisely expected attributes
+        (allowing for optional attributes).
+    """
     for item_header in sbb_dict.keys():
-        item_dict = sbb_dict[item_header]
-        assert has_keys(item_dict, ATTRIBUTES[item_header]), item_header
+        item_dicts = sbb_dict[item_header]
+        if item_header != 'casting:ballot':
+            item_dicts = [item_dicts]
+        for item_dict in item_dicts:
+            keys = set(item_dict.keys())
+            keys = keys - set(OPTIONAL_ATTRIBUTES.get(item_header, []))
+            assert keys == set(ATTRIBUTES[item_header]), item_header
     print('check_attributes: passed.')
 
 def check_monotonic_time(sbb):
@@ -201,14 +276,46 @@ def check_consistent_election_ids(sbb):
     assert election_id
     print('check_consistent_election_ids: passed.')
 
+def read_hash_suite(sbb_dict, db):
+    """ Read hash suite from setup:start, and use it from now on.
+
+    SBBs without a hash suite use the original "sha256" suite.
+    """
+    hash_suite = sbb_dict['setup:start'].get('hash_suite', 'sha256')
+    assert hash_suite in sv.HASH_SUITES
+    sv.set_hash_suite(hash_suite)
+    db['hash_suite'] = hash_suite
+    print('read_hash_suite: successful.')
+
+# attributes allowed for each race in setup:races (beyond choices and
+# race_modulus, these appear only with "compact" choice encoding)
+RACE_ATTRIBUTES = ['choices', 'race_modulus',
+                   'choice_encoding', 'write_in_race', 'write_in_for']
+
 def read_races(sbb_dict, db):
     """ Read races item and gather info into db """
     races = sbb_dict['setup:races']['ballot_style_race_dict']
     for race_id in sbb_dict['setup:races']['ballot_style_race_dict']:
         race_dict = sbb_dict['setup:races']['ballot_style_race_dict'][race_id]
-        assert has_keys(race_dict, ['choices', 'race_modulus'])
+        keys = set(race_dict.keys())
+        assert keys.issuperset(['choices', 'race_modulus'])
+        assert keys.issubset(RACE_ATTRIBUTES)
+        assert race_dict.get('choice_encoding', 'bytes') in \
+            ['bytes', 'compact']
+        if 'write_in_race' in race_dict:
+            assert race_dict['choice_encoding'] == 'compact'
+            table_id = race_dict['write_in_race']
+            assert races[table_id]['write_in_for'] == race_id
+        if 'write_in_for' in race_dict:
+            parent_id = race_dict['write_in_for']
+            assert races[parent_id]['write_in_race'] == race_id
     db['races'] = races
     db['race_ids'] = races.keys()
+    # codecs convert between choices and their integer representations
+    db['codecs'] = dict()
+    for race_id in races:
+        db['codecs'][race_id] = \
+            sv_race.RaceCodec.from_race_dict(races[race_id])
     print('read_races: successful.')
 
 def read_n_voters(sbb_dict, db):
@@ -249,19 +356,44 @@ def read_rows_cols_n_reps_threshold_indent(sbb_dict, db):
     print('read_rows_cols_n_reps_threshold: successful.')
 
 def read_cast_votes(sbb_dict, db):
-    """ Read casting:votes for cast votes and extract them into db.
+    """ Read casting:ballot entries for cast votes and receipts, and
+        extract them into db.
 
-        Assumes that every voter votes in every race (could be weakened).
+        Every voter votes in every race, except in a write-in table,
+        where only voters writing in a choice have a ballot.  The
+        positions with a ballot in each race (in p_list order) are
+        saved as db['race_p_lists'].
     """
-    cast_vote_dict = sbb_dict['casting:votes']['cast_vote_dict']
-    assert isdict(db['races'], cast_vote_dict.keys())
+    cast_vote_dict = dict([(race_id, dict()) for race_id in db['race_ids']])
+    receipts = dict()
+    p_set = set(db['p_list'])
+    for entry in sbb_dict['casting:ballot']:
+        race_id = entry['race_id']
+        p = entry['p']
+        assert race_id in cast_vote_dict
+        assert p in p_set
+        assert p not in cast_vote_dict[race_id]
+        cast_vote = entry['cast_vote']
+        assert isdict(cast_vote, db['row_list'])
+        cast_vote_dict[race_id][p] = cast_vote
+        ballot_id = cast_vote[db['row_list'][0]].get('ballot_id')
+        assert ballot_id not in receipts
+        receipts[ballot_id] = {'race_id': race_id,
+                               'hash': entry['receipt']}
+    if 'casting:closed' in sbb_dict:
+        n_ballots = sbb_dict['casting:closed']['n_ballots']
+        assert n_ballots == len(sbb_dict['casting:ballot'])
     ballot_id_dict = dict()
     ballot_id_list = list()
+    race_p_lists = dict()
     for race_id in db['race_ids']:
         ballot_id_dict[race_id] = []
         cast_vote_race = cast_vote_dict[race_id]
         assert isdict(cast_vote_race)
-        assert len(cast_vote_race) == db['n_voters']
+        if 'write_in_for' not in db['races'][race_id]:
+            assert len(cast_vote_race) == db['n_voters']
+        race_p_lists[race_id] = [p for p in db['p_list']
+                                 if p in cast_vote_race]
         for p in cast_vote_race.keys():
             cast_vote_race_p = cast_vote_race[p]
             assert isdict(cast_vote_race_p, db['row_list'])
@@ -282,11 +414,12 @@ def read_cast_votes(sbb_dict, db):
     assert len(set(ballot_id_list)) == len(ballot_id_list)
     db['ballot_id_dict'] = ballot_id_dict
     db['cast_vote_dict'] = cast_vote_dict
+    db['race_p_lists'] = race_p_lists
+    db['receipts'] = receipts
     print('read_cast_votes: successful.')
 
 def read_receipts(sbb_dict, db):
-    """ Read receipts from casting:receipts. """
-    db['receipts'] = sbb_dict['casting:receipts']['receipt_dict']
+    """ Check receipts read from casting:ballot entries. """
     for ballot_id in db['receipts']:
         race_id = db['receipts'][ballot_id]['race_id']
         assert ballot_id in db['ballot_id_dict'][race_id]
@@ -303,7 +436,7 @@ def read_receipts(sbb_dict, db):
 def check_receipts(sbb_dict, db):
     """ Check that receipts are consistent with cast vote commitments. """
     receipt_ballot_ids = set(db['receipts'].keys())
-    cast_vote_dict = sbb_dict['casting:votes']['cast_vote_dict']
+    cast_vote_dict = db['cast_vote_dict']
     for race_id in cast_vote_dict:
         for p in cast_vote_dict[race_id]:
             d = dict()
@@ -325,7 +458,9 @@ def read_tally(sbb_dict, db):
     tally = sbb_dict['tally:results']['tally']
     assert isdict(tally, db['races'])
     for race_id in tally.keys():
-        assert len(tally[race_id]) > 0
+        # (a write-in table is empty if there were no write-ins)
+        assert len(tally[race_id]) > 0 or \
+            'write_in_for' in db['races'][race_id]
         for key in tally[race_id]:
             assert isinstance(key, str)
             assert isinstance(tally[race_id][key], int)
@@ -340,9 +475,10 @@ def read_output_commitments(sbb_dict, db):
     assert isdict(coms, db['race_ids'])
     for race_id in db['race_ids']:
         assert isdict(coms[race_id], db['k_list'])
+        p_list = db['race_p_lists'][race_id]
         for k in db['k_list']:
-            assert isdict(coms[race_id][k], db['p_list'])
-            for p in db['p_list']:
+            assert isdict(coms[race_id][k], p_list)
+            for p in p_list:
                 assert isdict(coms[race_id][k][p], db['row_list'])
                 for i in db['row_list']:
                     assert isdict(coms[race_id][k][p][i], ['cu', 'cv'])
@@ -361,9 +497,10 @@ def read_t_values(sbb_dict, db):
     assert isdict(ts, db['race_ids'])
     for race_id in db['race_ids']:
         assert isdict(ts[race_id], db['k_list'])
+        p_list = db['race_p_lists'][race_id]
         for k in db['k_list']:
-            assert isdict(ts[race_id][k], db['p_list'])
-            for p in db['p_list']:
+            assert isdict(ts[race_id][k], p_list)
+            for p in p_list:
                 assert isdict(ts[race_id][k][p], db['row_list'])
                 for i in db['row_list']:
                     assert isdict(ts[race_id][k][p][i], ['tu', 'tv'])
@@ -397,8 +534,8 @@ def read_verifier_challenges(sbb_dict, sbb, db):
     assert isdict(leftright, db['race_ids'])
     for race_id in leftright.keys():
         lr_dict = leftright[race_id]
-        assert set(lr_dict.keys()) == set(db['p_list'])
-        for p in db['p_list']:
+        assert set(lr_dict.keys()) == set(db['race_p_lists'][race_id])
+        for p in db['race_p_lists'][race_id]:
             lr = lr_dict[p]
             assert lr == 'left' or lr == 'right'
     db['leftright'] = leftright
@@ -407,7 +544,18 @@ def read_verifier_challenges(sbb_dict, sbb, db):
     rand_name = 'verifier_challenges'
     sbb_hash = sbb_dict['proof:verifier_challenges']['sbb_hash']
     stop_before_header = 'proof:verifier_challenges'
-    sbb_hash2 = sv.bytes2hex(hash_sbb(sbb, stop_before_header))
+    # SBBs without a posted stretch algorithm used the legacy one
+    stretch = sbb_dict['proof:verifier_challenges'].get('stretch',
+                                                        sv.LEGACY_STRETCH)
+    assert isdict(stretch, ['algorithm', 'work'])
+    assert stretch['algorithm'] in sv.STRETCH_ALGORITHMS
+    # the algorithm must use the hash of the hash suite of the election
+    (method, suite_name) = sv.STRETCH_ALGORITHMS[stretch['algorithm']]
+    assert suite_name == db['hash_suite']
+    # don't accept less work than honest parties do
+    assert isinstance(stretch['work'], int) and \
+        stretch['work'] >= sv.HASH_ITERATE_COUNT
+    sbb_hash2 = sv.bytes2hex(hash_sbb(sbb, stop_before_header, stretch))
     assert sbb_hash2 == sbb_hash
     sv.init_randomness_source(rand_name, sv.hex2bytes(sbb_hash))
     pi = sv.random_permutation(db['n_reps'], rand_name)
@@ -422,9 +570,10 @@ def read_verifier_challenges(sbb_dict, sbb, db):
     print('read_verifier_challenges: successful.')
 
 def make_left_right_challenges(rand_name, db):
-    """ make dict with a list of n_voters left/right challenges for each race.
+    """ make dict with a left/right challenge for each position of each race.
 
-    Result per race is a list of left/right values of length n_voters.
+    Result per race is a dict of left/right values, one for each position
+    in the race (see read_cast_votes).
     (This routine copied from sv_prover.py.)
     This is recomputed here to check consistency with hash of sbb.
     """
@@ -433,7 +582,7 @@ def make_left_right_challenges(rand_name, db):
     # (sorting is also done is sv_prover.py)
     for race_id in sorted(db['races']):
         leftright = dict()
-        for p in db['p_list']:
+        for p in db['race_p_lists'][race_id]:
             leftright[p] = 'left'\
                            if bool(sv.get_random_from_source(rand_name,
                                                              modulus=2))\
@@ -441,10 +590,11 @@ def make_left_right_challenges(rand_name, db):
         leftright_dict[race_id] = leftright
     return leftright_dict
 
-def hash_sbb(sbb, stop_before_header):
+def hash_sbb(sbb, stop_before_header, stretch=sv.LEGACY_STRETCH):
     """ Return a (tweaked) hash of the sbb contents, including
         all items up to (but not including) the item with header
         equal to stop_before_header. (Copied from sv_prover.py)
+        The hash is stretched as given by stretch (see sv.stretched_hash).
     """
     sbb_trunc = []
     for item in sbb:
@@ -454,10 +604,10 @@ def hash_sbb(sbb, stop_before_header):
             sbb_trunc.append(item)
     sbb_trunc_str = sv.dumps(sbb_trunc)
     hash_tweak = "hash_sbb"
-    # use iterated hashing to slow down adversarial attack
-    return sv.secure_hash(sbb_trunc_str,
-                          hash_tweak,
-                          iterate=True)
+    # use stretched hashing to slow down adversarial attack
+    return sv.stretched_hash(sbb_trunc_str,
+                             hash_tweak,
+                             stretch)
 
 def check_opened_output_commitments(sbb_dict, db):
     """ Check that opened output commitments open correctly.
@@ -468,9 +618,13 @@ def check_opened_output_commitments(sbb_dict, db):
     assert isdict(coms, db['race_ids'])
     for race_id in db['race_ids']:
         assert isdict(coms[race_id], db['opl'])
+        p_list = db['race_p_lists'][race_id]
         for k in db['opl']:
-            assert isdict(coms[race_id][k], db['p_list'])
-            for p in db['p_list']:
+            assert isdict(coms[race_id][k], p_list)
+            c_list = []          # commitments, and their openings
+            value_list = []
+            r_list = []
+            for p in p_list:
                 assert isdict(coms[race_id][k][p], db['row_list'])
                 for i in db['row_list']:
                     assert isdict(coms[race_id][k][p][i],
@@ -493,10 +647,25 @@ def check_opened_output_commitments(sbb_dict, db):
                          ['commitments'][race_id][k][p][i]['cu']
                     cv = sbb_dict['proof:output_commitments']\
                          ['commitments'][race_id][k][p][i]['cv']
-                    assert cu == sv.com(u, ru)
-                    assert cv == sv.com(v, rv)
+                    c_list.extend([cu, cv])
+                    value_list.extend([u, v])
+                    r_list.extend([ru, rv])
+            check_commitments(c_list, value_list, r_list)
     print('check_opened_output_commitments: passed.')
 
+def check_commitments(c_list, value_list, r_list):
+    """ Check that each commitment in c_list opens to the value in
+        value_list with the randomness in r_list (at the same index).
+
+        Commitments and randomness are in base64, as on the SBB.
+    """
+    assert len(c_list) == len(value_list) == len(r_list)
+    r_len = (sv.SECPARAM_SYMMETRIC // 6) + 2
+    assert all([isinstance(r, str) and len(r) == r_len for r in r_list])
+    r_bytes_list = [sv.base64_2_bytes(r) for r in r_list]
+    coms = sv.com_batch(value_list, r_bytes_list)
+    assert c_list == [sv.bytes2base64(c) for c in coms]
+
 def check_opened_output_commitment_tallies(sbb_dict, db):
     """ Check that for each k, the opened output commitments lagranage
         and tally to values given in tally.
@@ -507,29 +676,43 @@ def check_opened_output_commitment_tallies(sbb_dict, db):
     for k in db['opl']:
         # verify tally for this pass/copy k
         tally_k = dict()
+        n_write_ins = dict()
         for race_id in db['race_ids']:
+            codec = db['codecs'][race_id]
             tally_k[race_id] = dict()  # choices to counts
+            n_write_ins[race_id] = 0
             for choice in sbb_dict['setup:races']\
                 ['ballot_style_race_dict'][race_id]['choices']:
                 if choice[0] != '*':
                     tally_k[race_id][choice] = 0
-            for p in db['p_list']:
-                share_list = []
-                for i_int, i in enumerate(db['row_list']):
-                    y = opened_coms[race_id][k][p][i]['y']
-                    share_list.append((i_int+1, y))
-                w = sv.lagrange(share_list,
-                                db['rows'],
-                                db['threshold'],
-                                db['races'][race_id]['race_modulus'])
+            y_lists = [[opened_coms[race_id][k][p][i]['y']
+                        for p in db['race_p_lists'][race_id]]
+                       for i in db['row_list']]
+            w_list = sv.lagrange_many(y_lists,
+                                      db['rows'],
+                                      db['threshold'],
+                                      db['races'][race_id]['race_modulus'])
+            for w, w_count in collections.Counter(w_list).items():
                 # convert w back to string version of choice
-                # see sv_race.choice_int2str
-                choice_bytes = sv.int2bytes(w)
-                choice_str = choice_bytes.decode()
-                # assert self.is_valid_choice(choice_str)
-                # print(race_id, k, iy, choice_str)
+                # (codec checks that choice_str is valid for the race)
+                choice_str = codec.int2str(w)
+                if codec.is_write_in_marker(choice_str):
+                    n_write_ins[race_id] += w_count
+                    continue      # text of write-in is in write-in table
                 cnt = tally_k[race_id].get(choice_str, 0)
-                tally_k[race_id][choice_str] = cnt + 1
+                tally_k[race_id][choice_str] = cnt + w_count
+        # add write-ins from each write-in table into its parent's tally
+        for race_id in db['race_ids']:
+            if 'write_in_race' in db['races'][race_id]:
+                table_id = db['races'][race_id]['write_in_race']
+                table_tally = tally_k[table_id]
+                assert sum(table_tally.values()) == n_write_ins[race_id], \
+                    "write-in table %s does not match write-in votes of " \
+                    "race %s (copy %s)" % (table_id, race_id, k)
+                for choice_str in table_tally:
+                    cnt = tally_k[race_id].get(choice_str, 0)
+                    tally_k[race_id][choice_str] = \
+                        cnt + table_tally[choice_str]
         assert tally_k == db['tally']
     print('check_opened_output_commitment_tallies: passed.')
 
@@ -551,9 +734,10 @@ def check_input_consistency_pik(sbb_dict, db):
     for race_id in db['race_ids']:
         assert isdict(pd[race_id], db['icl'])
         for k in db['icl']:
-            assert isdict(pd[race_id][k], db['p_list'])
-            p_list = set(db['p_list'])
-            for p in db['p_list']:
+            race_p_list = db['race_p_lists'][race_id]
+            assert isdict(pd[race_id][k], race_p_list)
+            p_list = set(race_p_list)
+            for p in race_p_list:
                 assert pd[race_id][k][p] in p_list
                 p_list.remove(pd[race_id][k][p])
     print('check_input_consistency_pik: passed.')
@@ -564,22 +748,28 @@ def check_input_consistency_input_openings(sbb_dict, db):
     """
     oc = sbb_dict['proof:input_consistency:input_openings']\
                  ['opened_commitments']
-    cv = sbb_dict['casting:votes']['cast_vote_dict']
+    cv = db['cast_vote_dict']
     for race_id in db['races']:
         ocr = oc[race_id]
         cvr = cv[race_id]
-        for p in db['p_list']:
+        c_list = []
+        value_list = []
+        r_list = []
+        for p in db['race_p_lists'][race_id]:
             ocrp = ocr[p]
             cvrp = cvr[p]
             for i in db['row_list']:
                 ocrpi = ocrp[i]
                 cvrpi = cvrp[i]
                 if 'u' in ocrpi:
-                    assert cvrpi['cu'] == sv.com(ocrpi['u'],
-                                                 ocrpi['ru'])
+                    c_list.append(cvrpi['cu'])
+                    value_list.append(ocrpi['u'])
+                    r_list.append(ocrpi['ru'])
                 else:
-                    assert cvrpi['cv'] == sv.com(ocrpi['v'],
-                                                 ocrpi['rv'])
+                    c_list.append(cvrpi['cv'])
+                    value_list.append(ocrpi['v'])
+                    r_list.append(ocrpi['rv'])
+        check_commitments(c_list, value_list, r_list)
     print('check_input_consistency_input_openings: passed.')
 
 def check_input_consistency_output_openings(sbb_dict, db):
@@ -595,18 +785,24 @@ def check_input_consistency_output_openings(sbb_dict, db):
         for k in db['icl']:
             ooocrk = ooocr[k]
             occrk = occr[k]
-            for p in db['p_list']:
+            c_list = []
+            value_list = []
+            r_list = []
+            for p in db['race_p_lists'][race_id]:
                 ooocrkp = ooocrk[p]
                 occrkp = occrk[p]
                 for i in db['row_list']:
                     ooocrkpi = ooocrkp[i]
                     occrkpi = occrkp[i]
                     if 'u' in ooocrkpi:
-                        assert occrkpi['cu'] == sv.com(ooocrkpi['u'],
-                                                       ooocrkpi['ru'])
+                        c_list.append(occrkpi['cu'])
+                        value_list.append(ooocrkpi['u'])
+                        r_list.append(ooocrkpi['ru'])
                     else:
-                        assert occrkpi['cv'] == sv.com(ooocrkpi['v'],
-                                                       ooocrkpi['rv'])
+                        c_list.append(occrkpi['cv'])
+                        value_list.append(ooocrkpi['v'])
+                        r_list.append(ooocrkpi['rv'])
+            check_commitments(c_list, value_list, r_list)
     print('check_input_consistency_output_openings: passed.')
 
 def check_input_consistency_t_values(sbb_dict, db):
@@ -630,11 +826,11 @@ def check_input_consistency_t_values(sbb_dict, db):
                    ['opened_commitments'][race_id][k]
             #  icom maps p, i to {"ru":.., "u":..} or {"rv":.., "v":..}
             #  ocom maps p, i to {"ru":.., "u":..} or {"rv":.., "v":..}
-            for py in db['p_list']:
+            tu_lists = [[] for i in db['row_list']]
+            tv_lists = [[] for i in db['row_list']]
+            for py in db['race_p_lists'][race_id]:
                 px = pik[py]
-                tu_list = []
-                tv_list = []
-                for i in db['row_list']:
+                for row, i in enumerate(db['row_list']):
                     icompi = icom[px][i]
                     ocompi = ocom[py][i]
                     assert set(icompi.keys()) == set(ocompi.keys())
@@ -652,16 +848,20 @@ def check_input_consistency_t_values(sbb_dict, db):
                         ouv = ocompi['v']
                         tuv = t_value_dict['tv']
                     assert tuv == (ouv-iuv) % race_modulus
-                    tu_list.append(t_value_dict['tu'])
-                    tv_list.append(t_value_dict['tv'])
-                # check that tu_list and tv_list lagrange to (t, -t)
-                tu_list = list(enumerate(tu_list, 1))
-                tu0 = sv.lagrange(tu_list, db['rows'], db['threshold'],
-                                  race_modulus)
-                tv_list = list(enumerate(tv_list, 1))
-                tv0 = sv.lagrange(tv_list, db['rows'], db['threshold'],
-                                  race_modulus)
-                assert ((tu0 + tv0) % race_modulus) == 0
+                    # the t-value of the half not opened is checked only
+                    # by the lagrange below, so check its range here
+                    for t_value in t_value_dict.values():
+                        assert isinstance(t_value, int) and \
+                            0 <= t_value < race_modulus
+                    tu_lists[row].append(t_value_dict['tu'])
+                    tv_lists[row].append(t_value_dict['tv'])
+            # check that tu_lists and tv_lists lagrange to (t, -t)
+            tu0_list = sv.lagrange_many(tu_lists, db['rows'], db['threshold'],
+                                        race_modulus)
+            tv0_list = sv.lagrange_many(tv_lists, db['rows'], db['threshold'],
+                                        race_modulus)
+            assert sv.add_mod(tu0_list, tv0_list, race_modulus) == \
+                [0] * len(db['race_p_lists'][race_id])
     print('check_input_consistency_t_values: passed.')
 
 
@@ -39,61 +39,101 @@ class Voter:
 
         Of course, in a real election, choices come from voter via tablet.
         """
+        for (vote_race, choice_str) in self.vote_choices(race):
+            self.cast_choice(vote_race, choice_str)
 
-        election = self.election
-        cvs = election.cast_votes
-        race_id = race.race_id
-        race_modulus = race.race_modulus
-        rand_name = self.rand_name
-        px = self.px
-
-        # cast random vote (for this simulation, it's random)
-        choice_str = race.random_choice()            # returns a string
-        choice_int = race.choice_str2int(choice_str) # convert to integer
+    def vote_choices(self, race, choice_str=None):
+        """ Return list of (race, choice_str) pairs to cast for this race.
 
-        # ballot_id is random hex string of desired length
-        ballot_id_len = election.ballot_id_len
-        ballot_id = sv.bytes2hex(sv.get_random_from_source(rand_name))
-        ballot_id = ballot_id[:ballot_id_len]
-        assert len(ballot_id) == election.ballot_id_len
-
-        # secret-share choice
-        n = election.server.rows
-        t = election.server.threshold
-        share_list = sv.share(choice_int, n, t, rand_name, race_modulus)
-
-        # double-check that shares reconstruct to desired choice
-        assert choice_int == sv.lagrange(share_list, n, t, race_modulus)
-        # double-check that shares are have indices 1, 2, ..., n
-        assert all([share_list[i][0] == i+1 for i in range(n)])
-        # then strip off indices, since they are equal to row number + 1
-        share_list = [share[1] for share in share_list]
-
-        # save ballots on election data structure
-        for row, x in enumerate(share_list):
-            (u, v) = sv.get_sv_pair(x, rand_name, race_modulus)
-            ru = sv.bytes2base64(sv.get_random_from_source(rand_name))
-            rv = sv.bytes2base64(sv.get_random_from_source(rand_name))
-            cu = sv.com(u, ru)
-            cv = sv.com(v, rv)
-            i = election.server.row_list[row]
-            vote = {"ballot_id": ballot_id, "x": x, "u": u, "v": v,
-                    "ru": ru, "rv": rv, "cu": cu, "cv": cv}
-            cvs[race_id][px][i] = vote
-
-        # compute voter receipt as hash of her ballot_id and commitments
-        # note that voter gets a receipt for each race she votes in
-        receipt_data = [ballot_id]
-        d = dict()
-        for i in election.server.row_list:
-            cu = cvs[race_id][px][i]['cu']
-            cv = cvs[race_id][px][i]['cv']
-            d[i] = {'cu': cu, 'cv': cv}
-        receipt_data.append(d)
-        receipt_data_str = sv.dumps(receipt_data)
-        receipt_hash = sv.bytes2base64(sv.secure_hash(receipt_data_str))
-        self.receipts[ballot_id] = {'race_id': race_id,
+        The choice is choice_str if given, else random (for this
+        simulation).  With compact encoding, the text of a write-in is
+        also cast, in the race's write-in table.
+        """
+        if choice_str is None:
+            choice_str = race.random_choice()        # returns a string
+        assert race.is_valid_choice(choice_str)
+        choices = [(race, choice_str)]
+        if race.write_in_race is not None and \
+                choice_str not in race.choices:
+            choices.append((race.write_in_race, choice_str))
+        return choices
+
+    def cast_choice(self, race, choice_str):
+        """ Cast vote for choice_str (a string) for this voter in this race. """
+        ballot = self.make_ballot(race, choice_str)
+        receipt_hash = self.election.ingest_ballot(race.race_id, self.px,
+                                                   ballot)
+        self.save_receipt(race, ballot, receipt_hash)
+
+    def save_receipt(self, race, ballot, receipt_hash):
+        """ Save receipt (hash) returned for ballot cast in race. """
+        ballot_id = ballot[self.election.server.row_list[0]]['ballot_id']
+        self.receipts[ballot_id] = {'race_id': race.race_id,
                                     'hash': receipt_hash}
 
+    def make_ballot(self, race, choice_str):
+        """ Return ballot for choice_str (a string) in this race.
 
-
+        The ballot is a dict mapping each row i of the server array to
+        the share of the vote to be sent to it (see Election.ingest_ballot).
+        """
+        election = self.election
+        choice_int = race.choice_str2int(choice_str) # convert to integer
+        return make_ballot(self.rand_name, self.px, choice_int,
+                           race.race_modulus, election.server.row_list,
+                           election.server.threshold,
+                           election.ballot_id_len)
+
+def make_ballot(rand_name, px, choice_int, race_modulus, row_list,
+                threshold, ballot_id_len):
+    """ Return ballot for choice_int (an integer modulo race_modulus), at
+    position px, using randomness source rand_name (see Voter.make_ballot).
+
+    Here row_list and threshold are those of the server array, and
+    ballot_id_len is the length of a ballot_id.  (This needs no Election,
+    so a tablet process can make ballots; see sv_intake.py.)
+    """
+
+    # ballot_id is random hex string of desired length
+    ballot_id = sv.bytes2hex(sv.get_random_from_source(rand_name))
+    ballot_id = ballot_id[:ballot_id_len]
+    assert len(ballot_id) == ballot_id_len
+
+    # secret-share choice
+    n = len(row_list)
+    t = threshold
+    share_list = sv.share(choice_int, n, t, rand_name, race_modulus)
+
+    # double-check that shares reconstruct to desired choice
+    assert choice_int == sv.lagrange(share_list, n, t, race_modulus)
+    # double-check that shares are have indices 1, 2, ..., n
+    assert all([share_list[i][0] == i+1 for i in range(n)])
+    # then strip off indices, since they are equal to row number + 1
+    share_list = [share[1] for share in share_list]
+
+    # split shares and commit to the split values
+    # (randomness for the commitments to a share is derived from a
+    # fresh seed, sent with the share to the server that receives it,
+    # which can then open the commitments; see Server.get_randomizer)
+    uv_list = []
+    r_list = []
+    r_seed_list = []
+    for x in share_list:
+        (u, v) = sv.get_sv_pair(x, rand_name, race_modulus)
+        r_seed = sv.get_random_from_source(rand_name)
+        ru = sv.derive_randomizer(r_seed, px, "ru")
+        rv = sv.derive_randomizer(r_seed, px, "rv")
+        uv_list.extend([u, v])
+        r_list.extend([ru, rv])
+        r_seed_list.append(sv.bytes2base64(r_seed))
+    c_list = sv.com_batch(uv_list, r_list)
+
+    # one share (with its commitments) per row
+    ballot = dict()
+    for row, x in enumerate(share_list):
+        i = row_list[row]
+        (u, v) = uv_list[2*row:2*row+2]
+        (cu, cv) = [sv.bytes2base64(c) for c in c_list[2*row:2*row+2]]
+        ballot[i] = {"ballot_id": ballot_id, "x": x, "u": u, "v": v,
+                     "r_seed": r_seed_list[row], "cu": cu, "cv": cv}
+    return ballot